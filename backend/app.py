@@ -1,16 +1,49 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import pandas as pd
 import io
+import os
 import json
 import random
-from src.main import get_data_mapping
+from src.main import get_score_tensor, get_local_score_tensor, refine_score_tensor
+from src.utils.score_tensor import rank_across
 from concurrent.futures import ProcessPoolExecutor
 from itertools import product
 import multiprocessing
+import threading
+from src.config import MAX_CONCURRENT_MAPPINGS, MAPPING_SLOT_WAIT, DEFAULT_TOP_K, MAPPINGS_PAGE_SIZE, MAPPINGS_MAX_PAGE_SIZE
+from src.utils.llm_scheduler import SchedulerBusy, INTERACTIVE, BULK
+from src.utils.request_context import (
+    llm_priority, request_id, new_request_id, iterate_in_context,
+    stage_stats, record_stage, bind_thread, unbind_thread,
+)
+from src.utils.profiling import SamplingProfiler, should_profile
+from src.utils.column_profiler import profile_csv, profile_to_fields
+from src.utils.mapping_index import MappingIndex, INDEXED_FIELDS
+from src.utils.http_compression import compress_response, content_etag
+from src.utils.work_scheduler import pools
+from src.utils.deadline import deadline, set_budget, budget_from_request, wait_until_deadline, DeadlineExceeded
+from src.utils.helper import lexicon
+from src.utils.field_catalog import FieldCatalog, CATALOG_FIELDS, match_catalog
+from src.config import CATALOG_MATCH_TOP_K
+from src.config import DEADLINE_GRACE
 app = Flask(__name__)
+# Size torch / BLAS thread pools to the CPU budget left by the work lanes; gunicorn
+# workers do this in post_fork with their share of the cores (see gunicorn.conf.py)
+if "gunicorn" not in os.environ.get("SERVER_SOFTWARE", ""):
+    native_threads = pools.configure()
+    print(f"✅ Work lanes {pools.sizes}, native threads {native_threads}")
+mapping_slots = threading.BoundedSemaphore(MAX_CONCURRENT_MAPPINGS)
+# Registered message schemas with precomputed field features (data/catalog)
+catalog = FieldCatalog()
 
 CORS(app, resources={r"/api/*": {"origins": "http://localhost:8080"}})
+
+
+@app.after_request
+def _compress(response):
+    # gzip / brotli per Accept-Encoding; small bodies are left uncompressed
+    return compress_response(response, request)
 # -------------------------------------------------------------
 # Utility: Convert CSV to JSON
 # -------------------------------------------------------------
@@ -30,6 +63,28 @@ def csv_to_json(file):
     return result
 
 
+def records_to_json(file):
+    """
+    Profile a sample data extract (one column per field, any number of rows) in
+    bounded memory and return {column: representative example value}.
+    """
+    t = time.time()
+    profiles = profile_csv(file.stream)
+    if not profiles:
+        raise ValueError(f"CSV file {file.filename} has no columns")
+    rows = max(profile.rows for profile in profiles.values())
+    record_stage("column_profiling", time.time() - t, file=file.filename, rows=rows, columns=len(profiles))
+    print(f"✅ Profiled {file.filename}: {rows} rows x {len(profiles)} columns in {time.time() - t:.2f} sec")
+    return profile_to_fields(profiles)
+
+
+def load_fields(file, file_meta):
+    """Field dict for an upload: key/value sheet by default, or a data extract with "layout": "records"."""
+    if file_meta.get("layout") == "records":
+        return records_to_json(file)
+    return csv_to_json(file)
+
+
 # -------------------------------------------------------------
 # Dummy mapping logic (replace with your actual get_data_mapping)
 # -------------------------------------------------------------
@@ -42,34 +97,255 @@ def csv_to_json(file):
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from itertools import product
 
+def _attach_source_metadata(tensor, src_file, metadata):
+    # Source metadata is attached once per file pair, not per entry
+    src_meta = metadata[src_file]
+    return tensor.with_metadata(
+        source_message=src_meta["message_name"],
+        source_file=src_file,
+        source_country=src_meta["country"],
+        source_domain=src_meta["domain"],
+        source_system=src_meta["system"],
+    )
+
+
 # Define this function at MODULE LEVEL (outside the route)
-def process_source_target_pair(src_file, src_json, tgt_file, tgt_json, metadata):
+def process_source_target_pair(src_file, src_json, tgt_file, tgt_json, metadata, top_k=None):
     """Process a single source-target pair"""
-    src_meta = metadata[src_file]
-    mapping_result = get_data_mapping(src_json, tgt_json)
-    
-    # Enrich mappings with source metadata
-    enriched_results = {}
-    for tgt_key, mappings in mapping_result.items():
-        enriched_mappings = []
-        for m in mappings:
-            m_copy = m.copy()
-            m_copy.update({
-                "source_message": src_meta["message_name"],
-                "source_file": src_file,
-                "source_country": src_meta["country"],
-                "source_domain": src_meta["domain"],
-                "source_system": src_meta["system"]
-            })
-            enriched_mappings.append(m_copy)
-        enriched_results[tgt_key] = enriched_mappings
-    
-    return tgt_file, enriched_results
+    tensor, err = get_score_tensor(src_json, tgt_json, top_k=top_k)
+    if err is not None:
+        logger.warning(f"LLM tier failed for {src_file} -> {tgt_file}, returning local scores: {err}")
+    return tgt_file, _attach_source_metadata(tensor, src_file, metadata)
+
+
+def preview_source_target_pair(src_file, src_json, tgt_file, tgt_json, metadata):
+    """Fast local-only scoring of a source-target pair"""
+    tensor = get_local_score_tensor(src_json, tgt_json)
+    return tgt_file, _attach_source_metadata(tensor, src_file, metadata)
+
+
+def refine_source_target_pair(tgt_file, tensor, src_json, tgt_json, top_k=None):
+    """Add the LLM-derived components to a preview tensor"""
+    _, err = refine_score_tensor(tensor, src_json, tgt_json, top_k=top_k)
+    if err is not None:
+        logger.warning(f"LLM tier failed for {tensor.metadata['source_file']} -> {tgt_file}: {err}")
+    return tgt_file, tensor
+
+
+def catalog_source_target_pairs(src_files, digests, tgt_file, tgt_json, metadata, top_k=None, preview=False):
+    """
+    Score a target against the catalog schemas `digests` in one batched pass. With
+    src_files (the uploads they were found for) the tensors carry those files'
+    metadata, otherwise the catalog's own.
+    """
+    tensors = match_catalog(tgt_json, catalog, digests, top_k=top_k, preview=preview)
+    if src_files is None:
+        return tgt_file, tensors
+    return tgt_file, [_attach_source_metadata(tensor, src_file, metadata)
+                      for src_file, tensor in zip(src_files, tensors)]
+
+
+def catalog_sources(source_data):
+    """{src_file: digest} of the uploaded sources already registered in the catalog"""
+    known = {src_file: catalog.find(src_json) for src_file, src_json in source_data.items()}
+    return {src_file: digest for src_file, digest in known.items() if digest is not None}
+
+
+def catalog_jobs_for(known, target_data, metadata, top_k=None, preview=False):
+    return [(list(known), list(known.values()), tgt_file, tgt_json, metadata, top_k, preview)
+            for tgt_file, tgt_json in target_data.items()] if known else []
+
+
+def merge_tensors(tensors_by_target, more):
+    for tgt_file, tensors in more.items():
+        tensors_by_target.setdefault(tgt_file, []).extend(tensors)
+    return tensors_by_target
+
+
+def run_pairs(fn, jobs):
+    """
+    Run fn over every job in parallel and group the resulting tensors by target file
+    (fn returns (tgt_file, tensor) or (tgt_file, [tensors]) for batched jobs).
+    Under a request deadline, pairs get DEADLINE_GRACE seconds past it to return
+    their best-so-far tensors; pairs that have not finished by then are dropped.
+    Returns (tensors_by_target, number of dropped pairs).
+    """
+    tensors_by_target = {}
+    # Pairs share the process-wide "request" lane, so concurrent requests
+    # no longer multiply the thread count
+    futures = [pools.submit("request", fn, *job) for job in jobs]
+    done, not_done = wait_until_deadline(futures, grace=DEADLINE_GRACE)
+    dropped = len(not_done)
+    for future in futures:
+        if future in done:
+            try:
+                tgt_file, tensors = future.result()
+            except DeadlineExceeded:
+                # The pair gave up on its own once the grace period was over
+                dropped += 1
+                continue
+            tensors_by_target.setdefault(tgt_file, []).extend(tensors if isinstance(tensors, list) else [tensors])
+    if dropped:
+        logger.warning(f"Deadline reached: {dropped} of {len(jobs)} pairs dropped")
+    return tensors_by_target, dropped
+
+
+def result_status(tensors_by_target, dropped=0):
+    """'complete' if every pair was fully refined, else 'partial'."""
+    tensors = [t for ts in tensors_by_target.values() for t in ts]
+    return "complete" if not dropped and all(t.tier == "full" for t in tensors) else "partial"
+
+
+def build_final_result(target_data, metadata, tensors_by_target, top_k=None):
+    """Rank all source keys for every target key into the API response shape"""
+    final_result = {}
+    for tgt_file in target_data.keys():
+        tgt_meta = metadata[tgt_file]
+        tgt_msg_name = tgt_meta["message_name"]
+        final_result[tgt_msg_name] = {}
+        
+        # Keep a deterministic source order before ranking across source files
+        tensors = sorted(tensors_by_target.get(tgt_file, []), key=lambda t: t.metadata["source_file"])
+        for tgt_key, ranked in rank_across(tensors, top_k=top_k).items():
+            entry = {}
+            for idx, m in enumerate(ranked, start=1):
+                entry[f"key{idx}"] = {
+                    "final_score": m["final_score"],
+                    "source_message": m["source_message"],
+                    "source_key": m["source_key"],
+                    "source_file": m["source_file"],
+                    "source_country": m["source_country"],
+                    "source_domain": m["source_domain"],
+                    "source_system": m["source_system"],
+                    "status": m["status"]
+                }
+            final_result[tgt_msg_name][tgt_key] = entry
+    return final_result
+
+
+def progressive_mapping(source_data, target_data, metadata, top_k=None):
+    """
+    Yield NDJSON events: first the local-only preview ranking, then the
+    ranking refined with the LLM components once they are available.
+    Sources already in the catalog are scored from their stored features in
+    both events (see _map_files).
+    """
+    start_total_t = time.time()
+    try:
+        known = catalog_sources(source_data)
+        jobs = [(src_file, src_json, tgt_file, tgt_json, metadata)
+                for (src_file, src_json), (tgt_file, tgt_json) in product(source_data.items(), target_data.items())
+                if src_file not in known]
+        previews, dropped = run_pairs(preview_source_target_pair, jobs)
+        catalog_previews, catalog_dropped = run_pairs(catalog_source_target_pairs,
+                                                      catalog_jobs_for(known, target_data, metadata, preview=True))
+        dropped += catalog_dropped
+        yield json.dumps({
+            "tier": "preview",
+            "elapsed": round(time.time() - start_total_t, 3),
+            "result": build_final_result(target_data, metadata, merge_tensors(merge_tensors({}, previews), catalog_previews), top_k),
+        }) + "\n"
+
+        refine_jobs = [(tgt_file, tensor, source_data[tensor.metadata["source_file"]], target_data[tgt_file], top_k)
+                       for tgt_file, tensors in previews.items() for tensor in tensors]
+        refined, refine_dropped = run_pairs(refine_source_target_pair, refine_jobs)
+        # A refinement dropped at the deadline still has its preview tensor
+        for tgt_file, tensors in previews.items():
+            seen = {id(t) for t in refined.get(tgt_file, [])}
+            refined.setdefault(tgt_file, []).extend(t for t in tensors if id(t) not in seen)
+        catalog_refined, _ = run_pairs(catalog_source_target_pairs, catalog_jobs_for(known, target_data, metadata, top_k))
+        for tgt_file, tensors in catalog_previews.items():
+            refined.setdefault(tgt_file, []).extend(catalog_refined.get(tgt_file, tensors))
+        complete = result_status(refined, dropped) == "complete"
+        yield json.dumps({
+            "tier": "refined" if complete else "partial",
+            "elapsed": round(time.time() - start_total_t, 3),
+            "result": build_final_result(target_data, metadata, refined, top_k),
+        }) + "\n"
+        print(f"✅ total time in api (progressive): {time.time() - start_total_t:.2f} sec")
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + "\n"
 import time
 
 
 @app.route('/api/map_files', methods=['POST'])
 def map_files():
+    return run_mapping_request(_map_files)
+
+
+def run_mapping_request(handler):
+    """
+    Run a scoring endpoint's handler under the per-worker mapping slots with a
+    request id, LLM priority, time budget and optional profiling.
+    """
+    # Bound concurrent mapping runs per worker; shed load instead of queueing indefinitely
+    if not mapping_slots.acquire(timeout=MAPPING_SLOT_WAIT):
+        return jsonify({"error": "Server busy, please retry shortly"}), 503, {"Retry-After": "5"}
+    # Tag outbound LLM calls with this request for fair queuing; clients running
+    # batch jobs can send "X-Priority: bulk" to yield to interactive users
+    rid = new_request_id()
+    request_id.set(rid)
+    llm_priority.set(BULK if request.headers.get("X-Priority", "").lower() == "bulk" else INTERACTIVE)
+    # Client time budget ('X-Time-Budget' header or 'time_budget' field, seconds);
+    # past it the response carries the best-so-far ranking. Sync workers reuse
+    # their thread, so the previous request's deadline is cleared first.
+    deadline.set(None)
+    try:
+        set_budget(budget_from_request(request.headers, request.form))
+    except ValueError as e:
+        mapping_slots.release()
+        return jsonify({"error": str(e)}), 400
+    stages = []
+    stage_stats.set(stages)
+    bind_thread()
+    # Opt-in profiling ('X-Profile: 1' or PROFILE_SAMPLE_RATE)
+    profiler = SamplingProfiler(rid).start() if should_profile(request.headers) else None
+    path = request.path
+
+    def finish():
+        unbind_thread()
+        try:
+            if profiler is not None:
+                profiler.stop()
+                saved = profiler.save(stages=stages, extra={"path": path})
+                logger.info(f"Profile for request {rid} written to {saved}")
+        except Exception as e:
+            # A profile that cannot be written must not fail the request or leak its slot
+            logger.warning(f"Could not save the profile of request {rid}: {e}")
+        finally:
+            mapping_slots.release()
+
+    streaming = False
+    try:
+        response = app.make_response(handler())
+        response.headers["X-Request-Id"] = rid
+        if profiler is not None:
+            response.headers["X-Profile-Id"] = rid
+        # A streamed response keeps its slot (and profiler) until the stream is closed
+        streaming = response.is_streamed
+        if streaming:
+            response.call_on_close(finish)
+        return response
+    finally:
+        if not streaming:
+            finish()
+
+
+def top_k_from_request(form, default):
+    """Optional 'top_k' form field: a positive integer, or `default` when absent."""
+    raw = form.get("top_k")
+    if raw in (None, ""):
+        return default
+    try:
+        top_k = int(raw)
+    except ValueError:
+        raise ValueError(f"Invalid top_k: {raw!r}")
+    if top_k < 1:
+        raise ValueError("top_k must be at least 1")
+    return top_k
+
+
+def _map_files():
     try:
         start_total_t = time.time()
         # Get all files (could be multiple)
@@ -82,6 +358,11 @@ def map_files():
             return jsonify({"error": "No metadata provided"}), 400
 
         metadata = json.loads(metadata_raw)
+        # Optional: only rank the best top_k sources per target key (enables the scorer cascade)
+        try:
+            top_k = top_k_from_request(request.form, DEFAULT_TOP_K)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         # Separate source and target files
         source_files = [f for f in all_files if f.filename in metadata and metadata[f.filename].get("type") == "source"]
@@ -93,77 +374,55 @@ def map_files():
         # Convert all source and target CSVs to JSON
         source_data = {}
         for src in source_files:
-            source_data[src.filename] = csv_to_json(src)
+            source_data[src.filename] = load_fields(src, metadata[src.filename])
           
         target_data = {}
         for tgt in target_files:
-            target_data[tgt.filename] = csv_to_json(tgt)
+            target_data[tgt.filename] = load_fields(tgt, metadata[tgt.filename])
+        record_stage("parse_uploads", time.time() - start_total_t, files=len(all_files))
        
+        # Progressive mode streams a local preview first, then the LLM-refined ranking
+        if request.args.get("progressive") == "1" or "application/x-ndjson" in request.headers.get("Accept", ""):
+            return Response(iterate_in_context(progressive_mapping(source_data, target_data, metadata, top_k)),
+                            mimetype="application/x-ndjson")
+
         # -------------------------------------------------------------
         # Build final result with parallel processing
         # -------------------------------------------------------------
-        final_result = {}
-
-        # Create all source-target pairs
-        pairs = list(product(source_data.items(), target_data.items()))
-
-        # Use ThreadPoolExecutor instead of ProcessPoolExecutor
-        # It's simpler and works better with Flask
-        max_workers = min(8, len(pairs))  # Use up to 8 threads
-
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = []
-            for (src_file, src_json), (tgt_file, tgt_json) in pairs:
-                future = executor.submit(
-                    process_source_target_pair,
-                    src_file, src_json, tgt_file, tgt_json, metadata
-                )
-                futures.append(future)
-            
-            # Aggregate results by target
-            aggregated_by_target = {}
-            for future in as_completed(futures):
-                tgt_file, enriched_results = future.result()
-                if tgt_file not in aggregated_by_target:
-                    aggregated_by_target[tgt_file] = {}
-                
-                for tgt_key, mappings in enriched_results.items():
-                    if tgt_key not in aggregated_by_target[tgt_file]:
-                        aggregated_by_target[tgt_file][tgt_key] = []
-                    aggregated_by_target[tgt_file][tgt_key].extend(mappings)
-            
-            # Final structuring
-            for tgt_file in target_data.keys():
-                tgt_meta = metadata[tgt_file]
-                tgt_msg_name = tgt_meta["message_name"]
-                final_result[tgt_msg_name] = {}
-                
-                for tgt_key, mappings in aggregated_by_target.get(tgt_file, {}).items():
-                    sorted_mappings = sorted(mappings, key=lambda x: x["final_score"], reverse=True)
-                    entry = {}
-                    for idx, m in enumerate(sorted_mappings, start=1):
-                        entry[f"key{idx}"] = {
-                            "final_score": m["final_score"],
-                            "source_message": m["source_message"],
-                            "source_key": m["source_key"],
-                            "source_file": m["source_file"],
-                            "source_country": m["source_country"],
-                            "source_domain": m["source_domain"],
-                            "source_system": m["source_system"]
-                        }
-                    final_result[tgt_msg_name][tgt_key] = entry
+        # Sources already in the catalog reuse their stored features and are scored
+        # against each target in one batched pass; the rest run pair by pair
+        known = catalog_sources(source_data)
+        jobs = [(src_file, src_json, tgt_file, tgt_json, metadata, top_k)
+                for (src_file, src_json), (tgt_file, tgt_json) in product(source_data.items(), target_data.items())
+                if src_file not in known]
+        t = time.time()
+        tensors_by_target, dropped = run_pairs(process_source_target_pair, jobs)
+        if known:
+            catalog_tensors, catalog_dropped = run_pairs(catalog_source_target_pairs,
+                                                         catalog_jobs_for(known, target_data, metadata, top_k))
+            merge_tensors(tensors_by_target, catalog_tensors)
+            dropped += catalog_dropped
+        record_stage("pair_scoring", time.time() - t, pairs=len(jobs) + len(known) * len(target_data), dropped=dropped)
+        t = time.time()
+        final_result = build_final_result(target_data, metadata, tensors_by_target, top_k)
+        record_stage("build_result", time.time() - t)
         print(f"✅ total time in api: {time.time() - start_total_t:.2f} sec")
-        return jsonify(final_result), 200
+        return jsonify(final_result), 200, {"X-Result-Status": result_status(tensors_by_target, dropped)}
 
+    except SchedulerBusy as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": str(int(e.retry_after + 0.5))}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 
 
+import os
+from contextlib import contextmanager
 from pathlib import Path
 from typing import List, Dict, Any
 import logging
+from src.utils.atomic_file import locked, replacing
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -171,18 +430,21 @@ logger = logging.getLogger(__name__)
 
 # Configuration
 DATA_DIR = Path(__file__).parent / 'data'
-MAPPINGS_FILE = DATA_DIR / 'mappings.json'
+# MATRI_MAPPINGS_FILE points the service at another library (e.g. a scratch copy for load tests)
+MAPPINGS_FILE = Path(os.getenv('MATRI_MAPPINGS_FILE', DATA_DIR / 'mappings.json'))
 
 def init_data_dir():
     """Initialize data directory and mappings file if they don't exist"""
     try:
         DATA_DIR.mkdir(parents=True, exist_ok=True)
-        if not MAPPINGS_FILE.exists():
-            with open(MAPPINGS_FILE, 'w') as f:
-                json.dump([], f)
-            logger.info(f"Created mappings file at {MAPPINGS_FILE}")
-        else:
-            logger.info(f"Mappings file exists at {MAPPINGS_FILE}")
+        MAPPINGS_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with locked(MAPPINGS_FILE):
+            if not MAPPINGS_FILE.exists():
+                with replacing(MAPPINGS_FILE) as f:
+                    json.dump([], f)
+                logger.info(f"Created mappings file at {MAPPINGS_FILE}")
+            else:
+                logger.info(f"Mappings file exists at {MAPPINGS_FILE}")
     except Exception as e:
         logger.error(f"Error initializing data directory: {e}")
         raise
@@ -190,11 +452,25 @@ def init_data_dir():
 # Initialize data directory when module loads
 init_data_dir()
 
+
+def mappings_file_stat():
+    """(mtime, size) of the mappings file, used to detect writes by other workers."""
+    try:
+        stat = MAPPINGS_FILE.stat()
+        return stat.st_mtime_ns, stat.st_size
+    except FileNotFoundError:
+        return None
+
+def load_mappings() -> List[Dict[Any, Any]]:
+    """Mappings from the JSON file; raises if it cannot be read"""
+    with open(MAPPINGS_FILE, 'r') as f:
+        return json.load(f)
+
+
 def read_mappings() -> List[Dict[Any, Any]]:
     """Read mappings from JSON file"""
     try:
-        with open(MAPPINGS_FILE, 'r') as f:
-            return json.load(f)
+        return load_mappings()
     except json.JSONDecodeError:
         logger.error("Invalid JSON in mappings file")
         return []
@@ -202,26 +478,102 @@ def read_mappings() -> List[Dict[Any, Any]]:
         logger.error(f"Error reading mappings: {e}")
         return []
 
+# ETag of the legacy full-list response and the file fingerprint it was computed for
+_list_etag = {"fingerprint": None, "etag": None}
+
+
+def not_modified(etag):
+    response = app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def conditional_json(payload):
+    """200 JSON response with a content-hash ETag, or 304 when If-None-Match matches."""
+    response = jsonify(payload)
+    response.set_etag(content_etag(response.get_data()), weak=True)
+    return response.make_conditional(request)
+
+# Secondary indexes for paginated / filtered queries, kept in step by the CRUD endpoints
+mapping_index = MappingIndex(read_mappings, mappings_file_stat)
+
+# Synonyms learned from approved key pairs, refreshed by the same endpoints
+lexicon.track(read_mappings, mappings_file_stat)
+
 def write_mappings(mappings: List[Dict[Any, Any]]) -> bool:
-    """Write mappings to JSON file"""
+    """Write mappings to JSON file (temp file + rename, so readers never see a partial file)"""
     try:
-        with open(MAPPINGS_FILE, 'w') as f:
+        with replacing(MAPPINGS_FILE) as f:
             json.dump(mappings, f, indent=2)
         return True
     except Exception as e:
         logger.error(f"Error writing mappings: {e}")
         return False
 
+
+mappings_lock = threading.Lock()
+
+
+@contextmanager
+def updating_mappings():
+    """
+    Read-modify-write of the mappings file, serialized across threads and gunicorn
+    workers. Yields (mappings, stat before the write); the caller writes and updates
+    the indexes inside the block. An unreadable file raises instead of being
+    overwritten with an empty list.
+    """
+    with mappings_lock, locked(MAPPINGS_FILE):
+        yield load_mappings(), mappings_file_stat()
+
 @app.route('/api/mappings', methods=['GET'])
 def get_mappings():
-    """Get all mappings"""
+    """
+    Get mappings. Without query parameters returns the full list (legacy).
+    With any of sourceCountry/sourceDomain/sourceSystem/targetCountry/targetDomain/
+    targetSystem, since/until (timestamp ms), key, limit or cursor returns one page:
+    {"items": [mapping without approvedMappings], "next_cursor": ..., "total": ...}
+    """
     try:
-        mappings = read_mappings()
-        return jsonify(mappings), 200
+        if not request.args:
+            # The full list only changes with the file: reuse its ETag until then
+            fingerprint = mappings_file_stat()
+            if fingerprint is not None and fingerprint == _list_etag["fingerprint"] \
+                    and request.if_none_match.contains_weak(_list_etag["etag"]):
+                return not_modified(_list_etag["etag"])
+            mappings = read_mappings()
+            response = conditional_json(mappings)
+            _list_etag.update(fingerprint=fingerprint, etag=response.get_etag()[0])
+            return response
+
+        filters = {field: request.args[field] for field in INDEXED_FIELDS if request.args.get(field)}
+        limit = request.args.get('limit', MAPPINGS_PAGE_SIZE, type=int)
+        page = mapping_index.query(
+            filters=filters,
+            since=request.args.get('since', type=int),
+            until=request.args.get('until', type=int),
+            key=request.args.get('key'),
+            cursor=request.args.get('cursor'),
+            limit=max(1, min(limit, MAPPINGS_MAX_PAGE_SIZE)),
+        )
+        return conditional_json(page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error fetching mappings: {e}")
         return jsonify({'error': 'Failed to fetch mappings'}), 500
 
+@app.route('/api/mappings/<string:mapping_id>', methods=['GET'])
+def get_mapping(mapping_id):
+    """Get one mapping including its approvedMappings"""
+    try:
+        mapping = mapping_index.get(mapping_id)
+        if mapping is None:
+            return jsonify({'error': 'Mapping not found'}), 404
+        return conditional_json(mapping)
+    except Exception as e:
+        logger.error(f"Error fetching mapping: {e}")
+        return jsonify({'error': 'Failed to fetch mapping'}), 500
+
 @app.route('/api/mappings', methods=['POST'])
 def create_mapping():
     """Create a new mapping"""
@@ -231,13 +583,13 @@ def create_mapping():
         if not new_mapping:
             return jsonify({'error': 'No data provided'}), 400
         
-        mappings = read_mappings()
-        mappings.insert(0, new_mapping)
-        
-        if write_mappings(mappings):
-            return jsonify(new_mapping), 201
-        else:
-            return jsonify({'error': 'Failed to save mapping'}), 500
+        with updating_mappings() as (mappings, before):
+            mappings.insert(0, new_mapping)
+            if not write_mappings(mappings):
+                return jsonify({'error': 'Failed to save mapping'}), 500
+            mapping_index.upsert(new_mapping, before)
+            lexicon.upsert_mapping(new_mapping, before)
+        return jsonify(new_mapping), 201
             
     except Exception as e:
         logger.error(f"Error creating mapping: {e}")
@@ -249,25 +601,26 @@ def update_mapping(mapping_id):
     try:
         updated_mapping = request.get_json()
         
-        if not updated_mapping:
+        if not updated_mapping or not isinstance(updated_mapping, dict):
             return jsonify({'error': 'No data provided'}), 400
+        # The id in the URL is authoritative, so the index cannot end up with two entries
+        updated_mapping['id'] = mapping_id
         
-        mappings = read_mappings()
-        updated = False
-        
-        for i, mapping in enumerate(mappings):
-            if mapping.get('id') == mapping_id:
-                mappings[i] = updated_mapping
-                updated = True
-                break
-        
-        if not updated:
-            return jsonify({'error': 'Mapping not found'}), 404
-        
-        if write_mappings(mappings):
-            return jsonify(updated_mapping), 200
-        else:
-            return jsonify({'error': 'Failed to update mapping'}), 500
+        with updating_mappings() as (mappings, before):
+            updated = False
+            for i, mapping in enumerate(mappings):
+                if mapping.get('id') == mapping_id:
+                    mappings[i] = updated_mapping
+                    updated = True
+                    break
+
+            if not updated:
+                return jsonify({'error': 'Mapping not found'}), 404
+            if not write_mappings(mappings):
+                return jsonify({'error': 'Failed to update mapping'}), 500
+            mapping_index.upsert(updated_mapping, before)
+            lexicon.upsert_mapping(updated_mapping, before)
+        return jsonify(updated_mapping), 200
             
     except Exception as e:
         logger.error(f"Error updating mapping: {e}")
@@ -277,27 +630,127 @@ def update_mapping(mapping_id):
 def delete_mapping(mapping_id):
     """Delete a mapping"""
     try:
-        mappings = read_mappings()
-        original_length = len(mappings)
-        
-        mappings = [m for m in mappings if m.get('id') != mapping_id]
-        
-        if len(mappings) == original_length:
-            return jsonify({'error': 'Mapping not found'}), 404
-        
-        if write_mappings(mappings):
-            return jsonify({'success': True}), 200
-        else:
-            return jsonify({'error': 'Failed to delete mapping'}), 500
+        with updating_mappings() as (mappings, before):
+            remaining_mappings = [m for m in mappings if m.get('id') != mapping_id]
+
+            if len(remaining_mappings) == len(mappings):
+                return jsonify({'error': 'Mapping not found'}), 404
+            if not write_mappings(remaining_mappings):
+                return jsonify({'error': 'Failed to delete mapping'}), 500
+            mapping_index.remove(mapping_id, before)
+            lexicon.remove_mapping(mapping_id, before)
+        return jsonify({'success': True}), 200
             
     except Exception as e:
         logger.error(f"Error deleting mapping: {e}")
         return jsonify({'error': 'Failed to delete mapping'}), 500
 
+# -------------------------------------------------------------
+# Field catalog
+# -------------------------------------------------------------
+@app.route('/api/catalog', methods=['GET'])
+def list_catalog():
+    """Registered schemas (latest version per message unless ?all_versions=1), filterable by CATALOG_FIELDS"""
+    filters = {name: request.args.get(name) for name in CATALOG_FIELDS}
+    entries = catalog.list(filters, all_versions=request.args.get("all_versions") == "1")
+    return conditional_json({"items": entries, "total": len(entries)})
+
+
+@app.route('/api/catalog/<string:digest>', methods=['GET'])
+def get_catalog_schema(digest):
+    """One schema version with its keys, descriptions and formats"""
+    if catalog.get(digest) is None:
+        return jsonify({'error': 'Schema not found'}), 404
+    return conditional_json(catalog.schema(digest))
+
+
+@app.route('/api/catalog/<string:digest>', methods=['DELETE'])
+def delete_catalog_schema(digest):
+    if not catalog.remove(digest):
+        return jsonify({'error': 'Schema not found'}), 404
+    return jsonify({'success': True}), 200
+
+
+@app.route('/api/catalog', methods=['POST'])
+def register_catalog_schemas():
+    """Register uploaded message files (same files + metadata form as /api/map_files)"""
+    return run_mapping_request(_register_catalog_schemas)
+
+
+def _register_catalog_schemas():
+    try:
+        all_files = request.files.getlist("files")
+        metadata = json.loads(request.form.get("metadata") or "{}")
+        files = [f for f in all_files if f.filename in metadata]
+        if not files:
+            return jsonify({"error": "No files with metadata uploaded"}), 400
+        entries = []
+        for f in files:
+            fields = load_fields(f, metadata[f.filename])
+            entries.append(catalog.register(fields, metadata[f.filename]))
+        return jsonify({"items": entries}), 201
+    except DeadlineExceeded as e:
+        return jsonify({"error": str(e)}), 504
+    except SchedulerBusy as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": str(int(e.retry_after + 0.5))}
+    except Exception as e:
+        logger.error(f"Error registering catalog schemas: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/catalog/match', methods=['POST'])
+def match_catalog_files():
+    """
+    Rank catalog fields for every key of the uploaded target files. The optional
+    'catalog' form field selects the schemas: {"hashes": [...]} and/or filters on
+    CATALOG_FIELDS (latest versions); default is the whole catalog.
+    """
+    return run_mapping_request(_match_catalog_files)
+
+
+def _match_catalog_files():
+    try:
+        start_total_t = time.time()
+        all_files = request.files.getlist("files")
+        metadata = json.loads(request.form.get("metadata") or "{}")
+        selection = json.loads(request.form.get("catalog") or "{}")
+        try:
+            top_k = top_k_from_request(request.form, CATALOG_MATCH_TOP_K)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if not all_files:
+            return jsonify({"error": "No files uploaded"}), 400
+
+        digests = selection.get("hashes") or [entry["hash"] for entry in catalog.list(selection)]
+        missing = [digest for digest in digests if catalog.get(digest) is None]
+        if missing:
+            return jsonify({"error": f"Unknown catalog schemas: {', '.join(missing)}"}), 404
+        if not digests:
+            return jsonify({"error": "No catalog schemas selected"}), 400
+
+        target_data = {}
+        for f in all_files:
+            file_meta = metadata.setdefault(f.filename, {})
+            file_meta.setdefault("message_name", os.path.splitext(f.filename)[0])
+            target_data[f.filename] = load_fields(f, file_meta)
+        record_stage("parse_uploads", time.time() - start_total_t, files=len(all_files))
+
+        jobs = [(None, digests, tgt_file, tgt_json, metadata, top_k) for tgt_file, tgt_json in target_data.items()]
+        tensors_by_target, dropped = run_pairs(catalog_source_target_pairs, jobs)
+        final_result = build_final_result(target_data, metadata, tensors_by_target, top_k)
+        print(f"✅ total time in catalog match: {time.time() - start_total_t:.2f} sec")
+        return jsonify(final_result), 200, {"X-Result-Status": result_status(tensors_by_target, dropped)}
+    except SchedulerBusy as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": str(int(e.retry_after + 0.5))}
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy'}), 200
 
 if __name__ == '__main__':
+    # Development server only; for production use: gunicorn -c gunicorn.conf.py app:app
     app.run(debug=True)
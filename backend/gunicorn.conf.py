@@ -0,0 +1,63 @@
+"""
+Production serving configuration.
+
+    cd backend
+    gunicorn -c gunicorn.conf.py app:app
+
+The app (and with it the SentenceTransformer and spaCy models) is imported once
+in the master process and the workers are forked from it, so the model weights
+are shared copy-on-write instead of being loaded once per worker.
+
+Environment variables:
+    MATRI_BIND                 address to bind (default 0.0.0.0:5000)
+    MATRI_WORKERS              worker processes (default: number of CPUs)
+    MATRI_THREADS              request threads per worker (default 4)
+    MATRI_CPU_BUDGET           cores per worker for the work lanes + torch/BLAS (default: CPUs / workers)
+    MATRI_MAX_CONCURRENT_MAPPINGS  concurrent /api/map_files requests per worker (see app.py)
+    MATRI_MAPPING_SLOT_WAIT    seconds a mapping request waits for a free slot before a 503 (default 30)
+    MATRI_TIMEOUT              worker timeout in seconds (default 300)
+    MATRI_GRACEFUL_TIMEOUT     seconds to finish in-flight requests on shutdown (default 60)
+"""
+import gc
+import os
+
+_cpus = os.cpu_count() or 1
+
+bind = os.getenv("MATRI_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("MATRI_WORKERS", _cpus))
+threads = int(os.getenv("MATRI_THREADS", 4))
+worker_class = "gthread"
+cpu_budget = int(os.getenv("MATRI_CPU_BUDGET", max(1, _cpus // workers)))
+
+# Load models in the master before forking
+preload_app = True
+timeout = int(os.getenv("MATRI_TIMEOUT", 300))
+graceful_timeout = int(os.getenv("MATRI_GRACEFUL_TIMEOUT", 60))
+keepalive = 5
+accesslog = "-"
+
+
+def pre_fork(server, worker):
+    # Move everything allocated so far (model weights included) out of the GC's
+    # reach so collections in the workers don't touch, and thereby copy, those pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Workers share the machine: fit this worker's lanes and torch/BLAS threads into its share
+    from src.utils.work_scheduler import pools
+    from src.utils.llm_scheduler import scheduler
+    native_threads = pools.configure(cpu_budget)
+    # LLM quota buckets are per process: each worker gets its share of LLM_RATE_LIMITS
+    scheduler.share(server.cfg.workers)
+    server.log.info(f"Worker {worker.pid} ready (threads={threads}, cpu_budget={cpu_budget}, "
+                    f"lanes={pools.sizes}, native_threads={native_threads})")
+
+
+def worker_int(worker):
+    # SIGINT / SIGQUIT is a quick shutdown; only SIGTERM waits graceful_timeout for in-flight requests
+    worker.log.info(f"Worker {worker.pid} interrupted, shutting down without finishing in-flight requests")
+
+
+def worker_exit(server, worker):
+    server.log.info(f"Worker {worker.pid} exited")
@@ -21,4 +21,166 @@ CANON_MAP = {
     # commons
     "name": "NAME", "type": "TYPE"
 }
-GENERIC_CANON = {"NUMBER", "DATE", "TYPE", "NAME"}
\ No newline at end of file
+GENERIC_CANON = {"NUMBER", "DATE", "TYPE", "NAME"}
+
+# Known domain abbreviations, resolved by the local lexicon (src/utils/lexicon.py)
+# without a synonym LLM call.
+DOMAIN_ABBREVIATIONS = {
+    "oog": ["out of gauge", "over dimension"],
+    "vgm": ["verified gross mass", "gross weight"],
+    "pol": ["port of loading", "load port"],
+    "pod": ["port of discharge", "discharge port"],
+    "sbn": ["shipping bill number"],
+    "bl": ["bill of lading"],
+    "bol": ["bill of lading"],
+    "eta": ["estimated time of arrival"],
+    "etd": ["estimated time of departure"],
+    "teu": ["twenty foot equivalent unit"],
+    "grt": ["gross tonnage", "gross register tons"],
+    "dg": ["dangerous goods", "hazardous"],
+    "fe": ["full empty", "load status"],
+    "wt": ["weight"],
+    "qty": ["quantity"],
+    "pkg": ["package"],
+}
+# Synonyms learned from the LLM, persisted so they survive restarts.
+LEXICON_CACHE_FILE = os.getenv("MATRI_LEXICON_CACHE", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "synonym_cache.json"))
+# Alignments learned from saved mappings need this many supporting mappings,
+# unless a key pair aligned a single token with the whole phrase.
+LEXICON_MIN_SUPPORT = 2
+# New LLM synonyms are written to the cache at most every LEXICON_FLUSH_SEC;
+# writes by other workers are picked up within LEXICON_REFRESH_SEC.
+LEXICON_FLUSH_SEC = 2.0
+LEXICON_REFRESH_SEC = 1.0
+
+# Weights used to combine the per-pair scorer components into final_score.
+SCORE_WEIGHTS = {
+    "semantic": 0.10,
+    "fuzzy": 0.10,
+    "synonym": 0.30,
+    "llm_score": 0.50,
+    # Value-profile similarity of the example values (src/utils/value_profile.py);
+    # tune with src/utils/evaluation.py before giving it weight here.
+    "value": 0.0,
+}
+SCORE_COMPONENTS = tuple(SCORE_WEIGHTS.keys())
+
+# Description generation is sharded into chunks of at most this many estimated tokens
+# (prompt fields + expected response), described concurrently on the "io" work lane.
+DESCRIPTION_CHUNK_TOKENS = 1500
+DESCRIPTION_TOKENS_PER_FIELD = 40
+DESCRIPTION_RETRIES = 2
+# Described chunks kept in memory, so chunks finished before a request ran out of
+# time are reused by its retry instead of being asked for again.
+DESCRIPTION_CACHE_SIZE = 512
+
+# Batched transformation: prompt token budget per batch and response budget (also the
+# max_tokens of the call). A batch refused by a busy LLM quota is sent again up to
+# TRANSFORM_BUSY_RETRIES times (src/utils/record_batches.py).
+TRANSFORM_BATCH_TOKENS = 6000
+TRANSFORM_MAX_OUTPUT_TOKENS = 4000
+TRANSFORM_BUSY_RETRIES = 2
+
+# Concurrent EmbeddingModel.embed calls are gathered for up to EMBED_MAX_WAIT_MS
+# (or EMBED_MAX_BATCH texts) and encoded together by one dispatcher thread.
+EMBED_BATCHING = True
+EMBED_MAX_BATCH = 256
+EMBED_MAX_WAIT_MS = 5
+
+# Per-worker limit on concurrent /api/map_files requests and how long (seconds) a
+# request waits for a free slot before getting a 503.
+MAX_CONCURRENT_MAPPINGS = int(os.getenv("MATRI_MAX_CONCURRENT_MAPPINGS", 2))
+MAPPING_SLOT_WAIT = float(os.getenv("MATRI_MAPPING_SLOT_WAIT", 30))
+
+# Outbound LLM quota per provider (requests/min, tokens/min), enforced locally by
+# src/utils/llm_scheduler.py. Bulk calls leave LLM_BULK_RESERVE of each bucket to
+# interactive traffic; callers waiting longer than LLM_MAX_WAIT seconds (or finding
+# LLM_MAX_QUEUE calls already queued) get SchedulerBusy. These are the quotas of the
+# whole deployment: the buckets are per process, so each gunicorn worker gets
+# 1 / workers of them (scheduler.share in gunicorn.conf.py post_fork).
+LLM_RATE_LIMITS = {
+    "openai": {"rpm": int(os.getenv("OPENAI_RPM", 500)), "tpm": int(os.getenv("OPENAI_TPM", 200000))},
+    "groq": {"rpm": int(os.getenv("GROQ_RPM", 30)), "tpm": int(os.getenv("GROQ_TPM", 6000))},
+    "default": {"rpm": 60, "tpm": 60000},
+}
+LLM_BULK_RESERVE = 0.2
+LLM_MAX_QUEUE = 500
+LLM_MAX_WAIT = 60
+
+# Weights for the local-only preview tier (no LLM descriptions or Groq synonyms).
+PREVIEW_WEIGHTS = {
+    "semantic": 0.25,
+    "fuzzy": 0.25,
+    "synonym": 0.35,
+    "llm_score": 0.0,
+    "value": 0.15,
+}
+
+# Scorer cascade: pairs refined per target per round when a top_k is requested.
+CASCADE_BATCH = 8
+# Number of ranked source keys returned per target key (None = all).
+DEFAULT_TOP_K = None
+
+# Request profiling: sampled stacks + stage timings are written to PROFILE_DIR for
+# requests sent with 'X-Profile: 1' (only if PROFILE_ALLOW_HEADER, off by default since
+# any client could ask for it) or picked at PROFILE_SAMPLE_RATE. Only the newest
+# PROFILE_MAX_FILES profiles are kept.
+PROFILE_DIR = os.getenv("MATRI_PROFILE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "profiles"))
+PROFILE_SAMPLE_RATE = float(os.getenv("MATRI_PROFILE_SAMPLE_RATE", 0))
+PROFILE_INTERVAL_MS = 5
+PROFILE_ALLOW_HEADER = os.getenv("MATRI_PROFILE_ALLOW_HEADER", "0") == "1"
+PROFILE_MAX_FILES = int(os.getenv("MATRI_PROFILE_MAX_FILES", 200))
+
+# Streaming column profiler for sample data extracts (uploads with "layout": "records"):
+# rows read per chunk, reservoir samples and top shapes kept per column, HyperLogLog
+# precision (2**p registers) and the cap on distinct shapes tracked per column.
+COLUMN_PROFILE_CHUNK_ROWS = int(os.getenv("MATRI_COLUMN_PROFILE_CHUNK_ROWS", 50000))
+COLUMN_PROFILE_SAMPLES = 20
+COLUMN_PROFILE_TOP_SHAPES = 5
+COLUMN_PROFILE_HLL_PRECISION = 12
+COLUMN_PROFILE_MAX_SHAPES = 1000
+
+# Paginated /api/mappings queries: default and maximum page size.
+MAPPINGS_PAGE_SIZE = 50
+MAPPINGS_MAX_PAGE_SIZE = 500
+
+# Response compression (src/utils/http_compression.py): bodies smaller than
+# COMPRESS_MIN_BYTES are sent as-is; streamed responses are always compressed.
+COMPRESS_MIN_BYTES = int(os.getenv("MATRI_COMPRESS_MIN_BYTES", 1024))
+COMPRESS_GZIP_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 5
+
+# Per-request deadlines (src/utils/deadline.py): time budget in seconds when the
+# client sends none (None = unbounded), the largest budget accepted, and how long
+# pair workers get after the deadline to hand back their best-so-far scores.
+DEFAULT_TIME_BUDGET = float(os.getenv("MATRI_TIME_BUDGET")) if os.getenv("MATRI_TIME_BUDGET") else None
+MAX_TIME_BUDGET = 600
+DEADLINE_GRACE = 1.0
+
+# Process-wide work lanes (src/utils/work_scheduler.py): "request" runs source x
+# target pairs, "io" blocks on LLM calls, "cpu" runs scoring / encoding. CPU_BUDGET
+# is the number of cores this process may use (gunicorn sets cores / workers); torch
+# and BLAS thread pools are sized from what the cpu lane leaves free.
+CPU_BUDGET = int(os.getenv("MATRI_CPU_BUDGET", os.cpu_count() or 1))
+WORK_LANES = {
+    "request": int(os.getenv("MATRI_REQUEST_WORKERS", 8)),
+    "io": int(os.getenv("MATRI_IO_WORKERS", 32)),
+    "cpu": int(os.getenv("MATRI_CPU_WORKERS", max(1, CPU_BUDGET // 2))),
+}
+
+# Field catalog (src/utils/field_catalog.py): registered message schemas with their
+# precomputed field features, one directory per schema version (content hash), and
+# the number of ranked fields per target key when matching against the catalog.
+CATALOG_DIR = os.getenv("MATRI_CATALOG_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "catalog"))
+CATALOG_MATCH_TOP_K = 5
+
+# In-memory encoding of catalog embeddings (src/utils/embedding_store.py): "float32",
+# "float16", "int8" or "pq". Full-precision rows stay on disk (memory-mapped) for
+# re-scoring the final candidates. PQ uses CATALOG_PQ_SUBSPACES byte codes per
+# vector, with codebooks trained on up to CATALOG_PQ_TRAIN_SIZE vectors when schemas
+# are registered. PQ trades query speed for memory: ~23x smaller than float32 but
+# slower to search (4.5 vs 2.9 ms/query, same recall@10 after re-scoring, in the
+# reference run of `python src/utils/embedding_store.py`).
+CATALOG_EMBEDDING_CODEC = os.getenv("MATRI_CATALOG_CODEC", "float32")
+CATALOG_PQ_SUBSPACES = 48
+CATALOG_PQ_TRAIN_SIZE = 20000
@@ -1,60 +1,225 @@
-
-
 import concurrent.futures
 import csv
 import sys, os 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from src.utils.helper import *
 from src.utils.mapping_methods import *
-# def tarnsform_data(source_dict, target_list, data_mapping):
+from src.utils.score_tensor import ScoreTensor
+from src.utils.request_context import record_stage
+from src.utils.value_profile import field_profile_scores
+from src.utils.deadline import DeadlineExceeded, expired, wait_until_deadline
+from src.utils.work_scheduler import pools
 
+# Components computed exactly by the local tier
+LOCAL_COMPONENTS = ("semantic", "fuzzy", "value")
 
-def get_data_mapping(source_dict, target_dict, full_mapping=True, save_csv=True):
-    start_total = time.time()
+
+def get_local_score_tensor(source_dict, target_dict):
+    """
+    Fast tier: fuzzy, token-embedding semantic, canonical synonym and value-profile scores only.
+    Makes no LLM calls; the result is ranked with PREVIEW_WEIGHTS.
+    """
+    t1 = time.time()
+    tensor = ScoreTensor(list(target_dict.keys()), list(source_dict.keys()), weights=PREVIEW_WEIGHTS, tier="preview")
+    col = {name: i for i, name in enumerate(tensor.components)}
+
+    futures = []
+    for ti, tgt_key in enumerate(target_dict.keys()):   # 🔄 Outer loop on target
+        for si, src_key in enumerate(source_dict.keys()):
+            futures.append((ti, si, pools.submit("cpu", _local_pair, tgt_key, src_key)))
+
+    # Collect results
+    try:
+        for ti, si, future in futures:
+            scores = future.result()
+            if scores is None:
+                raise DeadlineExceeded("local scoring exceeded its time budget")
+            src_key, fuzzy, semantic, synonym = scores
+            row = tensor.scores[ti, si]
+            row[col["fuzzy"]] = fuzzy
+            row[col["semantic"]] = semantic
+            row[col["synonym"]] = synonym
+    finally:
+        # Out of time: drop the pairs still queued
+        for _, _, future in futures:
+            future.cancel()
+    # Value profiles of the example values (whole columns for profiled extracts), vectorized over the grid
+    tensor.scores[:, :, col["value"]] = field_profile_scores(source_dict, target_dict)
+    print(f"✅ Preview - Local scoring (fuzzy + semantic + canonical synonym + value profile): {time.time() - t1:.2f} sec")
+    record_stage("local_scoring", time.time() - t1, pairs=len(source_dict) * len(target_dict))
+    return tensor
+
+
+def _local_pair(tgt_key, src_key):
+    """Local-tier scores of one pair, or None once the deadline's grace period has passed."""
+    if expired(DEADLINE_GRACE):
+        return None
+    return compute_score(tgt_key, src_key, emb, None)
+
+
+def _refine_pair(tgt_key, src_key, descriptions, partial, llm_weight, threshold):
+    """
+    Expensive components for one pair, cheapest first. The description
+    similarity is skipped (None) once the pair can no longer reach `threshold`;
+    both are None if the request's deadline passed first.
+    """
+    # Queued pairs that start after the deadline return at once instead of holding a lane
+    if expired():
+        return None, None
+    try:
+        synonym = synonym_coverage_score(tokenize_key(tgt_key), tokenize_key(src_key), groq)
+    except DeadlineExceeded:
+        return None, None
+    if partial + SCORE_WEIGHTS["synonym"] * synonym + llm_weight < threshold:
+        return synonym, None
+    if expired():
+        return None, None
+    llm_score = llm_descriptions_similarity(tgt_key, src_key, descriptions, emb)
+    return synonym, llm_score
+
+
+def refine_score_tensor(tensor, source_dict, target_dict, top_k=None):
+    """
+    Second tier: add the LLM-derived components (description similarity and
+    Groq-expanded synonyms) to a preview tensor, in place.
+
+    With top_k set the pairs are evaluated as a cascade: each target's sources
+    are visited in order of their upper bound on final_score (exact local
+    components + upper bounds of the expensive ones) and a pair is pruned once
+    that bound falls below the k-th best exact score, so the top-k per target
+    is identical to a full evaluation. tensor.evaluated marks the exact pairs.
+
+    Under a request deadline, no new pairs are scheduled once it passes: target
+    rows that were not finished keep their preview ranking (tensor.partial_rows,
+    tier "partial") while finished rows use the refined scores.
+
+    Returns (tensor, None), or (tensor, err) with the preview scores kept if
+    description generation failed or ran out of time.
+    """
     t1 = time.time()
     keys = {**source_dict, **target_dict}
-    descriptions, format_info = generate_description_format(keys)
+    try:
+        descriptions, format_info = generate_description_format(keys)
+    except DeadlineExceeded as err:
+        described = len(err.partial[0]) if err.partial else 0
+        print(f"⚠️ Deadline reached during description generation, keeping local scores "
+              f"({described}/{len(keys)} fields described, kept for the next request)")
+        record_stage("description_generation", time.time() - t1, fields=len(keys), described=described,
+                     deadline_exceeded=True)
+        return tensor, str(err)
     print(f"✅ Step 1 - Description generation: {time.time() - t1:.2f} sec")
+    record_stage("description_generation", time.time() - t1, fields=len(keys))
     t2 = time.time()
     # print(descriptions)
     if descriptions == None:
-        return format_info
+        print(f"⚠️ Description generation failed, keeping local scores: {format_info}")
+        return tensor, format_info
+
+    col = {name: i for i, name in enumerate(tensor.components)}
+    n_targets, n_sources, _ = tensor.shape
+    # Exact part of final_score known from the local tier, and the upper bound
+    # of what the expensive components can still add (llm_score <= 1).
+    partial = sum(SCORE_WEIGHTS[name] * tensor.component(name) for name in LOCAL_COMPONENTS)
+    llm_weight = SCORE_WEIGHTS["llm_score"]
+    if top_k is None or top_k >= n_sources:
+        upper = np.full((n_targets, n_sources), np.inf)
     else:
-        result = {}
+        syn_upper = np.array([[synonym_upper_bound(tokenize_key(t), tokenize_key(s)) for s in tensor.source_keys]
+                              for t in tensor.target_keys]).reshape(n_targets, n_sources)
+        upper = partial + SCORE_WEIGHTS["synonym"] * syn_upper + llm_weight
+
+    order = np.argsort(-upper, axis=1, kind="stable")
+    cursor = np.zeros(n_targets, dtype=int)
+    best = [[] for _ in range(n_targets)]  # exact final scores evaluated so far
+    tensor.evaluated = np.zeros((n_targets, n_sources), dtype=bool)
+    batch = n_sources if top_k is None else max(top_k, CASCADE_BATCH)
 
-        with concurrent.futures.ThreadPoolExecutor() as executor:
+    def threshold(ti):
+        if top_k is None or len(best[ti]) < top_k:
+            return -np.inf
+        return sorted(best[ti], reverse=True)[top_k - 1]
+
+    incomplete = np.zeros(n_targets, dtype=bool)
+    out_of_time = False
+    submitted = []
+    try:
+        while not out_of_time:
+            if expired():
+                out_of_time = True
+                break
             futures = []
-            for tgt_key in target_dict.keys():   # 🔄 Outer loop on target
-                for src_key in source_dict.keys():
-                    futures.append((tgt_key, executor.submit(compute_score, tgt_key, src_key, emb, groq)))
-            
-            # Collect results
-            for tgt_key, future in futures:
-                score_time = time.time()
-                src_key, fuzzy, semantic, synonym = future.result()
-                llm_start = time.time()
-                llm_score = llm_descriptions_similarity(tgt_key, src_key, descriptions, emb)
-                llm_time = time.time() - llm_start
-                if tgt_key not in result:
-                    result[tgt_key] = []
-                
-                final_score = (
-                    0.10 * semantic +
-                    0.10 * fuzzy +
-                    0.30 * synonym +
-                    0.50 * llm_score
-                )
-
-                result[tgt_key].append({
-                    "source_key": src_key,     # 🔄 replaced
-                    "fuzzy": fuzzy,
-                    "semantic": semantic,
-                    "synonym": synonym,
-                    "llm_score": llm_score,
-                    "final_score": final_score
-                })
-            print(f"✅ Step 2 - Parallel scoring (fuzzy + semantic + synonym + LLM): {time.time() - t2:.2f} sec")
-        
+            for ti in range(n_targets):
+                limit = threshold(ti)
+                taken = 0
+                while cursor[ti] < n_sources and taken < batch:
+                    si = order[ti, cursor[ti]]
+                    if upper[ti, si] < limit:
+                        cursor[ti] = n_sources   # everything left is bounded below the top-k
+                        break
+                    cursor[ti] += 1
+                    taken += 1
+                    futures.append((ti, si, pools.submit(
+                        "io", _refine_pair, tensor.target_keys[ti], tensor.source_keys[si],
+                        descriptions, float(partial[ti, si]), llm_weight, limit)))
+            submitted.extend(future for _, _, future in futures)
+            if not futures:
+                break
+
+            done, not_done = wait_until_deadline([future for _, _, future in futures])
+            out_of_time = bool(not_done)
+            for ti, si, future in futures:
+                if future in not_done:
+                    incomplete[ti] = True
+                    continue
+                synonym, llm_score = future.result()
+                if synonym is None:
+                    incomplete[ti] = True
+                    out_of_time = True
+                    continue
+                row = tensor.scores[ti, si]
+                row[col["synonym"]] = synonym
+                if llm_score is None:
+                    continue
+                row[col["llm_score"]] = llm_score
+                tensor.evaluated[ti, si] = True
+                best[ti].append(float(partial[ti, si] + SCORE_WEIGHTS["synonym"] * synonym + llm_weight * llm_score))
+    finally:
+        # Drop queued work nobody will read (deadline or error); running calls finish on their own
+        for future in submitted:
+            future.cancel()
+
+    tensor.weights = SCORE_WEIGHTS
+    tensor.tier = "full"
+    if out_of_time:
+        # Rows whose cascade had not run to the end are not final either
+        incomplete |= cursor < n_sources
+        tensor.tier = "partial"
+        tensor.partial_rows = incomplete
+    evaluated = int(tensor.evaluated.sum())
+    print(f"✅ Step 2 - Refinement (synonym expansion + LLM): {time.time() - t2:.2f} sec, "
+          f"{evaluated}/{n_targets * n_sources} pairs evaluated"
+          + (f", deadline reached with {int(incomplete.sum())} partial rows" if out_of_time else ""))
+    record_stage("llm_refinement", time.time() - t2, pairs=n_targets * n_sources, evaluated=evaluated,
+                 partial_rows=int(incomplete.sum()))
+    return tensor, None
+
+
+def get_score_tensor(source_dict, target_dict, top_k=None):
+    """
+    Score every target x source key pair with both tiers (see refine_score_tensor for top_k).
+    Returns (ScoreTensor, err); if the LLM tier failed the tensor holds the
+    local preview scores and err describes the failure.
+    """
+    tensor = get_local_score_tensor(source_dict, target_dict)
+    return refine_score_tensor(tensor, source_dict, target_dict, top_k=top_k)
+
+
+def get_data_mapping(source_dict, target_dict, full_mapping=True, save_csv=True):
+    tensor, err = get_score_tensor(source_dict, target_dict)
+    if tensor is None:
+        return err
+    else:
+        result = tensor.to_dict()
         # with open("full_mapping.json", "w") as f:
         #     json.dump(result, f, indent=4)
 
@@ -147,5 +312,5 @@ if __name__ == '__main__':
         "Over Dimension Length": 13.5  # meters
     }
     result = get_data_mapping(source_dict, target_dict)
-    target = transform_data(source_dict, list(target_dict.keys()), result)
+    target = transform_data_batch([source_dict], list(target_dict.keys()), result)[0]
     print(result)
@@ -0,0 +1,76 @@
+"""
+File helpers for state shared by several gunicorn workers (synonym cache,
+field catalog): an advisory lock around read-modify-write cycles, and writes
+that go through a private temp file plus os.replace so readers never see a
+partial file.
+"""
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks (Windows); writes are still atomic
+    fcntl = None
+
+
+def file_stat(path) -> Optional[tuple]:
+    """(mtime_ns, size) of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+@contextmanager
+def locked(path):
+    """Exclusive lock on `<path>.lock`, held across processes for a read-modify-write."""
+    directory = os.path.dirname(os.fspath(path)) or "."
+    os.makedirs(directory, exist_ok=True)
+    with open(f"{os.fspath(path)}.lock", "a") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+@contextmanager
+def replacing(path, mode: str = "w"):
+    """Yield a file that atomically replaces `path` once the block completes without error."""
+    path = os.fspath(path)
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def write_json(path, data, **kwargs):
+    with replacing(path) as f:
+        json.dump(data, f, **kwargs)
+
+
+def quarantine(path) -> Optional[str]:
+    """Move an unreadable file aside (kept for inspection) and return its new name."""
+    moved = f"{os.fspath(path)}.corrupt-{int(time.time())}"
+    try:
+        os.replace(path, moved)
+    except OSError:
+        return None
+    return moved
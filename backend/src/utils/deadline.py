@@ -0,0 +1,105 @@
+"""
+Per-request deadlines.
+
+The deadline is an absolute time.monotonic() value in a contextvar, so it
+follows the request into worker threads started with submit_in_context. LLM
+calls stop queueing for quota and time out their HTTP request when it passes,
+and the scoring loops stop scheduling new work and return their best-so-far
+scores instead of waiting for every upstream call.
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+import concurrent.futures
+import contextlib
+import contextvars
+import math
+import time
+
+from src.config import DEFAULT_TIME_BUDGET, MAX_TIME_BUDGET
+
+# Absolute deadline (time.monotonic()) of the current request; None = unbounded
+deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, message: str = "", partial=None):
+        super().__init__(message)
+        # Best-so-far result of the interrupted operation, if it has one
+        self.partial = partial
+
+
+def remaining():
+    """Seconds left before the deadline (negative once passed), or None without one."""
+    current = deadline.get()
+    return None if current is None else current - time.monotonic()
+
+
+def expired(grace: float = 0.0) -> bool:
+    """Whether the deadline (plus `grace` seconds) has passed."""
+    left = remaining()
+    return left is not None and left <= -grace
+
+
+def check(what: str = "request"):
+    """Raise DeadlineExceeded if the current deadline has passed."""
+    if expired():
+        raise DeadlineExceeded(f"{what} exceeded its time budget")
+
+
+def timeout_for(default: float = None):
+    """`default` capped at the time left (at least 1 ms); None when neither is set."""
+    left = remaining()
+    if left is None:
+        return default
+    left = max(left, 0.001)
+    return left if default is None else min(default, left)
+
+
+def set_budget(seconds: float = None):
+    """Start the deadline `seconds` from now (no-op for None); an earlier deadline wins."""
+    if seconds is None:
+        return None
+    current = deadline.get()
+    new = time.monotonic() + seconds
+    return deadline.set(new if current is None else min(current, new))
+
+
+@contextlib.contextmanager
+def time_budget(seconds: float = None):
+    """Run the enclosed block with at most `seconds` (None = inherit the current deadline)."""
+    token = set_budget(seconds)
+    try:
+        yield
+    finally:
+        if token is not None:
+            deadline.reset(token)
+
+
+def budget_from_request(headers, form) -> float:
+    """Time budget in seconds from the 'X-Time-Budget' header or 'time_budget' form field."""
+    raw = headers.get("X-Time-Budget") or form.get("time_budget")
+    if raw in (None, ""):
+        return DEFAULT_TIME_BUDGET
+    try:
+        seconds = float(raw)
+    except ValueError:
+        raise ValueError(f"Invalid time budget: {raw!r}")
+    if not math.isfinite(seconds):
+        raise ValueError(f"Invalid time budget: {raw!r}")
+    if seconds <= 0:
+        raise ValueError("Time budget must be positive")
+    return min(seconds, MAX_TIME_BUDGET)
+
+
+def wait_until_deadline(futures, grace: float = 0.0):
+    """
+    Wait for futures until the deadline (plus `grace`), then cancel the ones
+    that have not started. Returns (done, not_done) like concurrent.futures.wait.
+    """
+    left = remaining()
+    timeout = None if left is None else max(left + grace, 0)
+    done, not_done = concurrent.futures.wait(futures, timeout=timeout)
+    for future in not_done:
+        future.cancel()
+    return done, not_done
@@ -0,0 +1,96 @@
+"""
+Dynamic micro-batching for sentence embeddings.
+
+Scorer threads call EmbeddingModel.embed with a handful of texts each. Instead of
+running one `encode` per call (with the torch threads of every call contending),
+requests are queued to a single dispatcher thread which waits up to
+`max_wait_ms` for more requests (or until `max_batch_size` texts are gathered),
+encodes the union of their texts once and hands every caller its own rows.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List
+
+import numpy as np
+
+
+class _Request:
+    __slots__ = ("texts", "future")
+
+    def __init__(self, texts: List[str]):
+        self.texts = list(texts)
+        self.future = Future()
+
+
+class EmbeddingBatcher:
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray], max_batch_size: int = 256, max_wait_ms: float = 5.0):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.stats = {"requests": 0, "batches": 0, "texts": 0}
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # The dispatcher thread does not survive a fork, so restart it in the child.
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        self._ensure_started()
+        request = _Request(texts)
+        self._queue.put(request)
+        return request.future
+
+    def encode(self, texts: List[str], timeout: float = None) -> np.ndarray:
+        """Blocking helper: submit and wait for this caller's slice of the batch."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self.submit(texts).result(timeout=timeout)
+
+    def _run(self):
+        pending = self._queue
+        while True:
+            batch = [pending.get()]
+            size = len(batch[0].texts)
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request.texts)
+            self._process(batch)
+
+    def _process(self, batch: List[_Request]):
+        # Encode every distinct text once, then slice rows back per request
+        index = {}
+        for request in batch:
+            for text in request.texts:
+                index.setdefault(text, len(index))
+        try:
+            vectors = np.asarray(self.encode_fn(list(index.keys())))
+        except BaseException as err:
+            for request in batch:
+                request.future.set_exception(err)
+            return
+
+        self.stats["requests"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["texts"] += len(index)
+        for request in batch:
+            rows = [index[text] for text in request.texts]
+            request.future.set_result(vectors[rows])
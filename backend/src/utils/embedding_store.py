@@ -0,0 +1,358 @@
+"""
+Compressed storage and search for embedding matrices (cosine similarity).
+
+Codecs, all operating on unit-normalized rows:
+
+    float32   the vectors as-is (4 bytes / dim)
+    float16   half precision (2 bytes / dim)
+    int8      scalar quantization with one scale per vector (1 byte / dim + 4)
+    pq        product quantization: m subspaces, 256 centroids each (m bytes / vector);
+              the smallest codes, but a coarse ranking on its own, so search()
+              re-scores a wider pool of candidates (20k instead of 4k)
+
+Scores are computed directly on the codes (queries stay float32, PQ uses a
+per-query lookup table), and search() re-scores the best candidates against
+the full-precision rows, which callers typically keep on disk (np.load with
+mmap_mode="r") so only the codes are resident.
+
+Reference run of the default report below (19800 synthetic vectors, 200 queries,
+recall@10, 1 CPU; "rerank" is recall after search() re-scoring):
+
+    codec     B/vec  recall  rerank   ms/q
+    float32  1536.0  1.0000  1.0000   2.87
+    float16   768.0  0.9955  1.0000   2.83
+    int8      388.0  0.9500  1.0000   2.92
+    pq         67.9  0.1505  1.0000   4.51
+
+Run as a script for a recall report of every codec against uncompressed search:
+
+    python src/utils/embedding_store.py --catalog          # catalog description embeddings
+    python src/utils/embedding_store.py --synthetic 50000  # clustered random vectors
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+import argparse
+import json
+import time
+from typing import Dict, List, Sequence
+
+import numpy as np
+from scipy import sparse
+
+from src.config import CATALOG_PQ_SUBSPACES, CATALOG_PQ_TRAIN_SIZE
+
+CODECS = ("float32", "float16", "int8", "pq")
+# Rows scored per block, bounds the temporaries of decoding / table lookups
+SCORE_BLOCK = 16384
+
+
+def unit_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class Float32Codec:
+    name = "float32"
+    rerank_factor = 4   # search() re-scores rerank_factor * k candidates by default
+
+    def fit(self, vectors: np.ndarray) -> "Float32Codec":
+        return self
+
+    @property
+    def trained(self) -> bool:
+        return True
+
+    def encode(self, vectors: np.ndarray):
+        return unit_rows(vectors)
+
+    def decode(self, codes) -> np.ndarray:
+        return np.asarray(codes, dtype=np.float32)
+
+    def scores(self, queries: np.ndarray, codes) -> np.ndarray:
+        """(Q, N) approximate cosine similarity of float32 queries to encoded rows."""
+        queries = unit_rows(queries)
+        n = self.size(codes)
+        out = np.empty((len(queries), n), dtype=np.float32)
+        for lo in range(0, n, SCORE_BLOCK):
+            out[:, lo:lo + SCORE_BLOCK] = queries @ self.decode(self.take(codes, slice(lo, lo + SCORE_BLOCK))).T
+        return out
+
+    # Code arrays are plain ndarrays unless a codec says otherwise
+    def size(self, codes) -> int:
+        return len(codes)
+
+    def take(self, codes, index):
+        return codes[index]
+
+    def concat(self, parts: List):
+        return np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+
+    def nbytes(self, codes) -> int:
+        return int(codes.nbytes)
+
+
+class Float16Codec(Float32Codec):
+    name = "float16"
+
+    def encode(self, vectors: np.ndarray):
+        return unit_rows(vectors).astype(np.float16)
+
+    def concat(self, parts: List):
+        return np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float16)
+
+
+class Int8Codec(Float32Codec):
+    """Symmetric per-vector scalar quantization: codes (N, d) int8 and scales (N,) float32."""
+    name = "int8"
+
+    def encode(self, vectors: np.ndarray):
+        vectors = unit_rows(vectors)
+        scale = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        codes = np.clip(np.rint(vectors / scale[:, None]), -127, 127).astype(np.int8)
+        return codes, scale.astype(np.float32)
+
+    def decode(self, codes) -> np.ndarray:
+        values, scale = codes
+        return values.astype(np.float32) * scale[:, None]
+
+    def size(self, codes) -> int:
+        return len(codes[0])
+
+    def take(self, codes, index):
+        return codes[0][index], codes[1][index]
+
+    def concat(self, parts: List):
+        if not parts:
+            return np.zeros((0, 0), dtype=np.int8), np.zeros(0, dtype=np.float32)
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+    def nbytes(self, codes) -> int:
+        return int(codes[0].nbytes + codes[1].nbytes)
+
+
+class PQCodec(Float32Codec):
+    """
+    Product quantization: each vector is split into `subspaces` chunks and every
+    chunk is replaced by the id of its nearest of up to 256 centroids. Scores
+    are sums of per-query lookup tables (asymmetric distance computation).
+    """
+    name = "pq"
+    rerank_factor = 20
+
+    def __init__(self, subspaces: int = CATALOG_PQ_SUBSPACES, centroids: int = 256, iterations: int = 15, seed: int = 0):
+        self.subspaces = subspaces
+        self.centroids = centroids
+        self.iterations = iterations
+        self.seed = seed
+        self.codebooks = None   # (m, k, d / m)
+        self.trained_on = 0     # size of the training set (set by callers that track their own)
+
+    @property
+    def trained(self) -> bool:
+        return self.codebooks is not None
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        n, d = vectors.shape
+        if d % self.subspaces:
+            raise ValueError(f"Dimension {d} is not divisible into {self.subspaces} PQ subspaces")
+        return vectors.reshape(n, self.subspaces, d // self.subspaces)
+
+    def fit(self, vectors: np.ndarray) -> "PQCodec":
+        """Train the codebooks with k-means on (a sample of) `vectors`."""
+        rng = np.random.default_rng(self.seed)
+        vectors = unit_rows(vectors)
+        self.trained_on = len(vectors)
+        if len(vectors) > CATALOG_PQ_TRAIN_SIZE:
+            vectors = vectors[rng.choice(len(vectors), CATALOG_PQ_TRAIN_SIZE, replace=False)]
+        sub = self._split(vectors)
+        k = max(1, min(self.centroids, len(vectors)))
+        codebooks = np.zeros((self.subspaces, k, sub.shape[2]), dtype=np.float32)
+        for j in range(self.subspaces):
+            x = sub[:, j, :]
+            centers = x[rng.choice(len(x), k, replace=False)].copy()
+            for _ in range(self.iterations):
+                assign = self._nearest(x, centers)
+                sums = np.zeros_like(centers)
+                np.add.at(sums, assign, x)
+                counts = np.bincount(assign, minlength=k)
+                filled = counts > 0
+                centers[filled] = sums[filled] / counts[filled, None]
+            codebooks[j] = centers
+        self.codebooks = codebooks
+        return self
+
+    @staticmethod
+    def _nearest(x: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        distances = (x * x).sum(1)[:, None] - 2 * x @ centers.T + (centers * centers).sum(1)[None, :]
+        return distances.argmin(axis=1)
+
+    def encode(self, vectors: np.ndarray):
+        if not self.trained:
+            raise RuntimeError("PQ codec is not trained")
+        sub = self._split(unit_rows(vectors))
+        codes = np.zeros((len(sub), self.subspaces), dtype=np.uint8)
+        for j in range(self.subspaces):
+            codes[:, j] = self._nearest(sub[:, j, :], self.codebooks[j])
+        return codes
+
+    def decode(self, codes) -> np.ndarray:
+        parts = [self.codebooks[j][codes[:, j]] for j in range(self.subspaces)]
+        return np.concatenate(parts, axis=1) if parts else np.zeros((len(codes), 0), dtype=np.float32)
+
+    def scores(self, queries: np.ndarray, codes) -> np.ndarray:
+        queries = self._split(unit_rows(queries))
+        # (Q, m, k): dot product of every query chunk with every centroid
+        tables = np.einsum("qmd,mkd->qmk", queries, self.codebooks)
+        k = tables.shape[2]
+        tables = tables.reshape(len(queries), -1)
+        offsets = np.arange(self.subspaces) * k
+        n = len(codes)
+        out = np.zeros((len(queries), n), dtype=np.float32)
+        for lo in range(0, n, SCORE_BLOCK):
+            chunk = codes[lo:lo + SCORE_BLOCK]
+            # All table lookups of the block as one sparse product: row i has a 1 at
+            # j * k + code[i, j] for every subspace j
+            onehot = sparse.csr_matrix(
+                (np.ones(chunk.size, dtype=np.float32), (chunk.astype(np.intp) + offsets).ravel(),
+                 np.arange(0, chunk.size + 1, self.subspaces)),
+                shape=(len(chunk), tables.shape[1]))
+            out[:, lo:lo + len(chunk)] = (onehot @ tables.T).T
+        return out
+
+    def concat(self, parts: List):
+        return np.concatenate(parts) if parts else np.zeros((0, self.subspaces), dtype=np.uint8)
+
+    def save(self, path):
+        """Write the codebooks to a path or an open binary file."""
+        np.savez(path, codebooks=self.codebooks, subspaces=self.subspaces, trained_on=self.trained_on)
+
+    def load(self, path: str) -> "PQCodec":
+        data = np.load(path, allow_pickle=False)
+        self.codebooks = data["codebooks"]
+        self.subspaces = int(data["subspaces"])
+        self.trained_on = int(data["trained_on"])
+        return self
+
+
+def make_codec(name: str):
+    codecs = {"float32": Float32Codec, "float16": Float16Codec, "int8": Int8Codec, "pq": PQCodec}
+    if name not in codecs:
+        raise ValueError(f"Unknown embedding codec '{name}' (expected one of {', '.join(CODECS)})")
+    return codecs[name]()
+
+
+def search(codec, codes, full: np.ndarray, queries: np.ndarray, k: int, rerank: int = None):
+    """
+    Top-k rows for every query: candidates by score on the codes, then the best
+    `rerank` of them (default codec.rerank_factor * k) re-scored against the
+    full-precision rows. Returns (indices (Q, k), scores (Q, k)), best first.
+    """
+    approx = codec.scores(queries, codes)
+    n = approx.shape[1]
+    k = min(k, n)
+    rerank = min(n, max(k, rerank if rerank is not None else codec.rerank_factor * k))
+    candidates = np.argpartition(-approx, rerank - 1, axis=1)[:, :rerank]
+    queries = unit_rows(queries)
+    indices = np.zeros((len(queries), k), dtype=np.int64)
+    scores = np.zeros((len(queries), k), dtype=np.float32)
+    for qi, rows in enumerate(candidates):
+        rows = np.sort(rows)   # sequential reads from a memory-mapped matrix
+        exact = unit_rows(full[rows]) @ queries[qi]
+        best = np.argsort(-exact, kind="stable")[:k]
+        indices[qi], scores[qi] = rows[best], exact[best]
+    return indices, scores
+
+
+# ---------------------------------------------------------
+# Recall report
+# ---------------------------------------------------------
+def recall_report(vectors: np.ndarray, queries: np.ndarray, k: int = 10, rerank: int = None,
+                  codecs: Sequence[str] = CODECS) -> List[Dict]:
+    """
+    Compare every codec with exact float32 search: recall@k of the ranking on
+    the codes alone and after full-precision re-scoring, score error, memory
+    and query time.
+    """
+    base = unit_rows(vectors)
+    exact = unit_rows(queries) @ base.T
+    k = min(k, len(base))
+    truth = np.argsort(-exact, axis=1, kind="stable")[:, :k]
+    rows = []
+    for name in codecs:
+        codec = make_codec(name)
+        t = time.time()
+        codec.fit(base)
+        codes = codec.encode(base)
+        build = time.time() - t
+
+        t = time.time()
+        approx = codec.scores(queries, codes)
+        raw = np.argsort(-approx, axis=1, kind="stable")[:, :k]
+        found, _ = search(codec, codes, base, queries, k, rerank)
+        elapsed = time.time() - t
+
+        def recall(result):
+            return float(np.mean([len(set(r) & set(t)) / k for r, t in zip(result, truth)]))
+
+        nbytes = codec.nbytes(codes) + (codec.codebooks.nbytes if name == "pq" else 0)
+        rows.append({
+            "codec": name,
+            "bytes_per_vector": round(nbytes / max(1, len(base)), 1),
+            "compression": round(base.nbytes / max(1, nbytes), 1),
+            "recall_codes": round(recall(raw), 4),
+            "recall_reranked": round(recall(found), 4),
+            "mean_abs_error": float(np.abs(approx - exact).mean()),
+            "build_sec": round(build, 3),
+            "ms_per_query": round(1000 * elapsed / max(1, len(queries)), 3),
+        })
+    return rows
+
+
+def print_report(rows: List[Dict], n: int, k: int):
+    print(f"\n📊 Embedding codecs vs exact float32 search ({n} vectors, recall@{k})")
+    print(f"{'codec':<8} {'B/vec':>8} {'ratio':>6} {'recall':>8} {'rerank':>8} {'|err|':>8} {'ms/q':>8}")
+    for r in rows:
+        print(f"{r['codec']:<8} {r['bytes_per_vector']:>8} {r['compression']:>6} {r['recall_codes']:>8.4f} "
+              f"{r['recall_reranked']:>8.4f} {r['mean_abs_error']:>8.4f} {r['ms_per_query']:>8}")
+
+
+def _synthetic(n: int, dim: int = 384, clusters: int = 200, seed: int = 0) -> np.ndarray:
+    # Clustered like real field descriptions (many near-duplicates per concept)
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    return centers[rng.integers(0, clusters, n)] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall report of compressed embedding codecs")
+    parser.add_argument("--catalog", action="store_true", help="use the field catalog's description embeddings")
+    parser.add_argument("--synthetic", type=int, default=20000, help="number of synthetic vectors otherwise")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rerank", type=int, default=None, help="candidates re-scored at full precision (default 4k, 20k for pq)")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    if args.catalog:
+        from src.utils.field_catalog import FieldCatalog
+        catalog = FieldCatalog()
+        vectors = np.concatenate([catalog.features(e["hash"]).desc_embeddings
+                                  for e in catalog.list(all_versions=True)] or [np.zeros((0, 384), np.float32)])
+    else:
+        vectors = _synthetic(args.synthetic)
+    if len(vectors) <= args.queries:
+        sys.exit("❌ Not enough vectors for a report")
+    # Held-out queries, so no query finds itself
+    rng = np.random.default_rng(1)
+    held_out = rng.choice(len(vectors), args.queries, replace=False)
+    mask = np.ones(len(vectors), dtype=bool)
+    mask[held_out] = False
+    report = recall_report(vectors[mask], vectors[held_out], args.k, args.rerank)
+    print_report(report, int(mask.sum()), args.k)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,332 @@
+"""
+Offline evaluation harness for the scorer weights used in get_data_mapping.
+
+Ground truth comes from the `approvedMappings` saved in data/mappings.json.
+Approved target keys are ranked against the full source schema (and described
+with the example values) as registered in the field catalog, so register the
+messages first for a realistic score. The expensive part (descriptions,
+synonyms, embeddings) is computed once per source/target message pair and
+cached as a component-score tensor of shape (targets x sources x components).
+Any number of weight vectors can then be evaluated against that tensor with
+plain NumPy.
+
+Usage:
+    python src/utils/evaluation.py --step 0.05 --k 3
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+import argparse
+import hashlib
+import json
+import time
+from collections import defaultdict
+from itertools import combinations
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from src.config import SCORE_WEIGHTS, SCORE_COMPONENTS
+from src.utils.llm_scheduler import priority, BULK
+
+DATA_DIR = Path(__file__).resolve().parents[2] / "data"
+MAPPINGS_FILE = DATA_DIR / "mappings.json"
+CACHE_DIR = DATA_DIR / "eval_cache"
+
+
+def split_key(full_key: str) -> Tuple[str, str]:
+    """Split a saved key like 'ADP-M-CODACO::SealNumber' into (message, field)."""
+    if "::" in full_key:
+        message, field = full_key.split("::", 1)
+        return message, field
+    return "", full_key
+
+
+def load_ground_truth(mappings_file: Path = MAPPINGS_FILE) -> Dict[Tuple[str, str], Dict[str, set]]:
+    """
+    Group approved mappings by (source message, target message).
+    Returns {(src_msg, tgt_msg): {target_field: {source_field, ...}}}
+    """
+    with open(mappings_file, "r", encoding="utf-8") as f:
+        saved = json.load(f)
+
+    truth = defaultdict(lambda: defaultdict(set))
+    for mapping in saved:
+        for approved in mapping.get("approvedMappings", []):
+            src_msg, src_field = split_key(approved.get("sourceKey", ""))
+            tgt_msg, tgt_field = split_key(approved.get("targetKey", ""))
+            if src_field and tgt_field:
+                truth[(src_msg, tgt_msg)][tgt_field].add(src_field)
+    return {pair: dict(fields) for pair, fields in truth.items()}
+
+
+# -------------------------------------------------------------
+# Component tensors
+# -------------------------------------------------------------
+# Scorer call behind each component: fuzzy and semantic come from one call, so a
+# subset of components costs the sum of the distinct scorers it needs.
+COMPONENT_SCORERS = {"fuzzy": "token", "semantic": "token", "synonym": "synonym", "llm_score": "llm", "value": "value"}
+SCORERS = tuple(dict.fromkeys(COMPONENT_SCORERS.values()))
+
+
+def _cache_path(source_fields: Dict, target_fields: Dict) -> Path:
+    digest = hashlib.sha256(
+        json.dumps([list(source_fields.items()), list(target_fields.items()), list(SCORE_COMPONENTS)],
+                   default=str).encode("utf-8")
+    ).hexdigest()[:16]
+    return CACHE_DIR / f"components_{digest}.npz"
+
+
+def compute_component_tensor(source_fields: Dict, target_fields: Dict) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    Run every scorer once over the full target x source grid, as get_score_tensor
+    does: descriptions are generated from the keys with their example values.
+    Returns the (T, S, C) tensor and the wall-clock cost in seconds per scorer (SCORERS).
+    """
+    # Imported lazily: loading the models is only needed on a cache miss.
+    from src.utils.mapping_methods import (
+        llm_descriptions_similarity, generate_description_format, token_similarity_scores,
+        synonym_coverage_score, tokenize_key, normalize, abbreviation_like, emb, groq,
+    )
+    from src.utils.value_profile import field_profile_scores
+
+    source_keys, target_keys = list(source_fields), list(target_fields)
+    costs = {name: 0.0 for name in SCORERS}
+
+    t = time.time()
+    descriptions, format_info = generate_description_format({**source_fields, **target_fields})
+    costs["llm"] += time.time() - t
+    if descriptions is None:
+        raise RuntimeError(f"Description generation failed: {format_info}")
+
+    # Warm the synonym cache up front so its network cost is measured on its own.
+    t = time.time()
+    if groq is not None:
+        abbrev = {normalize(tok) for key in target_keys for tok in tokenize_key(key)}
+        groq.get_all_synonyms(list(abbreviation_like(abbrev)))
+    costs["synonym"] += time.time() - t
+
+    index = {name: i for i, name in enumerate(SCORE_COMPONENTS)}
+    tensor = np.zeros((len(target_keys), len(source_keys), len(SCORE_COMPONENTS)), dtype=np.float32)
+    for ti, tgt_key in enumerate(target_keys):
+        # Same argument order as compute_score(tgt_key, src_key, ...) in the pipeline
+        t_tokens = tokenize_key(tgt_key)
+        for si, src_key in enumerate(source_keys):
+            s_tokens = tokenize_key(src_key)
+            if t_tokens and s_tokens:
+                t = time.time()
+                fuzzy, semantic = token_similarity_scores(t_tokens, s_tokens, emb)
+                costs["token"] += time.time() - t
+                t = time.time()
+                synonym = synonym_coverage_score(t_tokens, s_tokens, groq)
+                costs["synonym"] += time.time() - t
+                tensor[ti, si, index["fuzzy"]] = fuzzy
+                tensor[ti, si, index["semantic"]] = semantic
+                tensor[ti, si, index["synonym"]] = synonym
+            t = time.time()
+            tensor[ti, si, index["llm_score"]] = llm_descriptions_similarity(tgt_key, src_key, descriptions, emb)
+            costs["llm"] += time.time() - t
+
+    t = time.time()
+    tensor[:, :, index["value"]] = field_profile_scores(source_fields, target_fields)
+    costs["value"] += time.time() - t
+    return tensor, costs
+
+
+def load_or_compute(source_fields: Dict, target_fields: Dict, refresh: bool = False):
+    """Return (tensor, costs) for a field grid, using the on-disk cache when possible."""
+    path = _cache_path(source_fields, target_fields)
+    if path.exists() and not refresh:
+        cached = np.load(path)
+        costs = dict(zip(SCORERS, cached["costs"].tolist()))
+        return cached["tensor"], costs
+
+    tensor, costs = compute_component_tensor(source_fields, target_fields)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(
+        path,
+        tensor=tensor,
+        costs=np.array([costs[name] for name in SCORERS]),
+        source_keys=np.array(list(source_fields)),
+        target_keys=np.array(list(target_fields)),
+    )
+    return tensor, costs
+
+
+def registered_fields(catalog, message: str) -> Dict[str, str]:
+    """{key: example value} of the latest catalog version of a message ({} if not registered)."""
+    if catalog is None or not message:
+        return {}
+    entries = catalog.list({"message_name": message})
+    if not entries:
+        return {}
+    schema = catalog.schema(entries[0]["hash"])
+    return dict(zip(schema["keys"], schema["values"]))
+
+
+def build_dataset(truth: Dict[Tuple[str, str], Dict[str, set]], refresh: bool = False, catalog=None):
+    """
+    Build one evaluation problem per message pair.
+
+    Every approved target key is ranked against the full source schema from the
+    field catalog, so wrong candidates that were never approved compete as they
+    do in production; example values come from the catalog as well. Messages not
+    in the catalog fall back to the approved keys without example values.
+    Returns a list of (tensor, truth_mask, costs) where truth_mask is (T, S) bool.
+    """
+    problems = []
+    for (src_msg, tgt_msg), fields in truth.items():
+        source_schema = registered_fields(catalog, src_msg)
+        target_schema = registered_fields(catalog, tgt_msg)
+        approved_sources = sorted({src for srcs in fields.values() for src in srcs})
+        if not source_schema:
+            print(f"⚠️ {src_msg} is not in the catalog: ranking against its {len(approved_sources)} approved keys only")
+        source_fields = dict(source_schema)
+        # Approved keys missing from the registered version still take part
+        source_fields.update({k: "" for k in approved_sources if k not in source_fields})
+        target_fields = {k: target_schema.get(k, "") for k in sorted(fields.keys())}
+        tensor, costs = load_or_compute(source_fields, target_fields, refresh=refresh)
+
+        src_index = {k: i for i, k in enumerate(source_fields)}
+        mask = np.zeros((len(target_fields), len(source_fields)), dtype=bool)
+        for ti, tgt_key in enumerate(target_fields):
+            for src_key in fields[tgt_key]:
+                mask[ti, src_index[src_key]] = True
+        problems.append((tensor, mask, costs))
+        print(f"✅ {src_msg} -> {tgt_msg}: {len(target_fields)} targets x {len(source_fields)} sources")
+    return problems
+
+
+def active_components(problems) -> List[int]:
+    """Indices of the components that are non-zero somewhere (e.g. "value" needs example values)."""
+    return [ci for ci in range(len(SCORE_COMPONENTS))
+            if any(tensor[:, :, ci].any() for tensor, _, _ in problems)]
+
+
+# -------------------------------------------------------------
+# Vectorized evaluation
+# -------------------------------------------------------------
+def truth_ranks(tensor: np.ndarray, mask: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Rank (0 = best) of the best-scoring correct source for every target,
+    for every weight vector. weights is (N, C); returns (N, T).
+    Ties are ranked pessimistically: a wrong source scoring the same as the
+    correct one counts as ranked above it, so a weight vector that cannot
+    tell the candidates apart gets no credit.
+    """
+    scores = np.einsum("tsc,nc->nts", tensor, weights, optimize=True)
+    truth_best = np.where(mask[None], scores, -np.inf).max(axis=-1)
+    return ((scores >= truth_best[..., None]) & ~mask[None]).sum(axis=-1)
+
+
+def evaluate_weights(problems, weights: np.ndarray, k: int = 3, chunk_size: int = 2048) -> Dict[str, np.ndarray]:
+    """
+    Top-1 and top-k accuracy over all problems for each row of `weights`.
+    Returns {"top1": (N,), "topk": (N,)}.
+    """
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float32))
+    hits1 = np.zeros(len(weights))
+    hitsk = np.zeros(len(weights))
+    total = 0
+    for tensor, mask, _ in problems:
+        if not mask.any():
+            continue
+        total += int(mask.any(axis=1).sum())
+        for start in range(0, len(weights), chunk_size):
+            ranks = truth_ranks(tensor, mask, weights[start:start + chunk_size])
+            ranks = ranks[:, mask.any(axis=1)]
+            hits1[start:start + chunk_size] += (ranks < 1).sum(axis=1)
+            hitsk[start:start + chunk_size] += (ranks < k).sum(axis=1)
+    total = max(total, 1)
+    return {"top1": hits1 / total, "topk": hitsk / total}
+
+
+def simplex_grid(n_components: int, step: float) -> np.ndarray:
+    """All weight vectors on the probability simplex with the given step size."""
+    n = int(round(1.0 / step))
+    rows = []
+
+    def _fill(prefix, remaining, slots):
+        if slots == 1:
+            rows.append(prefix + [remaining])
+            return
+        for i in range(remaining + 1):
+            _fill(prefix + [i], remaining - i, slots - 1)
+
+    _fill([], n, n_components)
+    return np.array(rows, dtype=np.float32) / n
+
+
+def sweep(problems, step: float = 0.05, k: int = 3) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Evaluate every weight vector on the simplex grid over the active components;
+    components without any signal keep weight 0 instead of diluting the grid.
+    """
+    active = active_components(problems)
+    grid = np.zeros((0, len(SCORE_COMPONENTS)), dtype=np.float32)
+    if active:
+        sub = simplex_grid(len(active), step)
+        grid = np.zeros((len(sub), len(SCORE_COMPONENTS)), dtype=np.float32)
+        grid[:, active] = sub
+    return grid, evaluate_weights(problems, grid, k=k)
+
+
+def component_tradeoffs(problems, grid: np.ndarray, results: Dict[str, np.ndarray]) -> List[Dict]:
+    """
+    For every subset of the active components, the best top-1 accuracy reachable
+    using only that subset, together with the measured cost of the scorers it needs.
+    """
+    costs = defaultdict(float)
+    for _, _, problem_costs in problems:
+        for name, secs in problem_costs.items():
+            costs[name] += secs
+
+    active = active_components(problems)
+    rows = []
+    for size in range(1, len(active) + 1):
+        for subset in combinations(active, size):
+            dropped = [i for i in range(len(SCORE_COMPONENTS)) if i not in subset]
+            allowed = (grid[:, dropped] == 0).all(axis=1) if dropped else np.ones(len(grid), dtype=bool)
+            best = int(np.argmax(np.where(allowed, results["top1"], -1.0)))
+            rows.append({
+                "components": [SCORE_COMPONENTS[i] for i in subset],
+                "weights": dict(zip(SCORE_COMPONENTS, grid[best].round(3).tolist())),
+                "top1": float(results["top1"][best]),
+                "topk": float(results["topk"][best]),
+                "cost_sec": float(sum(costs[name] for name in {COMPONENT_SCORERS[SCORE_COMPONENTS[i]] for i in subset})),
+            })
+    return sorted(rows, key=lambda r: (-r["top1"], r["cost_sec"]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evaluate scorer weights against approved mappings.")
+    parser.add_argument("--step", type=float, default=0.05, help="simplex grid step for the weight sweep")
+    parser.add_argument("--k", type=int, default=3, help="k for top-k accuracy")
+    parser.add_argument("--refresh", action="store_true", help="recompute cached component tensors")
+    args = parser.parse_args()
+
+    from src.utils.field_catalog import FieldCatalog
+    # Offline run: yield LLM quota to interactive mapping requests
+    with priority(BULK):
+        problems = build_dataset(load_ground_truth(), refresh=args.refresh, catalog=FieldCatalog())
+    inactive = [name for i, name in enumerate(SCORE_COMPONENTS) if i not in active_components(problems)]
+    if inactive:
+        print(f"⚠️ No signal for {', '.join(inactive)} (e.g. no example values): left out of the sweep")
+
+    current = np.array([[SCORE_WEIGHTS[name] for name in SCORE_COMPONENTS]])
+    baseline = evaluate_weights(problems, current, k=args.k)
+    print(f"Current weights {SCORE_WEIGHTS}: top1={baseline['top1'][0]:.3f} top{args.k}={baseline['topk'][0]:.3f}")
+
+    t = time.time()
+    grid, results = sweep(problems, step=args.step, k=args.k)
+    print(f"✅ Evaluated {len(grid)} weight configurations in {time.time() - t:.2f} sec")
+
+    best = int(np.argmax(results["top1"] + 1e-3 * results["topk"]))
+    print(f"Best weights {dict(zip(SCORE_COMPONENTS, grid[best].round(3).tolist()))}: "
+          f"top1={results['top1'][best]:.3f} top{args.k}={results['topk'][best]:.3f}")
+
+    print("\nComponent subsets (best reachable accuracy vs. measured cost):")
+    for row in component_tradeoffs(problems, grid, results):
+        print(f"  {'+'.join(row['components']):<38} top1={row['top1']:.3f} "
+              f"top{args.k}={row['topk']:.3f} cost={row['cost_sec']:.2f}s weights={row['weights']}")
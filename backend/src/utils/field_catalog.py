@@ -0,0 +1,719 @@
+"""
+Persistent catalog of registered message schemas with precomputed field features.
+
+Every registered schema (e.g. ADP-M-CODACO) is stored under CATALOG_DIR in a
+directory named after its content hash, so re-registering an unchanged file is
+a no-op and a changed file becomes a new version of the same message:
+
+    <hash>/schema.json             keys, example values, tokens, LLM descriptions + formats
+    <hash>/desc_embeddings.npy     "key: description" embeddings, one row per field
+    <hash>/token_embeddings.npy    embeddings of the schema's unique key tokens
+    <hash>/features.npz            value profiles (with column statistics for profiled extracts)
+    index.json                     {hash: summary} of every registered version (rebuilt
+                                   from the <hash>/ directories if missing or unreadable)
+    pq-<kind>.npz                  PQ codebooks (with CATALOG_EMBEDDING_CODEC = "pq")
+
+match_features() scores one new (target) schema against any number of catalog
+schemas in one batched pass: the token, synonym and value components are
+computed as matrices over the unique tokens of both sides, and the
+description similarity is evaluated as a cascade (see refine_score_tensor) so
+only the candidates that can still reach the top_k pay for the string match.
+Only the new side's features are computed; the catalog side is read from disk.
+
+Catalog embeddings are held in memory as CATALOG_EMBEDDING_CODEC codes (see
+embedding_store.py) and scored on the codes; the full-precision matrices are
+memory-mapped from disk and only read to re-score the pairs the cascade evaluates.
+The cascade bound is padded by each row's code error, so the evaluated top_k is
+the same as with float32 codes; pairs outside it keep their approximate scores.
+PQ codebooks are trained by train_codecs() after registration, not while matching.
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+import hashlib
+import json
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.config import CATALOG_DIR, CATALOG_EMBEDDING_CODEC, CATALOG_PQ_TRAIN_SIZE, SCORE_WEIGHTS, PREVIEW_WEIGHTS
+from src.utils.mapping_methods import *
+from src.utils.score_tensor import ScoreTensor
+from src.utils.value_profile import COLUMN_STATS, profile_fields, profile_similarity
+from src.utils.deadline import DeadlineExceeded, expired
+from src.utils.request_context import record_stage
+from src.utils.embedding_store import Float32Codec, make_codec, unit_rows
+from src.utils.atomic_file import file_stat, locked, replacing, write_json
+
+# Summary fields kept in index.json and filterable in list()
+CATALOG_FIELDS = ("message_name", "country", "domain", "system")
+
+
+def schema_hash(fields: Dict) -> str:
+    """Content hash of a field dict (keys and example values, order-independent)."""
+    canonical = json.dumps(sorted([str(k), str(v)] for k, v in fields.items()), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def _code_error(codec, vectors, codes) -> np.ndarray:
+    """
+    (N,) distance of every unit-normalized row to its decoded code: the largest
+    error of its cosine score against any unit query (Cauchy-Schwarz).
+    """
+    if vectors is None or not len(vectors):
+        return np.zeros(0, dtype=np.float32)
+    return np.linalg.norm(unit_rows(vectors) - codec.decode(codes), axis=1).astype(np.float32)
+
+
+def _embed(texts: List[str]) -> np.ndarray:
+    if not texts:
+        return np.zeros((0, 384), dtype=np.float32)
+    return np.asarray(emb.embed(texts), dtype=np.float32).reshape(len(texts), -1)
+
+
+class SchemaFeatures:
+    """Per-field features of one schema, as computed by the pair scorers."""
+
+    def __init__(self, keys, values, tokens, norm_tokens, descriptions, formats,
+                 vocab, token_embeddings, desc_embeddings, profile):
+        self.keys = list(keys)
+        self.values = list(values)
+        self.tokens = tokens                  # tokenize_key(key) per field
+        self.norm_tokens = norm_tokens        # normalize()d tokens per field (synonym scorer)
+        self.descriptions = descriptions      # {key: description} or None if not described
+        self.formats = formats                # {key: format info} from the description call
+        self.vocab = list(vocab)              # unique raw tokens, rows of token_embeddings
+        self.token_embeddings = token_embeddings
+        self.desc_embeddings = desc_embeddings
+        self.profile = profile                # profile_fields(fields)
+        # In-memory codes of the embeddings (see encode); None until encoded
+        self.token_codec = self.desc_codec = None
+        self.token_codes = self.desc_codes = None
+        self.token_error = self.desc_error = None   # per-row norm of (embedding - decoded code)
+
+    @property
+    def described(self) -> bool:
+        return self.descriptions is not None
+
+    def encode(self, token_codec, desc_codec) -> "SchemaFeatures":
+        """Encode the embeddings for scoring on the codes."""
+        self.token_codec, self.desc_codec = token_codec, desc_codec
+        self.token_codes = token_codec.encode(self.token_embeddings)
+        self.token_error = _code_error(token_codec, self.token_embeddings, self.token_codes)
+        if self.described:
+            self.desc_codes = desc_codec.encode(self.desc_embeddings)
+            self.desc_error = _code_error(desc_codec, self.desc_embeddings, self.desc_codes)
+        return self
+
+    def desc_texts(self) -> List[str]:
+        return [f"{key}: {self.descriptions.get(key, key)}".lower().strip() for key in self.keys]
+
+    @classmethod
+    def compute(cls, fields: Dict, describe: bool = True) -> "SchemaFeatures":
+        """
+        Compute the features of a field dict. With describe=True the LLM
+        descriptions are generated as well (RuntimeError if that fails,
+        DeadlineExceeded if the request ran out of time).
+        """
+        keys = list(fields.keys())
+        values = list(fields.values())
+        tokens = [tokenize_key(key) for key in keys]
+        norm_tokens = [[normalize(t) for t in toks] for toks in tokens]
+        vocab = sorted({t for toks in tokens for t in toks})
+        descriptions, formats = None, {}
+        if describe:
+            descriptions, format_info = generate_description_format(fields)
+            if descriptions is None:
+                raise RuntimeError(f"Description generation failed: {format_info}")
+            formats = {key: format_info.get(key) for key in keys if isinstance(format_info, dict) and key in format_info}
+        features = cls(keys, values, tokens, norm_tokens, descriptions, formats,
+                       vocab, _embed(vocab), None, profile_fields(fields))
+        if describe:
+            features.desc_embeddings = _embed(features.desc_texts())
+        return features
+
+    # ---------------------------------------------------------
+    # Persistence
+    # ---------------------------------------------------------
+    def save(self, path: str, summary: Dict):
+        with open(os.path.join(path, "schema.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                **summary,
+                "keys": self.keys,
+                "values": [str(v) for v in self.values],
+                "tokens": self.tokens,
+                "norm_tokens": self.norm_tokens,
+                "descriptions": self.descriptions,
+                "formats": self.formats,
+                "vocab": self.vocab,
+            }, f, indent=1, ensure_ascii=False)
+        # Plain .npy so the full-precision embeddings can be memory-mapped
+        np.save(os.path.join(path, "token_embeddings.npy"), np.asarray(self.token_embeddings, dtype=np.float32))
+        if self.desc_embeddings is not None:
+            np.save(os.path.join(path, "desc_embeddings.npy"), np.asarray(self.desc_embeddings, dtype=np.float32))
+        features, missing, shapes, coarse, stats = self.profile
+        np.savez(
+            os.path.join(path, "features.npz"),
+            value_features=features,
+            value_missing=missing,
+            value_shapes=shapes.astype(str),
+            value_coarse=coarse.astype(str),
+            value_stats=stats,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "SchemaFeatures":
+        with open(os.path.join(path, "schema.json"), "r", encoding="utf-8") as f:
+            schema = json.load(f)
+        data = np.load(os.path.join(path, "features.npz"), allow_pickle=False)
+        # Schemas registered before column statistics were kept have none
+        stats = data["value_stats"] if "value_stats" in data.files else \
+            np.full((len(schema["keys"]), len(COLUMN_STATS)), np.nan, dtype=np.float32)
+        profile = (data["value_features"], data["value_missing"],
+                   data["value_shapes"].astype(object), data["value_coarse"].astype(object), stats)
+
+        def embeddings(name):
+            file = os.path.join(path, f"{name}.npy")
+            if os.path.exists(file):
+                try:
+                    return np.load(file, mmap_mode="r")
+                except ValueError:   # empty arrays cannot be mapped
+                    return np.load(file)
+            return data[name] if name in data.files else None   # stored inside features.npz before
+
+        return cls(schema["keys"], schema["values"], schema["tokens"], schema["norm_tokens"],
+                   schema["descriptions"], schema["formats"], schema["vocab"],
+                   embeddings("token_embeddings"), embeddings("desc_embeddings"), profile)
+
+
+class FieldCatalog:
+    def __init__(self, root: str = CATALOG_DIR, codec: str = CATALOG_EMBEDDING_CODEC):
+        self.root = root
+        self.codec_name = codec
+        self._codecs = {}    # "token" / "desc" -> codec shared by every loaded schema
+        self._codebooks = {}  # "token" / "desc" -> file_stat of the PQ codebooks in use
+        self.index_file = os.path.join(root, "index.json")
+        self._lock = threading.RLock()
+        self._fingerprint = None
+        self._entries = {}   # hash -> summary
+        self._features = {}  # hash -> SchemaFeatures, loaded on first use
+
+    # ---------------------------------------------------------
+    # Index
+    # ---------------------------------------------------------
+    def _scan(self) -> Dict:
+        """{hash: summary} rebuilt from the <hash>/schema.json files."""
+        entries = {}
+        names = os.listdir(self.root) if os.path.isdir(self.root) else []
+        for name in names:
+            schema_file = os.path.join(self.root, name, "schema.json")
+            if "." in name or not os.path.isfile(schema_file):
+                continue   # in-progress registrations are "<hash>.tmp-..."
+            try:
+                with open(schema_file, "r", encoding="utf-8") as f:
+                    schema = json.load(f)
+            except (OSError, ValueError):
+                continue
+            entries[name] = {key: schema.get(key, "") for key in ("hash", *CATALOG_FIELDS, "field_count", "registered")}
+        return entries
+
+    def _read_index(self) -> Dict:
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return self._scan()
+        except (OSError, ValueError) as err:
+            # An unreadable index is not an empty catalog: every schema is still on disk
+            print(f"⚠️ Catalog index {self.index_file} is unreadable ({err}), rebuilding it from the schema directories")
+            return self._scan()
+
+    def _ensure_fresh(self):
+        # Another worker may have registered or removed schemas since the last read
+        self._reload_codecs()
+        fingerprint = file_stat(self.index_file)
+        if fingerprint is not None and fingerprint == self._fingerprint:
+            return
+        self._entries = self._read_index()
+        self._features = {h: feats for h, feats in self._features.items() if h in self._entries}
+        self._fingerprint = fingerprint
+
+    @contextmanager
+    def _updating(self):
+        """Read-modify-write of index.json, serialized across threads and worker processes."""
+        with self._lock, locked(self.index_file):
+            self._entries = self._read_index()
+            yield self._entries
+            write_json(self.index_file, self._entries, indent=1, ensure_ascii=False)
+            self._fingerprint = file_stat(self.index_file)
+            self._features = {h: feats for h, feats in self._features.items() if h in self._entries}
+
+    # ---------------------------------------------------------
+    # Registration
+    # ---------------------------------------------------------
+    def find(self, fields: Dict) -> Optional[str]:
+        """Hash of the registered version with exactly these fields, if any."""
+        digest = schema_hash(fields)
+        with self._lock:
+            self._ensure_fresh()
+            return digest if digest in self._entries else None
+
+    def register(self, fields: Dict, meta: Dict) -> Dict:
+        """
+        Store a schema version with all its features. Registering content that
+        is already in the catalog returns the existing entry without recomputing.
+        """
+        digest = schema_hash(fields)
+        with self._lock:
+            self._ensure_fresh()
+            if digest in self._entries:
+                return {**self._entries[digest], "existing": True}
+
+        t = time.time()
+        features = SchemaFeatures.compute(fields)
+        summary = {
+            "hash": digest,
+            **{name: meta.get(name, "") for name in CATALOG_FIELDS},
+            "field_count": len(features.keys),
+            "registered": time.time(),
+        }
+        path = os.path.join(self.root, digest)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(tmp, exist_ok=True)
+        features.save(tmp, summary)
+        with self._updating() as entries:
+            if os.path.isdir(path):
+                shutil.rmtree(tmp, ignore_errors=True)
+            else:
+                os.replace(tmp, path)
+            # Another worker may have registered the same content meanwhile
+            summary = entries.setdefault(digest, summary)
+        self.train_codecs()
+        print(f"✅ Catalog: registered {summary['message_name']} ({digest}, {len(features.keys)} fields) "
+              f"in {time.time() - t:.2f} sec")
+        return summary
+
+    def remove(self, digest: str) -> bool:
+        with self._updating() as entries:
+            if entries.pop(digest, None) is None:
+                return False
+            self._features.pop(digest, None)
+            shutil.rmtree(os.path.join(self.root, digest), ignore_errors=True)
+        return True
+
+    # ---------------------------------------------------------
+    # Lookup
+    # ---------------------------------------------------------
+    def get(self, digest: str) -> Optional[Dict]:
+        with self._lock:
+            self._ensure_fresh()
+            return self._entries.get(digest)
+
+    def list(self, filters: Dict[str, str] = None, all_versions: bool = False) -> List[Dict]:
+        """
+        Registered schemas matching the (case-insensitive) filters, newest first.
+        Only the latest version of each message is listed unless all_versions.
+        """
+        filters = {k: str(v).lower() for k, v in (filters or {}).items() if k in CATALOG_FIELDS and v}
+        with self._lock:
+            self._ensure_fresh()
+            entries = sorted(self._entries.values(), key=lambda e: e["registered"], reverse=True)
+        result, seen = [], set()
+        for entry in entries:
+            if any(str(entry.get(k, "")).lower() != v for k, v in filters.items()):
+                continue
+            if not all_versions:
+                if entry["message_name"] in seen:
+                    continue
+                seen.add(entry["message_name"])
+            result.append(entry)
+        return result
+
+    def features(self, digest: str) -> SchemaFeatures:
+        with self._lock:
+            self._ensure_fresh()
+            if digest not in self._entries:
+                raise KeyError(f"Schema {digest} is not in the catalog")
+            features = self._features.get(digest)
+        if features is None:
+            features = SchemaFeatures.load(os.path.join(self.root, digest))
+            features.encode(self._codec("token"), self._codec("desc"))
+            with self._lock:
+                self._features[digest] = features
+        return features
+
+    # ---------------------------------------------------------
+    # Embedding codes
+    # ---------------------------------------------------------
+    def _field_total(self) -> int:
+        return sum(entry.get("field_count", 0) for entry in self._entries.values())
+
+    def _pq_file(self, kind: str) -> str:
+        return os.path.join(self.root, f"pq-{kind}.npz")
+
+    def _codec(self, kind: str):
+        """
+        Shared codec for "token" or "desc" embeddings. PQ codebooks are only
+        loaded here (they are trained by train_codecs at registration); until
+        they exist the catalog is scored in float32.
+        """
+        with self._lock:
+            codec = self._codecs.get(kind)
+            if codec is None:
+                codec = make_codec(self.codec_name)
+                if codec.name == "pq":
+                    path = self._pq_file(kind)
+                    self._codebooks[kind] = file_stat(path)
+                    codec = codec.load(path) if self._codebooks[kind] is not None else Float32Codec()
+                self._codecs[kind] = codec
+            return codec
+
+    def _reload_codecs(self):
+        # Codebooks retrained by another worker: every schema is re-encoded lazily
+        if self.codec_name != "pq":
+            return
+        if any(file_stat(self._pq_file(kind)) != stat for kind, stat in self._codebooks.items()):
+            self._codecs, self._codebooks, self._features = {}, {}, {}
+
+    def _pq_stale(self, codec) -> bool:
+        return codec.trained_on < CATALOG_PQ_TRAIN_SIZE and self._field_total() >= 2 * max(codec.trained_on, 1)
+
+    def train_codecs(self):
+        """
+        Train the PQ codebooks if they are missing or no longer represent the
+        catalog (it has doubled since). Called after registration, never while
+        matching; the codebooks are written atomically for the other workers.
+        """
+        if self.codec_name != "pq":
+            return
+        for kind in ("token", "desc"):
+            path = self._pq_file(kind)
+            with locked(path):
+                with self._lock:
+                    self._ensure_fresh()
+                    digests = list(self._entries)
+                codec = make_codec(self.codec_name)
+                if file_stat(path) is not None and not self._pq_stale(codec.load(path)):
+                    continue
+                vectors = [getattr(SchemaFeatures.load(os.path.join(self.root, digest)), f"{kind}_embeddings")
+                           for digest in digests]
+                vectors = [np.asarray(v) for v in vectors if v is not None and len(v)]
+                if not vectors:
+                    continue   # nothing to train on yet
+                t = time.time()
+                codec.fit(np.concatenate(vectors))
+                # Catalog size at training time (fields), to retrain once it has doubled
+                codec.trained_on = self._field_total()
+                with replacing(path, "wb") as f:
+                    codec.save(f)
+            print(f"✅ Catalog: trained {kind} PQ codebooks on {sum(len(v) for v in vectors)} vectors "
+                  f"in {time.time() - t:.2f} sec")
+        with self._lock:
+            self._reload_codecs()
+
+    def schema(self, digest: str) -> Dict:
+        """Full stored schema: summary, keys, descriptions and formats."""
+        with open(os.path.join(self.root, digest, "schema.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+# ---------------------------------------------------------
+# Batched matching
+# ---------------------------------------------------------
+def _padded(index_lists: List[List[int]]):
+    """(n, L) index matrix padded with 0 and its (n, L) validity mask."""
+    width = max([len(ids) for ids in index_lists] + [1])
+    padded = np.zeros((len(index_lists), width), dtype=np.int64)
+    mask = np.zeros((len(index_lists), width), dtype=bool)
+    for i, ids in enumerate(index_lists):
+        padded[i, :len(ids)] = ids
+        mask[i, :len(ids)] = True
+    return padded, mask
+
+
+def _vocab_matrix(rows: List[str], cols: List[str], fn) -> np.ndarray:
+    return np.array([[fn(a, b) for b in cols] for a in rows], dtype=np.float32).reshape(len(rows), len(cols))
+
+
+def _harmonic_mean(a, b):  # as in token_similarity_scores
+    return (2 * a * b) / (a + b + 1e-6)
+
+
+def _pair_semantic(t_vectors: np.ndarray, s_vectors: np.ndarray) -> float:
+    """Token semantic score of one field pair from its token embeddings."""
+    if not len(t_vectors) or not len(s_vectors):
+        return 0.0
+    sim = np.clip(unit_rows(t_vectors) @ unit_rows(s_vectors).T, 0.0, 1.0)
+    return float(_harmonic_mean(sim.max(axis=1).mean(), sim.max(axis=0).mean()))
+
+
+def _codes(features: SchemaFeatures, kind: str, codec):
+    """features' token / desc codes in `codec` (encoded on the fly if it holds other codes)."""
+    if getattr(features, f"{kind}_codec") is codec:
+        return getattr(features, f"{kind}_codes")
+    return codec.encode(getattr(features, f"{kind}_embeddings"))
+
+
+def _code_errors(features: SchemaFeatures, kind: str, codec) -> np.ndarray:
+    """Per-row code error of features' token / desc embeddings in `codec` (see _code_error)."""
+    if getattr(features, f"{kind}_codec") is codec:
+        return getattr(features, f"{kind}_error")
+    vectors = getattr(features, f"{kind}_embeddings")
+    return _code_error(codec, vectors, codec.encode(vectors))
+
+
+def _token_scores(target: SchemaFeatures, s_tokens: List[List[str]], vocab: List[str], tok_semantic: np.ndarray):
+    """
+    (T, S) fuzzy and semantic scores of token_similarity_scores over the whole
+    grid, from the (target vocab x vocab) token cosine similarities.
+    """
+    n_t, n_s = len(target.keys), len(s_tokens)
+    fuzzy = np.zeros((n_t, n_s), dtype=np.float32)
+    semantic = np.zeros((n_t, n_s), dtype=np.float32)
+    if not target.vocab or not vocab:
+        return fuzzy, semantic
+    position = {tok: i for i, tok in enumerate(vocab)}
+    s_idx, s_mask = _padded([[position[t] for t in toks] for toks in s_tokens])
+    s_len = s_mask.sum(axis=1)
+    tok_fuzzy = _vocab_matrix(target.vocab, vocab, levenshtein_similarity)
+    t_position = {tok: i for i, tok in enumerate(target.vocab)}
+    for ti, toks in enumerate(target.tokens):
+        if not toks:
+            continue
+        rows = [t_position[t] for t in toks]
+        for out, matrix in ((fuzzy, tok_fuzzy), (semantic, tok_semantic)):
+            block = matrix[rows][:, s_idx] * s_mask          # (Lt, S, Ls), scores >= 0
+            t_to_s = block.max(axis=2).mean(axis=0)
+            s_to_t = block.max(axis=0).sum(axis=1) / np.maximum(s_len, 1)
+            out[ti] = np.where(s_len > 0, _harmonic_mean(t_to_s, s_to_t), 0.0)
+    return fuzzy, semantic
+
+
+def _synonym_scores(target: SchemaFeatures, s_norm_tokens: List[List[str]], groq_helper) -> np.ndarray:
+    """(T, S) synonym_coverage_score(target tokens, source tokens) over the whole grid."""
+    n_t, n_s = len(target.keys), len(s_norm_tokens)
+    scores = np.zeros((n_t, n_s), dtype=np.float32)
+    t_vocab = sorted({t for toks in target.norm_tokens for t in toks})
+    s_vocab = sorted({t for toks in s_norm_tokens for t in toks})
+    if not t_vocab or not s_vocab:
+        return scores
+    abbrev = abbreviation_like(set(t_vocab))
+    if groq_helper is not None and abbrev:
+        try:
+            expansion = groq_helper.get_all_synonyms(sorted(abbrev))
+        except DeadlineExceeded:
+            print("⚠️ Deadline reached during synonym expansion, using the local lexicon only")
+            expansion = lexicon.expand(abbrev)
+    else:
+        expansion = lexicon.expand(abbrev)
+
+    def matches_as_syn(a, b):
+        return a == b or (max(len(a), len(b)) <= 7 and levenshtein_similarity(a, b) >= 0.85)
+
+    match = _vocab_matrix(t_vocab, s_vocab, matches_as_syn).astype(bool)
+    position = {tok: i for i, tok in enumerate(s_vocab)}
+    s_idx, s_mask = _padded([[position[t] for t in toks] for toks in s_norm_tokens])
+    has_tokens = s_mask.any(axis=1)
+    t_position = {tok: i for i, tok in enumerate(t_vocab)}
+    # Synonym phrases match a source field only when all of their tokens are in it
+    present = np.zeros((len(s_vocab), n_s), dtype=bool)
+    present[s_idx[s_mask], np.nonzero(s_mask)[0]] = True
+    phrase_hits = {}
+    for tok, phrases in expansion.items():
+        hits = np.zeros(n_s, dtype=bool)
+        for phrase in phrases:
+            if all(t in position for t in phrase):
+                hits |= present[[position[t] for t in phrase]].all(axis=0)
+        if hits.any():
+            phrase_hits[tok] = hits
+    for ti, toks in enumerate(target.norm_tokens):
+        s_set = sorted(set(toks))
+        if not s_set:
+            continue
+        weights = np.array([token_weight(t) for t in s_set], dtype=np.float32)
+        covered = (match[[t_position[t] for t in s_set]][:, s_idx] & s_mask).any(axis=2)  # (|set|, S)
+        for row, tok in enumerate(s_set):
+            if tok in phrase_hits:
+                covered[row] |= phrase_hits[tok]
+        scores[ti] = np.where(has_tokens, (weights @ covered) / (weights.sum() + 1e-6), 0.0)
+    return scores
+
+
+def _cascade_llm(target: SchemaFeatures, source_texts: List[str], emb_scores: np.ndarray,
+                 partial: np.ndarray, top_k: Optional[int], rescore=None, slack: np.ndarray = 0.0):
+    """
+    Exact llm_score (0.7 * embedding + 0.3 * string similarity) for the pairs
+    that can still reach each target's top_k; the string match is the costly part.
+    With compressed embeddings, emb_scores and partial are computed on the codes:
+    slack (S,) is the largest amount by which they can underestimate a source
+    column's final score, so the bound stays an upper bound and the top_k is the
+    one of full-precision scoring. rescore(ti, si) returns the pair's exact
+    (embedding similarity, partial score) before it is evaluated.
+    Returns (llm_score, evaluated mask, rows cut short by the deadline).
+    """
+    n_t, n_s = emb_scores.shape
+    llm = np.zeros((n_t, n_s), dtype=np.float32)
+    evaluated = np.zeros((n_t, n_s), dtype=bool)
+    incomplete = np.zeros(n_t, dtype=bool)
+    w_llm = SCORE_WEIGHTS["llm_score"]
+    upper = partial + w_llm * (0.7 * emb_scores + 0.3) + slack
+    t_texts = target.desc_texts()
+    for ti in range(n_t):
+        if expired():
+            incomplete[ti:] = True
+            break
+        best = []
+        for si in np.argsort(-upper[ti], kind="stable"):
+            if top_k is not None and len(best) >= top_k and upper[ti, si] < best[top_k - 1]:
+                break   # everything left is bounded below the top-k
+            if rescore is not None:
+                emb_scores[ti, si], partial[ti, si] = rescore(ti, si)
+            text_score = SequenceMatcher(None, t_texts[ti], source_texts[si]).ratio()
+            llm[ti, si] = 0.7 * emb_scores[ti, si] + 0.3 * text_score
+            evaluated[ti, si] = True
+            if top_k is not None:
+                best.append(float(partial[ti, si] + w_llm * llm[ti, si]))
+                best.sort(reverse=True)
+                del best[top_k:]
+    return llm, evaluated, incomplete
+
+
+def match_features(target: SchemaFeatures, sources: List[SchemaFeatures], top_k: int = None,
+                   groq_helper=None, preview: bool = False) -> List[ScoreTensor]:
+    """
+    Score a target schema against several catalog schemas in one batched pass.
+    Returns one ScoreTensor per source schema. If the target has descriptions
+    (and every source does) the tensors are full-tier, otherwise (or with
+    preview=True) preview-tier: no llm_score, lexicon-only synonyms.
+    """
+    t1 = time.time()
+    full = not preview and target.described and all(s.described for s in sources)
+    bounds = np.cumsum([0] + [len(s.keys) for s in sources])
+    s_tokens = [toks for s in sources for toks in s.tokens]
+    s_norm_tokens = [toks for s in sources for toks in s.norm_tokens]
+
+    # Catalog embeddings are scored on their in-memory codes
+    token_codec = (sources[0].token_codec if sources else None) or Float32Codec()
+    desc_codec = (sources[0].desc_codec if sources else None) or Float32Codec()
+    approximate = token_codec.name != "float32" or desc_codec.name != "float32"
+
+    # Unique raw tokens over all sources with their codes
+    vocab, parts = [], []
+    seen = set()
+    for s in sources:
+        rows = [i for i, tok in enumerate(s.vocab) if tok not in seen]
+        seen.update(s.vocab)
+        vocab.extend(s.vocab[i] for i in rows)
+        parts.append(token_codec.take(_codes(s, "token", token_codec), np.asarray(rows, dtype=np.int64)))
+    tok_semantic = np.zeros((len(target.vocab), len(vocab)), dtype=np.float32)
+    if target.vocab and vocab:
+        tok_semantic = np.clip(token_codec.scores(target.token_embeddings, token_codec.concat(parts)), 0.0, 1.0)
+
+    fuzzy, semantic = _token_scores(target, s_tokens, vocab, tok_semantic)
+    synonym = _synonym_scores(target, s_norm_tokens, groq_helper if full else None)
+    value = profile_similarity(target.profile, tuple(
+        np.concatenate([s.profile[i] for s in sources]) for i in range(len(target.profile))
+    )) if bounds[-1] else np.zeros((len(target.keys), 0), dtype=np.float32)
+
+    scores = np.zeros((len(target.keys), bounds[-1], len(SCORE_COMPONENTS)), dtype=np.float32)
+    col = {name: i for i, name in enumerate(SCORE_COMPONENTS)}
+
+    evaluated, incomplete = None, None
+    if full:
+        source_texts = [text for s in sources for text in s.desc_texts()]
+        emb_scores = desc_codec.scores(target.desc_embeddings,
+                                       desc_codec.concat([_codes(s, "desc", desc_codec) for s in sources]))
+        partial = sum(SCORE_WEIGHTS[name] * component
+                      for name, component in (("semantic", semantic), ("fuzzy", fuzzy), ("synonym", synonym), ("value", value)))
+        rescore, slack = None, 0.0
+        if approximate:
+            # Cosine scores on the codes are off by at most the row's code error; a token
+            # pair's semantic score (harmonic mean of means of maxima) by twice the largest one
+            token_error = max([float(_code_errors(s, "token", token_codec).max(initial=0.0)) for s in sources] + [0.0])
+            desc_error = np.concatenate([_code_errors(s, "desc", desc_codec) for s in sources])
+            slack = (SCORE_WEIGHTS["llm_score"] * 0.7 * desc_error
+                     + SCORE_WEIGHTS["semantic"] * min(1.0, 2 * token_error))
+            owner = np.repeat(np.arange(len(sources)), np.diff(bounds))
+            t_position = {tok: i for i, tok in enumerate(target.vocab)}
+            s_positions = [{tok: i for i, tok in enumerate(s.vocab)} for s in sources]
+            t_desc = unit_rows(target.desc_embeddings)
+
+            def rescore(ti, si):
+                # Full-precision rows, read from the memory-mapped catalog files
+                source, local = sources[owner[si]], si - bounds[owner[si]]
+                t_vectors = target.token_embeddings[[t_position[t] for t in target.tokens[ti]]]
+                s_vectors = np.asarray(source.token_embeddings)[[s_positions[owner[si]][t] for t in source.tokens[local]]]
+                exact = _pair_semantic(t_vectors, s_vectors) if target.tokens[ti] and source.tokens[local] else 0.0
+                delta = SCORE_WEIGHTS["semantic"] * (exact - semantic[ti, si])
+                semantic[ti, si] = exact
+                return float(unit_rows(source.desc_embeddings[local])[0] @ t_desc[ti]), partial[ti, si] + delta
+
+        llm, evaluated, incomplete = _cascade_llm(target, source_texts, emb_scores, partial, top_k, rescore, slack)
+        scores[:, :, col["llm_score"]] = llm
+    scores[:, :, col["fuzzy"]] = fuzzy
+    scores[:, :, col["semantic"]] = semantic
+    scores[:, :, col["synonym"]] = synonym
+    scores[:, :, col["value"]] = value
+
+    tensors = []
+    for i, source in enumerate(sources):
+        lo, hi = bounds[i], bounds[i + 1]
+        if full:
+            tensor = ScoreTensor(target.keys, source.keys, scores[:, lo:hi], weights=SCORE_WEIGHTS, tier="full")
+            tensor.evaluated = evaluated[:, lo:hi]
+            if incomplete.any():
+                tensor.tier = "partial"
+                tensor.partial_rows = incomplete
+        else:
+            tensor = ScoreTensor(target.keys, source.keys, scores[:, lo:hi], weights=PREVIEW_WEIGHTS, tier="preview")
+        tensors.append(tensor)
+    print(f"✅ Catalog match: {len(target.keys)} target fields x {bounds[-1]} fields in {len(sources)} schemas "
+          f"in {time.time() - t1:.2f} sec" + ("" if full else " (preview tier)")
+          + (f", {token_codec.name}/{desc_codec.name} codes" if approximate else ""))
+    record_stage("catalog_match", time.time() - t1, pairs=len(target.keys) * int(bounds[-1]), schemas=len(sources),
+                 evaluated=int(evaluated.sum()) if evaluated is not None else 0)
+    return tensors
+
+
+def target_features(fields: Dict, catalog: FieldCatalog = None, describe: bool = True) -> SchemaFeatures:
+    """
+    Features of a schema to be matched: read from the catalog when it is
+    registered, else computed (without descriptions if describe=False or
+    they fail or time out).
+    """
+    digest = catalog.find(fields) if catalog is not None else None
+    if digest is not None:
+        return catalog.features(digest)
+    if not describe:
+        return SchemaFeatures.compute(fields, describe=False)
+    try:
+        return SchemaFeatures.compute(fields)
+    except (DeadlineExceeded, RuntimeError) as err:
+        print(f"⚠️ Matching without descriptions: {err}")
+        return SchemaFeatures.compute(fields, describe=False)
+
+
+def match_catalog(fields: Dict, catalog: FieldCatalog, digests: List[str], top_k: int = None,
+                  preview: bool = False) -> List[ScoreTensor]:
+    """
+    Match a field dict against the given catalog schemas; tensors carry each
+    schema's metadata. preview=True makes no LLM calls (preview-tier tensors).
+    """
+    target = target_features(fields, catalog, describe=not preview)
+    tensors = match_features(target, [catalog.features(d) for d in digests], top_k=top_k,
+                             groq_helper=None if preview else groq, preview=preview)
+    for digest, tensor in zip(digests, tensors):
+        entry = catalog.get(digest) or {}
+        tensor.with_metadata(
+            source_message=entry.get("message_name", ""),
+            source_file=f"catalog:{digest}",
+            source_country=entry.get("country", ""),
+            source_domain=entry.get("domain", ""),
+            source_system=entry.get("system", ""),
+        )
+    return tensors
@@ -6,7 +6,8 @@ from dotenv import load_dotenv
 import json
 import math
 import time
-from collections import defaultdict
+import threading
+from collections import defaultdict, OrderedDict
 from typing import Dict, Tuple, List
 import openai
 from typing import List, Dict
@@ -17,6 +18,15 @@ load_dotenv()
 api2 = os.getenv('grok2')
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from src.config import *
+from src.utils.single_flight import inflight, flight_key
+from src.utils.embedding_batcher import EmbeddingBatcher
+from src.utils.llm_scheduler import scheduler, SchedulerBusy
+from src.utils.deadline import DeadlineExceeded, check, timeout_for, wait_until_deadline
+from src.utils.work_scheduler import pools
+from src.utils.lexicon import Lexicon, covers
+from src.utils.record_batches import (
+    estimate_tokens, record_entry, output_tokens_per_record, make_batches, parse_batch, send_batch,
+)
 # Optional dependencies - graceful fallback
 try:
     from Levenshtein import distance as levenshtein_distance
@@ -133,6 +143,20 @@ def lemmatize_token(token: str) -> str:
             return doc[0].lemma_.lower()
     return token.lower()
 
+def abbreviation_like(tokens: set) -> set:
+    """Source tokens worth expanding with synonyms (short / abbreviation-like)."""
+    return {tok for tok in tokens if len(tok) <= 3 or tok in {"dob", "id", "no", "num"}}
+
+
+def normalized_tokens(text: str) -> List[str]:
+    """Tokens in the canonical form the synonym scorer compares."""
+    return [normalize(t) for t in tokenize_key(text)]
+
+
+# Local synonym lexicon, consulted before any synonym LLM call
+lexicon = Lexicon(normalized_tokens, lambda tok: bool(abbreviation_like({tok})))
+
+
 def env_groq_client():
     if groq is None:
         raise RuntimeError("Groq library is not installed.")
@@ -147,34 +171,51 @@ class GroqHelper:
         self.response_cache = {}
 
 
-    def get_synonyms(self, key: str) -> List[str]:
+    def get_synonyms(self, key: str) -> List[Tuple[str, ...]]:
+        known = lexicon.lookup(key)
+        if known is not None:
+            return list(known)
         if key in self.response_cache:
             return self.response_cache[key]
+        try:
+            # Concurrent lookups of the same term share one in-flight call
+            return inflight.do(flight_key("groq", DESCRIPTION_MODEL, key), self._fetch_synonyms, key,
+                               timeout=timeout_for())
+        except DeadlineExceeded:
+            raise
+        except Exception:
+            # A call cut short by the deadline is not the same as "no synonyms"
+            check("synonym lookup")
+            return []
+
+    def _fetch_synonyms(self, key: str) -> List[Tuple[str, ...]]:
         prompt = (
             f"You are an expert in maritime data. Provide a comma-separated list of "
             f"domain-specific synonyms and alternative labels for the term '{key}'. "
             f"For example, for 'GRT', synonyms might include 'Gross Tonnage', 'GrossRegTons'. "
             f"If none, return an empty string. Only return the list."
         )
-        try:
-            resp = self.client.chat.completions.create(
-                model=DESCRIPTION_MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=64,
-            )
-            synonyms_str = resp.choices[0].message.content.strip()
-            synonyms = [s.strip().lower() for s in synonyms_str.split(',') if s.strip()]
-            # Limit to top-3 synonyms
-            top_synonyms = synonyms[:3]
-            # Add lemmatized versions of top-3
-            lemmatized_synonyms = [lemmatize_token(s) for s in top_synonyms if lemmatize_token(s) != s]
-            all_synonyms = top_synonyms + lemmatized_synonyms
-            # Deduplicate
-            all_synonyms = list(set(all_synonyms))
-            self.response_cache[key] = all_synonyms
-            return all_synonyms
-        except Exception:
-            return []
+        resp = scheduler.call(
+            "groq", estimate_tokens(prompt) + 64,
+            self.client.chat.completions.create,
+            model=DESCRIPTION_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=64,
+        )
+        synonyms_str = resp.choices[0].message.content.strip()
+        synonyms = [s.strip().lower() for s in synonyms_str.split(',') if s.strip()]
+        # Limit to top-3 synonyms
+        top_synonyms = synonyms[:3]
+        # Add lemmatized versions of top-3
+        lemmatized_synonyms = [lemmatize_token(s) for s in top_synonyms if lemmatize_token(s) != s]
+        all_synonyms = top_synonyms + lemmatized_synonyms
+        # Deduplicate
+        all_synonyms = list(set(all_synonyms))
+        # Stored as normalized token phrases so later lookups never leave the process
+        lexicon.learn_synonyms(key, all_synonyms)
+        all_synonyms = list(lexicon.lookup(key) or ())
+        self.response_cache[key] = all_synonyms
+        return all_synonyms
 
     def get_all_synonyms(self, keys: List[str]) -> Dict[str, set]:
         synonyms_cache = {}
@@ -193,10 +234,16 @@ class EmbeddingModel:
             except Exception as e:
                 print(f"⚠️ Could not load SentenceTransformer ('{model_name}'): {e}")
                 self.model = None
+        self.batcher = EmbeddingBatcher(self._encode, EMBED_MAX_BATCH, EMBED_MAX_WAIT_MS) if EMBED_BATCHING else None
 
     def embed(self, texts: List[str]) -> List[np.ndarray]:
         if not self.model:
             return [np.zeros(384) for _ in texts]
+        # Identical concurrent requests share one encode call
+        encode = self.batcher.encode if self.batcher is not None else self._encode
+        return inflight.do(flight_key("local", self.model_name, list(texts)), encode, texts)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
         emb = self.model.encode(texts, show_progress_bar=False)
         if isinstance(emb, list):
             emb = np.array(emb)
@@ -204,11 +251,37 @@ class EmbeddingModel:
 
 
 
-def generate_description_format(keys: List[str]) -> Dict[str, str]:
+
+def parse_json_response(response: str):
+    """Parse a JSON object from an LLM response, fenced (```json) or bare."""
+    match = re.findall(r"```(?:json)?\s*(.*?)```", response, re.DOTALL)
+    if match:
+        return json.loads(match[0])
+    start, end = response.find("{"), response.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("No JSON object found in LLM response")
+    return json.loads(response[start:end + 1])
+
+
+def chunk_fields(fields: Dict[str, str], token_budget: int = DESCRIPTION_CHUNK_TOKENS) -> List[Dict[str, str]]:
     """
-    Use GPT-4o-mini to generate one-line descriptions for multiple keys in a single call.
-    Returns a dict: {key: description}
+    Pack fields into chunks whose estimated prompt + response size stays under token_budget.
+    Every chunk holds at least one field.
     """
+    chunks, current, used = [], {}, 0
+    for key, value in fields.items():
+        cost = estimate_tokens(f"{key}: {value}") + DESCRIPTION_TOKENS_PER_FIELD
+        if current and used + cost > token_budget:
+            chunks.append(current)
+            current, used = {}, 0
+        current[key] = value
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _description_prompt(fields: Dict[str, str]) -> dict:
     prompt = {
         "role": "user",
         "content": (
@@ -250,70 +323,120 @@ def generate_description_format(keys: List[str]) -> Dict[str, str]:
             "  }\n"
             "}\n\n"
 
-            f"Dictionary: {keys}"
+            f"Dictionary: {fields}"
         )
     }
+    return prompt
 
-    try:
-        client = openai.OpenAI(api_key=token)
-        completion = client.chat.completions.create(
-                        model="gpt-4o-mini",
-                        messages=[
-                            prompt],
-                        temperature =0
-                    )
-        response = completion.choices[0].message.content
-        match = re.findall(r"```(?:json)?\s*(.*?)```", response, re.DOTALL)
-        result = json.loads(match[0])
 
-        descriptions = {}
-        for key, values in result.items():
-            descriptions[key] = values['description']
+def _describe_chunk(fields: Dict[str, str], retries: int = DESCRIPTION_RETRIES) -> dict:
+    """Describe one chunk of fields, retrying when the response is not valid JSON."""
+    last_err = None
+    for attempt in range(retries + 1):
+        check("description generation")
+        try:
+            client = openai.OpenAI(api_key=token)
+            prompt = _description_prompt(fields)
+            completion = scheduler.call(
+                            "openai", estimate_tokens(prompt["content"]) + len(fields) * DESCRIPTION_TOKENS_PER_FIELD,
+                            client.chat.completions.create,
+                            model="gpt-4o-mini",
+                            messages=[
+                                prompt],
+                            temperature =0
+                        )
+            response = completion.choices[0].message.content
+            result = parse_json_response(response)
+            if not isinstance(result, dict):
+                raise ValueError("LLM response is not a JSON object")
+            return result
+        except (SchedulerBusy, DeadlineExceeded):
+            # Out of local quota or time: retrying right away would only queue again
+            raise
+        except Exception as err:
+            last_err = err
+            print(f"⚠️ Description chunk ({len(fields)} fields) attempt {attempt + 1} failed: {err}")
+    raise last_err
+
+
+# Chunks described so far (flight key -> parsed response), most recently used last
+described_chunks = OrderedDict()
+described_chunks_lock = threading.Lock()
+
+
+def _described_chunk(chunk: Dict[str, str]):
+    key = flight_key("openai", "gpt-4o-mini", chunk)
+    with described_chunks_lock:
+        result = described_chunks.get(key)
+        if result is not None:
+            described_chunks.move_to_end(key)
+        return result
 
-        # Fallback if GPT misses something
-        for key in keys:
-            if key not in descriptions:
-                descriptions[key] = key
-        return descriptions, result
-    
-    except Exception as err:
-        return None, err
 
-    
-def transform_data(source_dict, target_list, data_mapping) -> Dict[str, str]:
-    """
-    Use GPT-4o-mini to generate one-line descriptions for multiple keys in a single call.
-    Returns a dict: {key: description}
-    """
-    prompt = f"""
-        You are a highly accurate data transformation engine. 
-        Your task is to transform a source dictionary into a target dictionary 
-        based on explicit mappings and formatting rules.
+def _describe_and_keep(chunk: Dict[str, str]) -> dict:
+    result = _describe_chunk(chunk)
+    with described_chunks_lock:
+        described_chunks[flight_key("openai", "gpt-4o-mini", chunk)] = result
+        while len(described_chunks) > DESCRIPTION_CACHE_SIZE:
+            described_chunks.popitem(last=False)
+    return result
 
-        ⚠️ Critical Requirements:
-        - The output MUST be a valid JSON object.
-        - Maintain the exact key order and key names given in the Target Dictionary Structure.
-        - Do not include extra text, comments, or code blocks.
-        - If a source key is missing, null, or transformation fails, set the value to null.
 
-        ---
+def _descriptions(result: dict) -> Dict[str, str]:
+    return {key: values['description'] for key, values in result.items()
+            if isinstance(values, dict) and 'description' in values}
 
-        ### Mappings
-        ```json
-        {json.dumps(data_mapping, indent=2)}
-        ```
 
-        ### Source Dict
-        ```json
-        {json.dumps(source_dict, indent=2)}
-        ```
+def generate_description_format(keys: Dict[str, str], token_budget: int = DESCRIPTION_CHUNK_TOKENS):
+    """
+    Use GPT-4o-mini to generate one-line descriptions and value formats for the fields.
+    Fields are sharded into chunks under token_budget which are described concurrently;
+    a chunk that keeps failing falls back to using the key itself as the description.
+    Returns (descriptions, format_info) with descriptions as {key: description},
+    or (None, err) if every chunk failed. Raises DeadlineExceeded if the request's
+    deadline passed before every chunk was described; its `partial` holds the
+    (descriptions, format_info) of the chunks that did finish, which are also kept
+    for the next request describing the same fields.
+    """
+    chunks = chunk_fields(keys, token_budget)
+    result, errors, pending = {}, [], []
+    for chunk in chunks:
+        known = _described_chunk(chunk)
+        if known is not None:
+            result.update(known)
+        else:
+            pending.append(chunk)
+    futures = [
+        pools.submit("io", inflight.do, flight_key("openai", "gpt-4o-mini", chunk), _describe_and_keep, chunk)
+        for chunk in pending
+    ]
+    # Calls still running past the deadline are left behind, not waited for
+    done, not_done = wait_until_deadline(futures)
+    for future in futures:
+        if future in not_done:
+            continue
+        try:
+            result.update(future.result())
+        except Exception as err:
+            errors.append(err)
+    if not_done or any(isinstance(err, DeadlineExceeded) for err in errors):
+        unfinished = len(not_done) + sum(isinstance(err, DeadlineExceeded) for err in errors)
+        raise DeadlineExceeded(f"description generation: {unfinished} of {len(chunks)} chunks unfinished",
+                               partial=(_descriptions(result), result))
 
-        ### Target Dict
-        ```json
-        {json.dumps(target_list, indent=2)}
-        ```
+    if chunks and len(errors) == len(chunks):
+        return None, errors[-1]
+
+    descriptions = _descriptions(result)
 
-        Transformation Rules
+    # Fallback if GPT misses something (or a chunk failed)
+    for key in keys:
+        if key not in descriptions:
+            descriptions[key] = key
+    return descriptions, result
+
+    
+TRANSFORM_RULES = """Transformation Rules
 
         1. For each target key:
             -Find its corresponding source key from the mappings.
@@ -332,10 +455,10 @@ def transform_data(source_dict, target_list, data_mapping) -> Dict[str, str]:
         3. Validation before writing to output:
             - Ensure final value strictly matches the target_format.
             - Examples:
-            - Date (YYYY-MM-DD HH:mm:ss): must match regex ^\\d{{4}}-\\d{{2}}-\\d{{2}} \\d{{2}}:\\d{{2}}:\\d{{2}}$.
-            - Date (DDMMYYYYHHmmss): must match regex ^\\d{{14}}$.
-            - String (alphanumeric, N chars): regex ^[A-Za-z0-9]{{N}}$.
-            - String (alphanumeric, X-Y chars): regex ^[A-Za-z0-9]{{X,Y}}$.
+            - Date (YYYY-MM-DD HH:mm:ss): must match regex ^\\d{4}-\\d{2}-\\d{2} \\d{2}:\\d{2}:\\d{2}$.
+            - Date (DDMMYYYYHHmmss): must match regex ^\\d{14}$.
+            - String (alphanumeric, N chars): regex ^[A-Za-z0-9]{N}$.
+            - String (alphanumeric, X-Y chars): regex ^[A-Za-z0-9]{X,Y}$.
             - Integer: must match regex ^-?\\d+$.
             - Float: must match regex ^-?\\d+(\\.\\d+)?$.
         4. Unit conversion:
@@ -349,7 +472,43 @@ def transform_data(source_dict, target_list, data_mapping) -> Dict[str, str]:
         5. Error handling:
             -If parsing/conversion/validation fails → set value = null.
             -Never guess or hallucinate values.
+"""
+
 
+def transform_data(source_dict, target_list, data_mapping) -> Dict[str, str]:
+    """
+    Use GPT-4o-mini to generate one-line descriptions for multiple keys in a single call.
+    Returns a dict: {key: description}
+    """
+    prompt = f"""
+        You are a highly accurate data transformation engine. 
+        Your task is to transform a source dictionary into a target dictionary 
+        based on explicit mappings and formatting rules.
+
+        ⚠️ Critical Requirements:
+        - The output MUST be a valid JSON object.
+        - Maintain the exact key order and key names given in the Target Dictionary Structure.
+        - Do not include extra text, comments, or code blocks.
+        - If a source key is missing, null, or transformation fails, set the value to null.
+
+        ---
+
+        ### Mappings
+        ```json
+        {json.dumps(data_mapping, indent=2)}
+        ```
+
+        ### Source Dict
+        ```json
+        {json.dumps(source_dict, indent=2)}
+        ```
+
+        ### Target Dict
+        ```json
+        {json.dumps(target_list, indent=2)}
+        ```
+
+        {TRANSFORM_RULES}
             
         Output -
         Return ONLY the transformed target dictionary as a valid JSON object, with keys in the exact order provided above.
@@ -357,7 +516,9 @@ def transform_data(source_dict, target_list, data_mapping) -> Dict[str, str]:
 
     try:
         client = openai.OpenAI(api_key=token)
-        completion = client.chat.completions.create(
+        completion = scheduler.call(
+                        "openai", estimate_tokens(prompt) + output_tokens_per_record(target_list),
+                        client.chat.completions.create,
                         model="gpt-4o-mini",
                         messages=[{
                         "role": "user",
@@ -366,11 +527,106 @@ def transform_data(source_dict, target_list, data_mapping) -> Dict[str, str]:
                     )
         response = completion.choices[0].message.content
         print(response)
-        match = re.findall(r"```(?:json)?\s*(.*?)```", response, re.DOTALL)
-        result = json.loads(match[0])
+        result = parse_json_response(response)
         return result
     
     except Exception as err:
         return err
 
+
+def _transform_batch_prompt(records: List[Dict], target_list, data_mapping) -> str:
+    return f"""
+        You are a highly accurate data transformation engine. 
+        Your task is to transform a batch of source records into target dictionaries 
+        based on explicit mappings and formatting rules. Every record is transformed independently.
+
+        ⚠️ Critical Requirements:
+        - The output MUST be a valid JSON object of the form {{"records": [{{"record_id": <id>, "target": {{...}}}}, ...]}}.
+        - Return exactly one entry per input record, echoing its record_id.
+        - Maintain the exact key order and key names given in the Target Dictionary Structure for every target.
+        - Do not include extra text, comments, or code blocks.
+        - If a source key is missing, null, or transformation fails, set the value to null.
+
+        ---
+
+        ### Mappings
+        ```json
+        {json.dumps(data_mapping, indent=2)}
+        ```
+
+        ### Target Dict
+        ```json
+        {json.dumps(target_list, indent=2)}
+        ```
+
+        {TRANSFORM_RULES}
+
+        ### Source Records
+        ```json
+        {json.dumps(records, default=str)}
+        ```
+
+        Output -
+        Return ONLY the JSON object with one transformed target dictionary per record_id.
+        """
+
+
+def _transform_one_batch(records: List[Dict], indices: List[int], target_list, data_mapping) -> Dict[int, dict]:
+    """
+    Send one batch; returns {record index: target dict} for the records parsed
+    successfully. SchedulerBusy / DeadlineExceeded propagate (see send_batch).
+    """
+    prompt = _transform_batch_prompt([record_entry(i, records[i]) for i in indices], target_list, data_mapping)
+
+    def send(indices):
+        client = openai.OpenAI(api_key=token)
+        return scheduler.call(
+                        "openai", estimate_tokens(prompt) + output_tokens_per_record(target_list) * len(indices),
+                        client.chat.completions.create,
+                        model="gpt-4o-mini",
+                        messages=[{
+                        "role": "user",
+                        "content": prompt}],
+                        temperature =0,
+                        max_tokens=TRANSFORM_MAX_OUTPUT_TOKENS
+                    )
+
+    try:
+        completion = send_batch(send, indices)
+        result = parse_json_response(completion.choices[0].message.content)
+    except (SchedulerBusy, DeadlineExceeded):
+        raise
+    except Exception as err:
+        print(f"⚠️ Transform batch of {len(indices)} records failed: {err}")
+        return {}
+    return parse_batch(result, indices, target_list)
+
+
+def transform_data_batch(source_records: List[Dict], target_list, data_mapping,
+                         token_budget: int = TRANSFORM_BATCH_TOKENS) -> List:
+    """
+    Batched variant of transform_data: the mappings and rules are sent once per batch
+    together with an array of records. Records that are missing or malformed in a
+    batch response are re-submitted individually through transform_data; a busy LLM
+    quota raises SchedulerBusy once a batch has used up its retries.
+    Returns one result per source record, in order.
+    """
+    base = estimate_tokens(_transform_batch_prompt([], target_list, data_mapping))
+    batches = make_batches(source_records, target_list, base, token_budget, TRANSFORM_MAX_OUTPUT_TOKENS)
+    results = [None] * len(source_records)
+    futures = [
+        pools.submit("io", _transform_one_batch, source_records, indices, target_list, data_mapping)
+        for indices in batches
+    ]
+    for future in futures:
+        for i, target in future.result().items():
+            results[i] = target
+
+    failed = [i for i, target in enumerate(results) if target is None]
+    if failed:
+        print(f"⚠️ Re-submitting {len(failed)} of {len(source_records)} records individually")
+    for i in failed:
+        results[i] = transform_data(source_records[i], target_list, data_mapping)
+    return results
+
     
@@ -0,0 +1,114 @@
+"""
+Response compression and content-hash ETags for the Flask API.
+
+compress_response is registered as an after_request hook: JSON / NDJSON / text
+bodies of at least COMPRESS_MIN_BYTES are gzip- or brotli-encoded according to
+the request's Accept-Encoding. Streamed responses (progressive NDJSON) are
+compressed chunk by chunk and flushed after every chunk, so each line still
+reaches the client as soon as it is produced.
+
+brotli is optional; without it only gzip is offered.
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+import hashlib
+import zlib
+
+from src.config import COMPRESS_MIN_BYTES, COMPRESS_GZIP_LEVEL, COMPRESS_BROTLI_QUALITY
+
+try:
+    import brotli
+    _BROTLI_AVAILABLE = True
+except Exception:
+    _BROTLI_AVAILABLE = False
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def content_etag(data: bytes) -> str:
+    """Content hash used as a (weak) ETag; weak because the encoding may differ per client."""
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def choose_encoding(accept_encoding: str):
+    """'br', 'gzip' or None for an Accept-Encoding header value."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.lower()] = q
+    if _BROTLI_AVAILABLE and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", accepted.get("*", 0)) > 0:
+        return "gzip"
+    return None
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+        self.encoding = encoding
+
+    def chunk(self, data: bytes) -> bytes:
+        # Sync-flush after every chunk so streamed lines are not held back in the compressor
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def compress_bytes(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    return zlib.compress(data, COMPRESS_GZIP_LEVEL, wbits=31)
+
+
+def _compress_stream(body, encoding: str):
+    compressor = _StreamCompressor(encoding)
+    try:
+        for data in body:
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            if data:
+                yield compressor.chunk(data)
+        yield compressor.finish()
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+
+
+def compress_response(response, request):
+    """Encode `response` in place when the client accepts it and the body is worth compressing."""
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers or response.direct_passthrough
+            or not response.mimetype.startswith(COMPRESSIBLE_TYPES)):
+        return response
+    encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+    response.vary.add("Accept-Encoding")
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        response.set_data(compress_bytes(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
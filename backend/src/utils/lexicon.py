@@ -0,0 +1,308 @@
+"""
+Local abbreviation / synonym lexicon consulted before any synonym LLM call.
+
+Entries are merged from three sources:
+    - DOMAIN_ABBREVIATIONS seeds in config.py (OOG, VGM, POL, POD, SBN, ...)
+    - token alignments of approved sourceKey/targetKey pairs in mappings.json:
+      an abbreviation-like token on one side that the other side does not share
+      is aligned with the other side's unshared tokens as one phrase
+      (VGM <-> gross weight)
+    - synonyms previously returned by the LLM (persisted to LEXICON_CACHE_FILE)
+
+Synonyms are phrases, stored as tuples of the normalized tokens the synonym
+scorer compares; a phrase only matches a key that contains all of its tokens
+(see covers). The result is compiled into a plain dict of frozensets. Writers
+build a new dict and swap it in, so lookups take no lock.
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+import atexit
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.config import (DOMAIN_ABBREVIATIONS, LEXICON_CACHE_FILE, LEXICON_MIN_SUPPORT,
+                        LEXICON_FLUSH_SEC, LEXICON_REFRESH_SEC)
+from src.utils.atomic_file import file_stat, locked, quarantine, write_json
+
+CACHE_VERSION = 2
+
+Phrase = Tuple[str, ...]
+
+
+def covers(phrases: Iterable[Phrase], tokens: set) -> bool:
+    """Whether some synonym phrase has all of its tokens in `tokens`."""
+    return any(all(tok in tokens for tok in phrase) for phrase in phrases)
+
+
+class Lexicon:
+    def __init__(self, tokenize: Callable[[str], List[str]], is_abbreviation: Callable[[str], bool],
+                 cache_file: str = LEXICON_CACHE_FILE):
+        """
+        tokenize: key or phrase -> normalized tokens (as used by the synonym scorer)
+        is_abbreviation: whether a normalized token is worth expanding
+        """
+        self._tokenize = tokenize
+        self._is_abbreviation = is_abbreviation
+        self._cache_file = cache_file
+        self._loader = None
+        self._stat = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._static = defaultdict(set)      # token -> phrases from the seeds
+        self._llm = {}                       # token -> phrases as returned by the LLM
+        self._support = defaultdict(Counter) # token -> Counter(phrase -> mappings aligning it)
+        self._direct = defaultdict(Counter)  # token -> Counter(phrase -> mappings aligning it one-to-one)
+        self._by_mapping = {}                # mapping id -> {(token, phrase): one-to-one}
+        self._pending = set()                # LLM entries not yet written to the cache
+        self._timer = None
+        self._fingerprint = None             # mappings file stat the alignments were built from
+        self._cache_fingerprint = None
+        self._next_check = 0.0
+        self._table = {}
+        self._built = False
+        self.stats = Counter()
+        atexit.register(self.flush)
+
+    # ---------------------------------------------------------
+    # Building
+    # ---------------------------------------------------------
+    def _phrase(self, text: str) -> Phrase:
+        return tuple(dict.fromkeys(self._tokenize(text)))
+
+    def _static_entries(self):
+        for abbreviation, phrases in DOMAIN_ABBREVIATIONS.items():
+            for key in self._tokenize(abbreviation):
+                self._static[key] |= {phrase for phrase in map(self._phrase, phrases) if phrase}
+
+    def _read_cache(self) -> Dict[str, List[str]]:
+        """{token: [synonym phrase, ...]} from the cache file; unreadable files are moved aside."""
+        try:
+            with open(self._cache_file, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as err:
+            moved = quarantine(self._cache_file)
+            print(f"⚠️ Synonym cache {self._cache_file} is unreadable ({err}); moved to {moved}")
+            return {}
+        if not isinstance(cached, dict) or cached.get("version") != CACHE_VERSION:
+            print(f"⚠️ Synonym cache {self._cache_file} has an old format; its entries will be re-fetched")
+            return {}
+        return {key: list(phrases) for key, phrases in cached.get("synonyms", {}).items()}
+
+    def _load_cache(self) -> set:
+        """Merge the cache file into memory (entries not yet flushed win); returns the changed keys."""
+        self._cache_fingerprint = file_stat(self._cache_file)
+        changed = set()
+        for key, phrases in self._read_cache().items():
+            if key not in self._pending and self._llm.get(key) != phrases:
+                self._llm[key] = phrases
+                changed.add(key)
+        return changed
+
+    def alignments(self, mapping: Dict) -> Dict[Tuple[str, Phrase], bool]:
+        """
+        (abbreviation token, aligned phrase) pairs from one saved mapping's approved
+        keys, each flagged True when some key pair aligned that token alone with
+        the phrase (GWT <-> GrossWeight) rather than one of several unshared tokens.
+        """
+        pairs = {}
+        for approved in mapping.get("approvedMappings", []):
+            source = self._phrase(approved.get("sourceKey", "").rpartition("::")[2])
+            target = self._phrase(approved.get("targetKey", "").rpartition("::")[2])
+            for side, other in ((source, target), (target, source)):
+                own = [token for token in side if token not in other]
+                phrase = tuple(token for token in other if token not in side)
+                if not phrase:
+                    continue
+                for token in own:
+                    if self._is_abbreviation(token):
+                        pairs[(token, phrase)] = pairs.get((token, phrase), False) or len(own) == 1
+        return pairs
+
+    def _learned(self, key: str) -> set:
+        # Noisy many-to-many alignments only count once several mappings agree
+        direct = self._direct.get(key, {})
+        return {phrase for phrase, support in self._support.get(key, {}).items()
+                if direct.get(phrase) or support >= LEXICON_MIN_SUPPORT}
+
+    def _compile(self, keys: Iterable[str] = None):
+        # Copy-on-write: readers keep using the old table until the swap
+        table = dict(self._table)
+        keys = set(self._static) | set(self._llm) | set(self._support) if keys is None else set(keys)
+        for key in keys:
+            phrases = set(self._static.get(key, ())) | self._learned(key)
+            phrases |= {phrase for phrase in map(self._phrase, self._llm.get(key, ())) if phrase}
+            phrases.discard((key,))
+            if phrases or key in self._llm:
+                table[key] = frozenset(phrases)
+            else:
+                table.pop(key, None)
+        self._table = table
+
+    def _load_mappings(self, mappings: List[Dict]):
+        self._support.clear()
+        self._direct.clear()
+        self._by_mapping.clear()
+        for mapping in mappings:
+            self._add_mapping(mapping)
+
+    def track(self, loader: Callable[[], List[Dict]], stat: Callable[[], Optional[tuple]]):
+        """Learn from the saved mappings and re-learn whenever stat() reports another worker's write."""
+        self._loader, self._stat = loader, stat
+        self.build()
+
+    def build(self, mappings: List[Dict] = None):
+        """Rebuild everything from the seeds, the synonym cache and the saved mappings."""
+        with self._lock:
+            if mappings is None and self._loader is not None:
+                self._fingerprint = self._stat()
+                mappings = self._loader()
+            self._static.clear()
+            self._llm = {key: self._llm[key] for key in self._pending}
+            self._table = {}
+            self._static_entries()
+            self._load_cache()
+            self._load_mappings(mappings or [])
+            self._compile()
+            self._built = True
+            self._next_check = time.monotonic() + LEXICON_REFRESH_SEC
+        print(f"✅ Lexicon: {len(self._table)} entries from seeds, {len(self._llm)} cached LLM synonyms "
+              f"and {len(self._by_mapping)} saved mappings")
+
+    def _refresh(self):
+        """Pick up mappings and synonyms written by other workers since the last check."""
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = time.monotonic() + LEXICON_REFRESH_SEC
+            if self._loader is not None and self._stat() != self._fingerprint:
+                with self._lock:
+                    self._fingerprint = self._stat()
+                    self._load_mappings(self._loader())
+                    self._compile()
+            if file_stat(self._cache_file) != self._cache_fingerprint:
+                with self._lock:
+                    self._compile(self._load_cache())
+        finally:
+            self._refresh_lock.release()
+
+    def _ensure_fresh(self):
+        # Scripts that never load mappings still get the seeds and the synonym cache
+        if not self._built:
+            self.build()
+        elif time.monotonic() >= self._next_check:
+            self._refresh()
+
+    # ---------------------------------------------------------
+    # Incremental updates
+    # ---------------------------------------------------------
+    def _add_mapping(self, mapping: Dict) -> set:
+        pairs = self.alignments(mapping)
+        self._by_mapping[str(mapping.get("id", ""))] = pairs
+        for (token, phrase), direct in pairs.items():
+            self._support[token][phrase] += 1
+            if direct:
+                self._direct[token][phrase] += 1
+        return {token for token, _ in pairs}
+
+    @staticmethod
+    def _decrement(counts: Dict[str, Counter], token: str, phrase: Phrase):
+        counts[token][phrase] -= 1
+        if counts[token][phrase] <= 0:
+            del counts[token][phrase]
+        if not counts[token]:
+            del counts[token]
+
+    def _remove_mapping(self, mapping_id: str) -> set:
+        pairs = self._by_mapping.pop(str(mapping_id), {})
+        for (token, phrase), direct in pairs.items():
+            self._decrement(self._support, token, phrase)
+            if direct:
+                self._decrement(self._direct, token, phrase)
+        return {token for token, _ in pairs}
+
+    def _apply_write(self, before: Optional[tuple], change: Callable[[], set]):
+        # Same rule as MappingIndex: apply our own write incrementally only if the
+        # alignments matched the file right before it; otherwise re-learn next lookup.
+        with self._lock:
+            if self._loader is None or (self._fingerprint is not None and before == self._fingerprint):
+                self._compile(change())
+                if self._loader is not None:
+                    self._fingerprint = self._stat()
+            else:
+                self._fingerprint = None
+                self._next_check = 0.0
+
+    def upsert_mapping(self, mapping: Dict, before: Optional[tuple] = None):
+        """Re-learn the alignments of a created or updated mapping; `before` is the pre-write stat."""
+        self._ensure_fresh()
+        mapping_id = str(mapping.get("id", ""))
+        self._apply_write(before, lambda: self._remove_mapping(mapping_id) | self._add_mapping(mapping))
+
+    def remove_mapping(self, mapping_id: str, before: Optional[tuple] = None):
+        self._ensure_fresh()
+        self._apply_write(before, lambda: self._remove_mapping(mapping_id))
+
+    def learn_synonyms(self, key: str, synonyms: List[str]):
+        """Record synonym phrases returned by the LLM for `key` (an empty list is remembered too)."""
+        self._ensure_fresh()
+        with self._lock:
+            self._llm[key] = sorted(set(synonyms))
+            self._compile([key])
+            self._pending.add(key)
+            if self._timer is None:
+                # Debounced: one cache write for a burst of new terms, off the request path
+                self._timer = threading.Timer(LEXICON_FLUSH_SEC, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Merge unsaved LLM synonyms into the cache file shared by all workers."""
+        with self._flush_lock:
+            with self._lock:
+                self._timer = None
+                pending = {key: self._llm[key] for key in self._pending}
+            if not pending:
+                return
+            try:
+                with locked(self._cache_file):
+                    merged = self._read_cache()
+                    merged.update(pending)
+                    write_json(self._cache_file, {"version": CACHE_VERSION, "synonyms": merged}, indent=1)
+                    fingerprint = file_stat(self._cache_file)
+            except OSError as err:
+                print(f"⚠️ Could not save synonym cache: {err}")
+                return
+            with self._lock:
+                self._pending.difference_update(key for key in pending if self._llm.get(key) == pending[key])
+                # Other workers' entries came along with the merge
+                others = {key: phrases for key, phrases in merged.items()
+                          if key not in self._pending and self._llm.get(key) != phrases}
+                self._llm.update(others)
+                self._compile(others)
+                self._cache_fingerprint = fingerprint
+
+    # ---------------------------------------------------------
+    # Lookup
+    # ---------------------------------------------------------
+    def lookup(self, key: str) -> Optional[frozenset]:
+        """Known synonym phrases of a normalized token, or None if the lexicon has no entry."""
+        self._ensure_fresh()
+        found = self._table.get(key)
+        self.stats["hits" if found is not None else "misses"] += 1
+        return found
+
+    def expand(self, keys: Iterable[str]) -> Dict[str, frozenset]:
+        """{key: synonym phrases} for the keys the lexicon knows (no network)."""
+        self._ensure_fresh()
+        table = self._table
+        return {key: table[key] for key in keys if key in table}
+
+    def __len__(self):
+        return len(self._table)
@@ -0,0 +1,241 @@
+"""
+Local scheduler for outbound LLM calls.
+
+Every provider gets two token buckets (requests/min and tokens/min). Callers
+wait in per-provider queues split by priority class; interactive calls are
+always served before bulk ones, bulk calls may not dip into the share of the
+quota reserved for interactive traffic, and within a class the queue rotates
+between requests (flows) so one large run cannot starve the others.
+
+When a queue is full, or a call could not be granted within `max_wait`
+seconds, SchedulerBusy is raised with a retry_after hint instead of letting
+the call pile up into a 429 storm at the provider.
+
+The buckets live in each process. Under gunicorn every worker calls
+share(workers) in post_fork, so the workers together stay within the quota.
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+import contextlib
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict
+
+from src.config import LLM_RATE_LIMITS, LLM_BULK_RESERVE, LLM_MAX_QUEUE, LLM_MAX_WAIT
+from src.utils.request_context import llm_priority, request_id
+from src.utils.deadline import DeadlineExceeded, check, remaining, timeout_for
+
+INTERACTIVE = 0
+BULK = 1
+
+
+class SchedulerBusy(Exception):
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, reserve: float = 0.0) -> float:
+        """Seconds until `amount` can be taken while keeping `reserve` (fraction of capacity) untouched."""
+        # A call larger than the unreserved share waits for a full bucket instead of never fitting
+        needed = min(amount + reserve * self.capacity, self.capacity) - self.tokens
+        return 0.0 if needed <= 0 else needed / self.rate
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+
+class _Ticket:
+    __slots__ = ("provider", "tokens", "priority", "flow", "seq")
+
+    def __init__(self, provider, tokens, priority, flow, seq):
+        self.provider = provider
+        self.tokens = tokens
+        self.priority = priority
+        self.flow = flow
+        self.seq = seq
+
+
+class LLMScheduler:
+    def __init__(self, limits: Dict[str, Dict[str, float]] = LLM_RATE_LIMITS, bulk_reserve: float = LLM_BULK_RESERVE,
+                 max_queue: int = LLM_MAX_QUEUE, max_wait: float = LLM_MAX_WAIT):
+        self.bulk_reserve = bulk_reserve
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._buckets = {}
+        self._queues = {}
+        self.stats = {}
+        self._processes = 1   # processes sharing each provider's quota (see share)
+        for provider, limit in limits.items():
+            self._add_provider(provider, limit)
+
+    def _add_provider(self, provider: str, limit: Dict[str, float]):
+        self._buckets[provider] = (TokenBucket(limit["rpm"] / self._processes),
+                                   TokenBucket(limit["tpm"] / self._processes))
+        # priority -> OrderedDict(flow -> deque of tickets); flows rotate for fairness
+        self._queues[provider] = {INTERACTIVE: OrderedDict(), BULK: OrderedDict()}
+        self.stats[provider] = {"granted": 0, "rejected": 0, "rate_limited": 0, "wait_sec": 0.0}
+
+    def share(self, processes: int):
+        """
+        Split every provider's quota evenly between `processes` processes that
+        each run their own scheduler (gunicorn workers); call once per process.
+        """
+        processes = max(1, int(processes))
+        with self._cond:
+            factor = self._processes / processes
+            self._processes = processes
+            for buckets in self._buckets.values():
+                for bucket in buckets:
+                    bucket.capacity *= factor
+                    bucket.rate *= factor
+                    bucket.tokens = min(bucket.tokens * factor, bucket.capacity)
+
+    # ---------------------------------------------------------
+    # Queue state
+    # ---------------------------------------------------------
+    def queue_depth(self, provider: str, priority: int = None) -> int:
+        with self._cond:
+            queues = self._queues.get(provider, {})
+            classes = [priority] if priority is not None else list(queues)
+            return sum(len(q) for p in classes for q in queues.get(p, {}).values())
+
+    def _head(self, provider: str):
+        for priority in (INTERACTIVE, BULK):
+            flows = self._queues[provider][priority]
+            if flows:
+                return flows[next(iter(flows))][0]
+        return None
+
+    def _remove(self, ticket: _Ticket, served: bool = False):
+        flows = self._queues[ticket.provider][ticket.priority]
+        waiting = flows[ticket.flow]
+        waiting.remove(ticket)
+        if waiting and served:
+            # Round-robin: the flow that was just served goes to the back
+            flows.move_to_end(ticket.flow)
+        else:
+            del flows[ticket.flow]
+
+    def call_budget(self, provider: str, priority: int = BULK) -> int:
+        """Largest token estimate one call can reserve without draining the bucket at `priority`."""
+        limit = LLM_RATE_LIMITS.get(provider, LLM_RATE_LIMITS.get("default", {"tpm": 60000}))
+        if provider in self._buckets:
+            limit = {"tpm": self._buckets[provider][1].capacity}
+        reserve = self.bulk_reserve if priority == BULK else 0.0
+        return int(limit["tpm"] * (1.0 - reserve))
+
+    # ---------------------------------------------------------
+    # Acquire / call
+    # ---------------------------------------------------------
+    def acquire(self, provider: str, tokens: int, priority: int = None, flow: str = None):
+        """
+        Block until the provider's quota allows this call. Raises SchedulerBusy,
+        or DeadlineExceeded when the request's deadline passes while waiting.
+        """
+        check(f"{provider} call")
+        priority = llm_priority.get() if priority is None else priority
+        flow = request_id.get() if flow is None else flow
+        with self._cond:
+            if provider not in self._buckets:
+                self._add_provider(provider, LLM_RATE_LIMITS.get("default", {"rpm": 60, "tpm": 60000}))
+            if self.queue_depth(provider) >= self.max_queue:
+                self.stats[provider]["rejected"] += 1
+                raise SchedulerBusy(f"{provider} queue is full ({self.max_queue} waiting)", retry_after=5.0)
+
+            ticket = _Ticket(provider, tokens, priority, flow, next(self._seq))
+            self._queues[provider][priority].setdefault(flow, deque()).append(ticket)
+            started = time.monotonic()
+            reserve = self.bulk_reserve if priority == BULK else 0.0
+            try:
+                while True:
+                    now = time.monotonic()
+                    requests_bucket, tokens_bucket = self._buckets[provider]
+                    requests_bucket.refill(now)
+                    tokens_bucket.refill(now)
+                    wait = max(requests_bucket.wait_time(1, reserve), tokens_bucket.wait_time(tokens, reserve))
+                    if self._head(provider) is ticket and wait == 0.0:
+                        requests_bucket.take(1)
+                        tokens_bucket.take(tokens)
+                        self._remove(ticket, served=True)
+                        self.stats[provider]["granted"] += 1
+                        self.stats[provider]["wait_sec"] += now - started
+                        self._cond.notify_all()
+                        return
+                    left = remaining()
+                    if left is not None and left <= 0:
+                        self._remove(ticket)
+                        self._cond.notify_all()
+                        raise DeadlineExceeded(f"{provider} call exceeded its time budget waiting for quota")
+                    allowed = self.max_wait - (now - started)
+                    if allowed <= 0:
+                        self._remove(ticket)
+                        self.stats[provider]["rejected"] += 1
+                        self._cond.notify_all()
+                        raise SchedulerBusy(f"{provider} quota exhausted, waited {self.max_wait:.1f}s",
+                                            retry_after=max(1.0, wait))
+                    allowed = allowed if left is None else min(allowed, left)
+                    self._cond.wait(timeout=min(allowed, wait if wait > 0 else 0.05))
+            except (SchedulerBusy, DeadlineExceeded):
+                raise
+            except BaseException:
+                if ticket in self._queues[provider][priority].get(flow, ()):
+                    self._remove(ticket)
+                    self._cond.notify_all()
+                raise
+
+    def call(self, provider: str, tokens: int, fn: Callable, *args, **kwargs):
+        """
+        Acquire quota for one call of fn(*args, **kwargs) and run it. Under a
+        deadline the call gets a `timeout` of at most the time left.
+        """
+        self.acquire(provider, tokens)
+        if remaining() is not None:
+            kwargs["timeout"] = timeout_for(kwargs.get("timeout"))
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as err:
+            if getattr(err, "status_code", None) == 429:
+                # The provider disagrees with our view of the quota: drain it so
+                # every queued caller backs off instead of retrying into a storm.
+                with self._cond:
+                    for bucket in self._buckets[provider]:
+                        bucket.tokens = min(bucket.tokens, 0.0)
+                    self.stats[provider]["rate_limited"] += 1
+            raise
+        # Reconcile the estimate with the actual usage reported by the provider
+        usage = getattr(getattr(result, "usage", None), "total_tokens", None)
+        if isinstance(usage, (int, float)):
+            with self._cond:
+                self._buckets[provider][1].tokens -= usage - tokens
+        return result
+
+
+@contextlib.contextmanager
+def priority(level: int):
+    """Run the enclosed LLM calls (and work submitted with submit_in_context) at `level`."""
+    token = llm_priority.set(level)
+    try:
+        yield
+    finally:
+        llm_priority.reset(token)
+
+
+# Process-wide scheduler shared by every outbound LLM call
+scheduler = LLMScheduler()
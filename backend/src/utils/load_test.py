@@ -0,0 +1,515 @@
+"""
+Concurrent load test for the HTTP API with stubbed LLM providers.
+
+Starts a local stand-in for the OpenAI and Groq chat-completion endpoints
+(configurable latency and error rate), launches the Flask app (development
+server or gunicorn) pointed at it via OPENAI_BASE_URL / GROQ_BASE_URL and at a
+scratch copy of the mappings library, then replays a mix of multipart
+/api/map_files uploads and /api/mappings CRUD traffic at a fixed concurrency.
+
+Reports throughput, p50/p95/p99 latency and error rate per operation, the
+stub's call counts and the peak RSS of the server process tree.
+
+Usage:
+    python src/utils/load_test.py --concurrency 8 --duration 60
+    python src/utils/load_test.py --server gunicorn --workers 2 --llm-latency-ms 800 --llm-error-rate 0.05
+    python src/utils/load_test.py --url http://127.0.0.1:5000 --pid 1234   # existing server
+
+The server inherits the environment, so the local LLM quotas it enforces can be
+set as usual (e.g. GROQ_RPM=600 OPENAI_RPM=5000) to test beyond the defaults.
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+import argparse
+import ast
+import json
+import random
+import re
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+# Operation mix replayed by every client thread (relative weights)
+DEFAULT_MIX = {
+    "map_files": 0.25,
+    "list_mappings": 0.25,
+    "query_mappings": 0.2,
+    "get_mapping": 0.1,
+    "create_mapping": 0.1,
+    "update_mapping": 0.06,
+    "delete_mapping": 0.04,
+}
+
+# Canonical fields with naming variants and example values for synthetic uploads
+FIELD_VOCABULARY = {
+    "container_number": (["ContainerNo", "CntrNbr", "container_number", "EquipmentId"], lambda r: f"MSCU{r.randint(0, 9999999):07d}"),
+    "vessel_name": (["VesselName", "VslName", "ship_name", "Vessel"], lambda r: r.choice(["MAERSK ESSEX", "MSC ANNA", "CMA CGM TAGE"])),
+    "voyage": (["VoyageNo", "VoyNbr", "voyage_number", "Voyage"], lambda r: f"{r.randint(100, 999)}{r.choice('EWNS')}"),
+    "port_of_loading": (["PortOfLoading", "POL", "load_port", "LoadPortCode"], lambda r: r.choice(["INMUM", "AEJEA", "SGSIN"])),
+    "port_of_discharge": (["PortOfDischarge", "POD", "discharge_port", "DischPortCode"], lambda r: r.choice(["NLRTM", "DEHAM", "USNYC"])),
+    "gross_weight": (["GrossWeight", "GrWt", "gross_weight_kg", "VGM"], lambda r: r.randint(2000, 32000)),
+    "seal_number": (["SealNumber", "SealNo", "seal_no", "CustomsSeal"], lambda r: f"SL{r.randint(100000, 999999)}"),
+    "iso_code": (["ISOCode", "IsoTypeCode", "container_type", "SizeType"], lambda r: r.choice(["22G1", "45G1", "42R1"])),
+    "movement_date": (["DateOfMovement", "ActivityDateTime", "move_dt", "EventTime"], lambda r: f"2025-0{r.randint(1, 9)}-1{r.randint(0, 9)} 10:{r.randint(10, 59)}:00"),
+    "movement_type": (["MovementType", "ActivityType", "move_type", "EventCode"], lambda r: r.choice(["GATE-IN", "GATE-OUT", "LOAD"])),
+    "booking_number": (["BookingNo", "BkgNbr", "booking_ref", "ShippingBillNo"], lambda r: f"BK{r.randint(1000000, 9999999)}"),
+    "shipper": (["ShipperName", "Shipper", "consignor", "ExporterName"], lambda r: r.choice(["Global Logistics Pvt Ltd", "Oceanic Shipping Ltd."])),
+    "consignee": (["ConsigneeName", "Consignee", "receiver", "ImporterName"], lambda r: r.choice(["Acme Imports", "Delta Trading LLC"])),
+    "full_empty": (["FullEmptyIndicator", "FE", "load_status", "StuffingStatus"], lambda r: r.choice(["F", "E"])),
+    "temperature": (["SetTemperature", "Temp", "reefer_temp_c", "TempSetting"], lambda r: round(r.uniform(-25, 12), 1)),
+    "oog": (["OutOfGauge", "OOG", "oog_flag", "OverDimension"], lambda r: r.choice(["Y", "N"])),
+    "hazardous_class": (["IMOClass", "HazClass", "dg_class", "DangerousGoodsClass"], lambda r: r.choice(["3", "8", "2.1"])),
+    "terminal": (["TerminalCode", "Terminal", "facility_code", "TerminalId"], lambda r: r.choice(["NSFT", "JNPCT", "T2"])),
+    "truck_number": (["TruckNo", "VehicleNumber", "truck_plate", "HaulierVehicle"], lambda r: f"MH{r.randint(10, 99)}AB{r.randint(1000, 9999)}"),
+    "gate_pass": (["GatePassNo", "GPNumber", "gate_pass_id", "GateTicket"], lambda r: f"GP{r.randint(100000, 999999)}"),
+}
+
+
+# -------------------------------------------------------------
+# Stub LLM server
+# -------------------------------------------------------------
+class StubLLM:
+    """Chat-completions stand-in answering description and synonym prompts."""
+
+    def __init__(self, latency_ms: float, jitter_ms: float, error_rate: float, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self.server = None
+
+    def start(self) -> str:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)) or 0)
+                status, payload = stub.respond(self.path, body)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if status == 429:
+                    self.send_header("Retry-After", "1")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="llm-stub", daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+    def respond(self, path: str, body: bytes):
+        with self.lock:
+            delay = max(0.0, self.rng.gauss(self.latency_ms, self.jitter_ms)) / 1000
+            failure = self.rng.random() < self.error_rate
+            status = self.rng.choice([429, 500]) if failure else 200
+            self.stats["calls"] += 1
+            self.stats[f"status_{status}"] += 1
+        time.sleep(delay)
+        if not path.endswith("/chat/completions"):
+            return 404, {"error": {"message": f"unknown path {path}"}}
+        if status != 200:
+            return status, {"error": {"message": "stubbed failure", "type": "rate_limit" if status == 429 else "server_error"}}
+
+        request = json.loads(body or b"{}")
+        prompt = " ".join(str(m.get("content", "")) for m in request.get("messages", []))
+        content = self._completion_text(prompt)
+        prompt_tokens, completion_tokens = len(prompt) // 4, len(content) // 4
+        return 200, {
+            "id": f"stub-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    @staticmethod
+    def _completion_text(prompt: str) -> str:
+        if "Dictionary:" in prompt:
+            fields = _prompt_fields(prompt.rsplit("Dictionary:", 1)[1])
+            return json.dumps({
+                name: {"description": " ".join(_words(name)).capitalize() + ".", "format": "string"}
+                for name in fields
+            })
+        match = re.search(r"for the term '([^']+)'", prompt)
+        if match:
+            term = match.group(1)
+            return f"{term} code, {term} number, {term} identifier"
+        return "{}"
+
+
+def _prompt_fields(text: str):
+    try:
+        return list(ast.literal_eval(text.strip()).keys())
+    except Exception:
+        # Reprs like nan or numpy scalars are not literals; the keys still are
+        return re.findall(r"'([^']+)':", text)
+
+
+def _words(name: str):
+    return [w.lower() for w in re.split(r"[^A-Za-z0-9]+", re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", name)) if w]
+
+
+# -------------------------------------------------------------
+# Synthetic workload
+# -------------------------------------------------------------
+def make_csv(rng: random.Random, variant: int, n_fields: int) -> bytes:
+    """Key/example-value sheet with n_fields fields named in the given naming variant."""
+    lines = ["Field,Example"]
+    for canonical in rng.sample(sorted(FIELD_VOCABULARY), n_fields):
+        names, example = FIELD_VOCABULARY[canonical]
+        value = str(example(rng))
+        lines.append(f"{names[variant % len(names)]},\"{value}\"")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def make_upload(rng: random.Random, n_sources: int, n_targets: int, n_fields: int):
+    """(files, metadata JSON) for one multipart /api/map_files request."""
+    files, metadata = [], {}
+    for role, count in (("source", n_sources), ("target", n_targets)):
+        for i in range(count):
+            name = f"{role}_{i}_{rng.randint(0, 10 ** 6)}.csv"
+            files.append(("files", (name, make_csv(rng, rng.randint(0, 3), n_fields), "text/csv")))
+            metadata[name] = {
+                "type": role,
+                "message_name": f"{role.upper()}-MSG-{i}",
+                "country": rng.choice(["India", "UAE", "Singapore"]),
+                "domain": "Marine",
+                "system": rng.choice(["Port of Jebel Ali", "Jawaharlal Nehru Port", "PSA"]),
+            }
+    return files, json.dumps(metadata)
+
+
+def make_mapping(rng: random.Random, mapping_id: str) -> dict:
+    pairs = []
+    for canonical in rng.sample(sorted(FIELD_VOCABULARY), 8):
+        names = FIELD_VOCABULARY[canonical][0]
+        pairs.append({"targetKey": f"TGT-MSG::{names[0]}", "sourceKey": f"SRC-MSG::{names[1]}"})
+    return {
+        "id": mapping_id,
+        "timestamp": int(time.time() * 1000),
+        "sourceCountry": rng.choice(["UAE", "India"]), "sourceDomain": "Marine", "sourceSystem": "Port of Jebel Ali",
+        "targetCountry": "India", "targetDomain": "Marine", "targetSystem": "Jawaharlal Nehru Port",
+        "mappingCount": len(pairs),
+        "approvedMappings": pairs,
+    }
+
+
+class Workload:
+    def __init__(self, base_url: str, args, seed: int = 0):
+        self.base_url = base_url.rstrip("/")
+        self.args = args
+        self.mix = DEFAULT_MIX if not args.mix else {**{k: 0.0 for k in DEFAULT_MIX}, **json.loads(args.mix)}
+        self.ids = []
+        self.ids_lock = threading.Lock()
+        self.seed = seed
+        self.counter = 0
+        self.local = threading.local()
+
+    def _client(self) -> httpx.Client:
+        if not hasattr(self.local, "client"):
+            self.local.client = httpx.Client(timeout=self.args.timeout)
+            with self.ids_lock:
+                self.counter += 1
+                self.local.rng = random.Random(self.seed * 1000 + self.counter)
+        return self.local.client
+
+    def _pick_id(self, rng, remove=False):
+        with self.ids_lock:
+            if not self.ids:
+                return None
+            i = rng.randrange(len(self.ids))
+            return self.ids.pop(i) if remove else self.ids[i]
+
+    def run_one(self, op: str):
+        """Execute one operation; returns the HTTP status (or None when skipped)."""
+        client = self._client()
+        rng = self.local.rng
+        url = self.base_url
+        if op == "map_files":
+            files, metadata = make_upload(rng, self.args.sources, self.args.targets, self.args.fields)
+            return client.post(f"{url}/api/map_files", files=files, data={"metadata": metadata}).status_code
+        if op == "list_mappings":
+            return client.get(f"{url}/api/mappings").status_code
+        if op == "query_mappings":
+            params = {"sourceCountry": rng.choice(["UAE", "India"]), "limit": 20}
+            return client.get(f"{url}/api/mappings", params=params).status_code
+        if op == "create_mapping":
+            mapping_id = f"load-{rng.getrandbits(48):x}"
+            status = client.post(f"{url}/api/mappings", json=make_mapping(rng, mapping_id)).status_code
+            if status == 201:
+                with self.ids_lock:
+                    self.ids.append(mapping_id)
+            return status
+        if op in ("get_mapping", "update_mapping"):
+            mapping_id = self._pick_id(rng)
+            if mapping_id is None:
+                return None
+            if op == "get_mapping":
+                return client.get(f"{url}/api/mappings/{mapping_id}").status_code
+            return client.put(f"{url}/api/mappings/{mapping_id}", json=make_mapping(rng, mapping_id)).status_code
+        if op == "delete_mapping":
+            mapping_id = self._pick_id(rng, remove=True)
+            if mapping_id is None:
+                return None
+            return client.delete(f"{url}/api/mappings/{mapping_id}").status_code
+        raise ValueError(f"Unknown operation {op}")
+
+
+# -------------------------------------------------------------
+# Server process + RSS sampling
+# -------------------------------------------------------------
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _process_tree(pid: int):
+    parents = defaultdict(list)
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+                parents[ppid].append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(parents.get(current, []))
+    return tree
+
+
+def tree_rss_mb(pid: int) -> float:
+    """Resident memory of a process and all its descendants (Linux /proc)."""
+    total_kb = 0
+    for member in _process_tree(pid):
+        try:
+            with open(f"/proc/{member}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+class RSSSampler:
+    def __init__(self, pid: int, interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, tree_rss_mb(self.pid))
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def start_server(args, llm_url: str, workdir: Path):
+    """Launch the app against the stub; returns (process, base_url)."""
+    port = _free_port()
+    mappings_file = workdir / "mappings.json"
+    shutil.copy(args.mappings or BACKEND_DIR / "data" / "mappings.json", mappings_file)
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": f"{llm_url}/v1",
+        "GROQ_BASE_URL": llm_url,
+        "token": "stub-key", "OPENAI_API_KEY": "stub-key", "grok2": "stub-key",
+        "MATRI_MAPPINGS_FILE": str(mappings_file),
+        "MATRI_PROFILE_DIR": str(workdir / "profiles"),
+        "MATRI_BIND": f"127.0.0.1:{port}",
+        "MATRI_WORKERS": str(args.workers),
+        "MATRI_THREADS": str(args.threads),
+    }
+    if args.server == "gunicorn":
+        cmd = ["gunicorn", "-c", "gunicorn.conf.py", "app:app"]
+    else:
+        cmd = [sys.executable, "-c",
+               f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True, debug=False)"]
+    log = open(workdir / "server.log", "wb")
+    process = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}, see {workdir / 'server.log'}")
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"Server did not become healthy within {args.startup_timeout}s")
+
+
+# -------------------------------------------------------------
+# Driver + report
+# -------------------------------------------------------------
+def run_load(workload: Workload, concurrency: int, duration: float = None, total: int = None):
+    """Replay the operation mix from `concurrency` threads. Returns [(op, status, seconds, error)]."""
+    ops, weights = zip(*[(op, w) for op, w in workload.mix.items() if w > 0])
+    results, lock = [], threading.Lock()
+    stop_at = time.time() + duration if duration else None
+    issued = iter(range(total)) if total else None
+    issued_lock = threading.Lock()
+
+    def client_loop(seed):
+        rng = random.Random(seed)
+        while True:
+            if stop_at is not None and time.time() >= stop_at:
+                return
+            if issued is not None:
+                with issued_lock:
+                    if next(issued, None) is None:
+                        return
+            op = rng.choices(ops, weights)[0]
+            t = time.perf_counter()
+            status, error = None, None
+            try:
+                status = workload.run_one(op)
+                if status is None:
+                    continue
+            except Exception as err:
+                error = type(err).__name__
+            with lock:
+                results.append((op, status, time.perf_counter() - t, error))
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load-client") as pool:
+        for i in range(concurrency):
+            pool.submit(client_loop, i)
+    return results
+
+
+def summarize(results, elapsed: float):
+    """Per-operation and overall throughput, latency percentiles and error rate."""
+    by_op = defaultdict(list)
+    for row in results:
+        by_op[row[0]].append(row)
+    by_op["ALL"] = list(results)
+
+    report = {}
+    for op, rows in by_op.items():
+        latencies = np.array([r[2] for r in rows]) * 1000
+        failed = [r for r in rows if r[3] is not None or r[1] is None or r[1] >= 400]
+        report[op] = {
+            "requests": len(rows),
+            "throughput_rps": round(len(rows) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(float(np.percentile(latencies, 50)), 1) if len(rows) else None,
+            "p95_ms": round(float(np.percentile(latencies, 95)), 1) if len(rows) else None,
+            "p99_ms": round(float(np.percentile(latencies, 99)), 1) if len(rows) else None,
+            "error_rate": round(len(failed) / len(rows), 4) if rows else 0.0,
+            "statuses": dict(Counter(str(r[1]) if r[3] is None else r[3] for r in rows)),
+        }
+    return report
+
+
+def print_report(report, peak_rss_mb, stub_stats, elapsed):
+    print(f"\n{'operation':<16} {'reqs':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}  statuses")
+    for op in sorted(report, key=lambda name: (name == "ALL", name)):
+        row = report[op]
+        print(f"{op:<16} {row['requests']:>6} {row['throughput_rps']:>8} {row['p50_ms']:>9} {row['p95_ms']:>9} "
+              f"{row['p99_ms']:>9} {row['error_rate']:>7.2%}  {row['statuses']}")
+    print(f"\n✅ {elapsed:.1f}s elapsed, peak server RSS {peak_rss_mb:.0f} MB, stub LLM {dict(stub_stats)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load-test the API with stubbed LLM providers.")
+    parser.add_argument("--url", help="test an already running server instead of starting one")
+    parser.add_argument("--pid", type=int, help="server pid for RSS sampling when --url is used")
+    parser.add_argument("--server", choices=["flask", "gunicorn"], default="flask")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent client threads")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to run (ignored with --requests)")
+    parser.add_argument("--requests", type=int, help="stop after this many requests")
+    parser.add_argument("--mix", help='JSON operation weights, e.g. \'{"map_files": 1}\'')
+    parser.add_argument("--sources", type=int, default=2, help="source CSVs per upload")
+    parser.add_argument("--targets", type=int, default=1, help="target CSVs per upload")
+    parser.add_argument("--fields", type=int, default=12, help="fields per CSV")
+    parser.add_argument("--llm-latency-ms", type=float, default=400)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--mappings", help="mappings.json to seed the scratch library with")
+    parser.add_argument("--timeout", type=float, default=300, help="client request timeout (seconds)")
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    stub = StubLLM(args.llm_latency_ms, args.llm_jitter_ms, args.llm_error_rate, seed=args.seed)
+    llm_url = stub.start()
+    workdir = Path(tempfile.mkdtemp(prefix="matri-load-"))
+    process = None
+    try:
+        if args.url:
+            base_url, pid = args.url, args.pid
+        else:
+            process, base_url = start_server(args, llm_url, workdir)
+            pid = process.pid
+            print(f"✅ Server ({args.server}) up at {base_url}, LLM stub at {llm_url}, scratch dir {workdir}")
+        sampler = RSSSampler(pid).start() if pid else None
+
+        t = time.time()
+        results = run_load(Workload(base_url, args, seed=args.seed), args.concurrency,
+                           duration=None if args.requests else args.duration, total=args.requests)
+        elapsed = time.time() - t
+        if sampler is not None:
+            sampler.stop()
+
+        report = summarize(results, elapsed)
+        peak = sampler.peak_mb if sampler is not None else 0.0
+        print_report(report, peak, stub.stats, elapsed)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"operations": report, "peak_rss_mb": round(peak, 1), "elapsed_sec": round(elapsed, 2),
+                           "stub_llm": dict(stub.stats), "args": vars(args)}, f, indent=2)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        stub.stop()
@@ -0,0 +1,198 @@
+"""
+In-memory secondary indexes over the saved mappings library (data/mappings.json).
+
+The index is kept in step with the file by the mapping CRUD endpoints
+(upsert / remove after every successful write) and is rebuilt from disk
+whenever the file's mtime or size no longer matches what was last seen, e.g.
+after another gunicorn worker wrote it.
+
+Queries combine equality filters on the system fields, a timestamp range and
+key search by intersecting posting sets, and page through the matches in
+(timestamp desc, id) order with an opaque cursor.
+"""
+import base64
+import bisect
+import json
+import re
+import threading
+from typing import Callable, Dict, List, Optional
+
+# Equality-filterable fields (matched case-insensitively)
+INDEXED_FIELDS = (
+    "sourceCountry", "sourceDomain", "sourceSystem",
+    "targetCountry", "targetDomain", "targetSystem",
+)
+
+
+def word_tokens(text: str) -> set:
+    """Lowercased words of a field name or search term, split at camelCase and punctuation."""
+    words = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text)
+    return {w.lower() for w in re.split(r"[^A-Za-z0-9]+", words) if w}
+
+
+def key_tokens(key: str) -> set:
+    """Search tokens of an approved key like 'ADP-M-CODACO::DateOfMovement'."""
+    message, _, field = key.rpartition("::")
+    tokens = word_tokens(field)
+    tokens.update({message.lower(), field.lower(), key.lower()} - {""})
+    return tokens
+
+
+def encode_cursor(sort_key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(sort_key)).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    try:
+        timestamp, mapping_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return timestamp, str(mapping_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def summarize(mapping: Dict) -> Dict:
+    """List view of a mapping: everything except the approvedMappings payload."""
+    summary = {k: v for k, v in mapping.items() if k != "approvedMappings"}
+    summary.setdefault("mappingCount", len(mapping.get("approvedMappings", [])))
+    return summary
+
+
+class MappingIndex:
+    def __init__(self, loader: Callable[[], List[Dict]], stat: Callable[[], Optional[tuple]]):
+        """loader returns the saved mappings; stat returns a (mtime, size) fingerprint of the file."""
+        self._loader = loader
+        self._stat = stat
+        self._lock = threading.RLock()
+        self._fingerprint = None
+        self._clear()
+
+    def _clear(self):
+        self.by_id = {}
+        self.sort_keys = []  # ascending (timestamp, id); pages are served from the end
+        self.fields = {field: {} for field in INDEXED_FIELDS}
+        self.tokens = {}
+
+    # ---------------------------------------------------------
+    # Maintenance
+    # ---------------------------------------------------------
+    @staticmethod
+    def _sort_key(mapping: Dict):
+        timestamp = mapping.get("timestamp")
+        return (timestamp if isinstance(timestamp, (int, float)) else 0, str(mapping.get("id", "")))
+
+    def _add(self, mapping: Dict):
+        mapping_id = str(mapping.get("id", ""))
+        self.by_id[mapping_id] = mapping
+        bisect.insort(self.sort_keys, self._sort_key(mapping))
+        for field in INDEXED_FIELDS:
+            value = str(mapping.get(field, "")).strip().lower()
+            self.fields[field].setdefault(value, set()).add(mapping_id)
+        for approved in mapping.get("approvedMappings", []):
+            for key in (approved.get("sourceKey", ""), approved.get("targetKey", "")):
+                for token in key_tokens(key):
+                    self.tokens.setdefault(token, set()).add(mapping_id)
+
+    def _discard(self, mapping_id: str):
+        mapping = self.by_id.pop(mapping_id, None)
+        if mapping is None:
+            return
+        sort_key = self._sort_key(mapping)
+        i = bisect.bisect_left(self.sort_keys, sort_key)
+        if i < len(self.sort_keys) and self.sort_keys[i] == sort_key:
+            del self.sort_keys[i]
+        for field in INDEXED_FIELDS:
+            value = str(mapping.get(field, "")).strip().lower()
+            self._unpost(self.fields[field], value, mapping_id)
+        for approved in mapping.get("approvedMappings", []):
+            for key in (approved.get("sourceKey", ""), approved.get("targetKey", "")):
+                for token in key_tokens(key):
+                    self._unpost(self.tokens, token, mapping_id)
+
+    @staticmethod
+    def _unpost(postings: Dict[str, set], value: str, mapping_id: str):
+        ids = postings.get(value)
+        if ids is not None:
+            ids.discard(mapping_id)
+            if not ids:
+                del postings[value]
+
+    def rebuild(self):
+        with self._lock:
+            self._fingerprint = self._stat()
+            self._clear()
+            for mapping in self._loader():
+                self._add(mapping)
+
+    def _ensure_fresh(self):
+        if self._fingerprint is None or self._stat() != self._fingerprint:
+            self.rebuild()
+
+    def _apply_write(self, before, change: Callable[[], None]):
+        # Apply our own write incrementally only if the index matched the file
+        # right before it; otherwise rebuild lazily on the next query.
+        if self._fingerprint is not None and before == self._fingerprint:
+            change()
+            self._fingerprint = self._stat()
+        else:
+            self._fingerprint = None
+
+    def upsert(self, mapping: Dict, before: Optional[tuple]):
+        """Reflect a mapping that was just written (created or updated); `before` is the pre-write stat."""
+        def change():
+            self._discard(str(mapping.get("id", "")))
+            self._add(mapping)
+        with self._lock:
+            self._apply_write(before, change)
+
+    def remove(self, mapping_id: str, before: Optional[tuple]):
+        """Reflect a mapping that was just deleted; `before` is the pre-write stat."""
+        with self._lock:
+            self._apply_write(before, lambda: self._discard(str(mapping_id)))
+
+    # ---------------------------------------------------------
+    # Queries
+    # ---------------------------------------------------------
+    def get(self, mapping_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._ensure_fresh()
+            return self.by_id.get(str(mapping_id))
+
+    def query(self, filters: Dict[str, str] = None, since=None, until=None, key: str = None,
+              cursor: str = None, limit: int = 50) -> Dict:
+        """
+        Mappings matching every filter, newest first.
+        filters: {indexed field: value}; since/until: inclusive timestamp bounds;
+        key: search term matched against the approved source/target keys.
+        Returns {"items": [summary, ...], "next_cursor": str or None, "total": int}.
+        """
+        with self._lock:
+            self._ensure_fresh()
+            candidates = None
+            for field, value in (filters or {}).items():
+                ids = self.fields[field].get(str(value).strip().lower(), set())
+                candidates = set(ids) if candidates is None else candidates & ids
+            if key:
+                for token in key_tokens(key) if "::" in key else word_tokens(key):
+                    ids = self.tokens.get(token, set())
+                    candidates = set(ids) if candidates is None else candidates & ids
+
+            if candidates is None:
+                lo = 0 if since is None else bisect.bisect_left(self.sort_keys, (since, ""))
+                hi = len(self.sort_keys) if until is None else bisect.bisect_right(self.sort_keys, (until, "\uffff"))
+                window = self.sort_keys[lo:hi]
+            else:
+                window = sorted(
+                    sort_key for sort_key in (self._sort_key(self.by_id[i]) for i in candidates)
+                    if (since is None or sort_key[0] >= since) and (until is None or sort_key[0] <= until)
+                )
+
+            # window is ascending; the cursor is the last (oldest) entry of the previous page
+            end = bisect.bisect_left(window, decode_cursor(cursor)) if cursor else len(window)
+            start = max(end - limit, 0)
+            page = window[start:end][::-1]
+            next_cursor = encode_cursor(page[-1]) if page and start > 0 else None
+            return {
+                "items": [summarize(self.by_id[mapping_id]) for _, mapping_id in page],
+                "next_cursor": next_cursor,
+                "total": len(window),
+            }
@@ -0,0 +1,120 @@
+"""
+On-demand request profiling.
+
+A SamplingProfiler samples the Python stacks of the threads working for one
+request (the request thread plus every worker started via submit_in_context,
+and the shared embedding dispatcher) at a fixed interval, and writes them in
+the folded-stack format used by flamegraph.pl / speedscope / inferno:
+
+    thread;dir/file.py:function:line;dir/file.py:function:line <count>
+
+Profiles are stored under PROFILE_DIR as <request_id>.folded together with
+<request_id>.json holding the request's stage timings; the oldest are deleted
+once there are more than PROFILE_MAX_FILES.
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from src.config import PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_MS, PROFILE_ALLOW_HEADER, PROFILE_MAX_FILES
+from src.utils.request_context import threads_for_request
+
+# Shared threads whose work is attributed to whichever request is profiled
+SHARED_THREADS = {"embedding-batcher"}
+
+
+def should_profile(headers) -> bool:
+    """Profile when asked for with 'X-Profile: 1' or when sampled by PROFILE_SAMPLE_RATE."""
+    if PROFILE_ALLOW_HEADER and headers.get("X-Profile", "").lower() in {"1", "true", "yes"}:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    path = "/".join(code.co_filename.replace(os.sep, "/").split("/")[-2:])
+    return f"{path}:{code.co_name}:{frame.f_lineno}"
+
+
+class SamplingProfiler:
+    def __init__(self, request_id: str, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.request_id = request_id
+        self.interval = interval_ms / 1000.0
+        self.samples = Counter()
+        self.sample_count = 0
+        self.started = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{self.request_id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.time() - self.started
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            wanted = threads_for_request(self.request_id)
+            wanted.update(ident for ident, name in names.items() if name in SHARED_THREADS)
+            for ident, frame in sys._current_frames().items():
+                if ident == own or ident not in wanted:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def save(self, stages=None, extra=None, directory: Path = PROFILE_DIR) -> Path:
+        """Write <request_id>.folded and <request_id>.json; returns the folded path."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        folded = directory / f"{self.request_id}.folded"
+        with open(folded, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(directory / f"{self.request_id}.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "request_id": self.request_id,
+                "duration_sec": round(self.duration, 4),
+                "interval_ms": self.interval * 1000,
+                "sample_rounds": self.sample_count,
+                "stages": stages or [],
+                **(extra or {}),
+            }, f, indent=2)
+        prune_profiles(directory)
+        return folded
+
+
+def prune_profiles(directory: Path = PROFILE_DIR, keep: int = PROFILE_MAX_FILES):
+    """Delete all but the `keep` newest profiles (.folded + .json) in `directory`."""
+    def mtime(path):
+        try:
+            return path.stat().st_mtime
+        except OSError:
+            return 0.0   # already deleted by another worker
+    profiles = sorted(Path(directory).glob("*.folded"), key=mtime, reverse=True)
+    for folded in profiles[max(keep, 0):]:
+        for path in (folded, folded.with_suffix(".json")):
+            try:
+                path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,86 @@
+"""
+Batched record transformation shared by the OpenAI (helper.transform_data_batch)
+and Groq (transformation_llm.transform_records) paths.
+
+The mappings, target structure and rules are sent once per batch together with
+an array of {"record_id", "source"} entries; the model answers with
+{"records": [{"record_id", "target"}]}. This module packs records into batches
+under a prompt and a response token budget, sends one batch (waiting out a busy
+LLM quota instead of splitting the batch up) and parses the response per record.
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+import json
+import time
+from typing import Callable, Dict, List
+
+from src.config import TRANSFORM_BUSY_RETRIES
+from src.utils.llm_scheduler import SchedulerBusy
+from src.utils.deadline import check, timeout_for
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for prompt budgeting."""
+    return max(1, len(str(text)) // 4)
+
+
+def record_entry(i: int, record) -> Dict:
+    return {"record_id": i, "source": record}
+
+
+def output_tokens_per_record(target_keys) -> int:
+    """Expected response tokens of one transformed record."""
+    return estimate_tokens(json.dumps({"record_id": 0, "target": {k: "x" * 12 for k in target_keys}}))
+
+
+def make_batches(records: List, target_keys, base_tokens: int, prompt_budget: int, output_budget: int) -> List[List[int]]:
+    """
+    Group record indices so that the shared prompt (base_tokens) plus the records stays
+    under prompt_budget and the expected response stays under output_budget.
+    """
+    per_output = output_tokens_per_record(target_keys)
+    batches, current, used_in, used_out = [], [], base_tokens, 0
+    for i, record in enumerate(records):
+        cost = estimate_tokens(json.dumps(record_entry(i, record), default=str))
+        if current and (used_in + cost > prompt_budget or used_out + per_output > output_budget):
+            batches.append(current)
+            current, used_in, used_out = [], base_tokens, 0
+        current.append(i)
+        used_in += cost
+        used_out += per_output
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_batch(result, indices: List[int], target_keys) -> Dict[int, dict]:
+    """{record index: target dict in target key order} for the well-formed entries of a batch response."""
+    parsed = {}
+    for item in result.get("records", []) if isinstance(result, dict) else []:
+        if not isinstance(item, dict) or not isinstance(item.get("target"), dict):
+            continue
+        try:
+            record_id = int(item.get("record_id"))
+        except (TypeError, ValueError):
+            continue
+        if record_id in indices:
+            parsed[record_id] = {key: item["target"].get(key) for key in target_keys}
+    return parsed
+
+
+def send_batch(send: Callable, indices: List[int], retries: int = TRANSFORM_BUSY_RETRIES):
+    """
+    send(indices) with the whole batch retried after the scheduler's retry_after
+    when the LLM quota is busy; SchedulerBusy is re-raised after `retries` retries
+    (resending records one by one would only queue more calls on the same quota).
+    """
+    for attempt in range(retries + 1):
+        try:
+            return send(indices)
+        except SchedulerBusy as err:
+            if attempt == retries:
+                raise
+            print(f"⚠️ LLM quota busy, retrying batch of {len(indices)} records in {err.retry_after:.1f} sec")
+            time.sleep(timeout_for(err.retry_after))
+            check("batch transformation")
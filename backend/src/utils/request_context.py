@@ -0,0 +1,83 @@
+"""
+Per-request context that follows work into thread pools.
+
+ThreadPoolExecutor workers do not inherit contextvars, so anything submitted
+on behalf of a request should go through submit_in_context to keep the
+request's priority and id visible in nested calls.
+"""
+import contextvars
+import threading
+import time
+import uuid
+
+# Priority class of outbound LLM calls (see llm_scheduler.INTERACTIVE / BULK)
+llm_priority = contextvars.ContextVar("llm_priority", default=0)
+# Identifies the originating request; used for fair queuing across requests
+request_id = contextvars.ContextVar("request_id", default="default")
+# Per-request list of stage timings (see record_stage); None outside a request
+stage_stats = contextvars.ContextVar("stage_stats", default=None)
+
+# thread ident -> request id of the work that thread is currently running
+_thread_requests = {}
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def _run_tracked(fn, *args, **kwargs):
+    # Lets the profiler attribute worker threads to the request they serve
+    ident = threading.get_ident()
+    previous = _thread_requests.get(ident)
+    _thread_requests[ident] = request_id.get()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        if previous is None:
+            _thread_requests.pop(ident, None)
+        else:
+            _thread_requests[ident] = previous
+
+
+def submit_in_context(executor, fn, *args, **kwargs):
+    """executor.submit that runs fn inside a copy of the caller's context."""
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, _run_tracked, fn, *args, **kwargs)
+
+
+def threads_for_request(rid: str) -> set:
+    """Idents of the threads currently running work for request `rid`."""
+    return {ident for ident, owner in list(_thread_requests.items()) if owner == rid}
+
+
+def bind_thread():
+    """Mark the calling thread as working for the current request."""
+    _thread_requests[threading.get_ident()] = request_id.get()
+
+
+def unbind_thread():
+    _thread_requests.pop(threading.get_ident(), None)
+
+
+def record_stage(name: str, seconds: float, **details):
+    """Attach a stage timing to the current request (no-op outside a request)."""
+    stats = stage_stats.get()
+    if stats is not None:
+        stats.append({"stage": name, "seconds": round(seconds, 4),
+                      "thread": threading.current_thread().name, "at": time.time(), **details})
+
+
+def iterate_in_context(generator):
+    """
+    Drive a generator inside a copy of the current context, e.g. a streamed
+    response body that is consumed after the view function has returned.
+    """
+    ctx = contextvars.copy_context()
+
+    def _iterate():
+        while True:
+            try:
+                yield ctx.run(next, generator)
+            except StopIteration:
+                return
+    return _iterate()
@@ -0,0 +1,139 @@
+"""
+Columnar representation of mapping scores.
+
+Scores for one source/target message pair are held as a float32 tensor of shape
+(targets x sources x components) with the key lists as index arrays, plus one
+metadata dict for the whole file pair. The per-pair dict shape returned by the
+API is only materialized at the boundary (to_dict / ranked_entries).
+"""
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from src.config import SCORE_WEIGHTS, SCORE_COMPONENTS, PREVIEW_WEIGHTS
+
+
+class ScoreTensor:
+    def __init__(self, target_keys: Sequence[str], source_keys: Sequence[str],
+                 scores: np.ndarray = None, components: Sequence[str] = SCORE_COMPONENTS,
+                 metadata: Dict = None, weights: Dict[str, float] = None, tier: str = "full"):
+        self.target_keys = np.asarray(list(target_keys), dtype=object)
+        self.source_keys = np.asarray(list(source_keys), dtype=object)
+        self.components = tuple(components)
+        if scores is None:
+            scores = np.zeros((len(self.target_keys), len(self.source_keys), len(self.components)), dtype=np.float32)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.metadata = metadata or {}
+        # Weights used when none are passed explicitly; a preview tensor ranks
+        # with PREVIEW_WEIGHTS until its LLM components have been filled in.
+        self.weights = weights or SCORE_WEIGHTS
+        self.tier = tier
+        # (T,) bool: target rows whose LLM tier was cut short by a deadline
+        # (tier "partial"); those rows keep ranking with PREVIEW_WEIGHTS.
+        self.partial_rows = None
+
+    @property
+    def shape(self):
+        return self.scores.shape
+
+    def component(self, name: str) -> np.ndarray:
+        """(T, S) view of one component."""
+        return self.scores[:, :, self.components.index(name)]
+
+    def weight_vector(self, weights: Dict[str, float] = None) -> np.ndarray:
+        weights = weights or self.weights
+        return np.array([weights.get(name, 0.0) for name in self.components], dtype=np.float32)
+
+    def final_scores(self, weights: Dict[str, float] = None) -> np.ndarray:
+        """(T, S) weighted sum of the components."""
+        final = self.scores @ self.weight_vector(weights)
+        if weights is None and self.partial_rows is not None and self.partial_rows.any():
+            preview = self.scores[self.partial_rows] @ self.weight_vector(PREVIEW_WEIGHTS)
+            final[self.partial_rows] = preview
+        return final
+
+    def row_status(self, ti: int) -> str:
+        """'complete' if target row `ti` holds fully refined scores, else 'partial'."""
+        if self.tier == "full" or (self.tier == "partial" and not self.partial_rows[ti]):
+            return "complete"
+        return "partial"
+
+    def with_metadata(self, **metadata) -> "ScoreTensor":
+        """Attach file-level metadata once instead of copying it into every entry."""
+        self.metadata.update(metadata)
+        return self
+
+    # ---------------------------------------------------------
+    # API boundary
+    # ---------------------------------------------------------
+    def to_dict(self, weights: Dict[str, float] = None) -> Dict[str, List[Dict]]:
+        """Legacy shape: {tgt_key: [{source_key, <components>, final_score}, ...]}."""
+        final = self.final_scores(weights)
+        result = {}
+        for ti, tgt_key in enumerate(self.target_keys):
+            rows = []
+            for si, src_key in enumerate(self.source_keys):
+                row = {"source_key": src_key}
+                row.update(zip(self.components, self.scores[ti, si].tolist()))
+                row["final_score"] = float(final[ti, si])
+                rows.append(row)
+            result[tgt_key] = rows
+        return result
+
+    def ranked_entries(self, weights: Dict[str, float] = None, top_k: int = None) -> Dict[str, List[Dict]]:
+        """
+        Per target key, the source keys sorted by final_score (best first) with
+        this tensor's metadata merged into every entry.
+        """
+        final = self.final_scores(weights)
+        order = np.argsort(-final, axis=1, kind="stable")
+        if top_k is not None:
+            order = order[:, :top_k]
+        result = {}
+        for ti, tgt_key in enumerate(self.target_keys):
+            result[tgt_key] = [
+                {"final_score": float(final[ti, si]), "source_key": self.source_keys[si], **self.metadata}
+                for si in order[ti]
+            ]
+        return result
+
+
+def rank_across(tensors: List[ScoreTensor], weights: Dict[str, float] = None, top_k: int = None) -> Dict[str, List[Dict]]:
+    """
+    Rank sources from several tensors that share the same target keys (one tensor
+    per source file) in a single argsort. Each entry carries its tensor's metadata.
+
+    Scores weighted with SCORE_WEIGHTS and PREVIEW_WEIGHTS are not comparable, so
+    unless explicit weights are given, a target row that is partial in any tensor
+    (preview tier or cut short by a deadline) is ranked with PREVIEW_WEIGHTS across
+    all tensors, and all of its entries are reported as "partial".
+    """
+    if not tensors:
+        return {}
+    target_keys = tensors[0].target_keys
+    final = np.concatenate([t.final_scores(weights) for t in tensors], axis=1)
+    mixed = np.zeros(len(target_keys), dtype=bool)
+    if weights is None:
+        mixed = np.array([any(t.row_status(ti) != "complete" for t in tensors) for ti in range(len(target_keys))],
+                         dtype=bool).reshape(len(target_keys))
+        if mixed.any():
+            final[mixed] = np.concatenate([t.scores[mixed] @ t.weight_vector(PREVIEW_WEIGHTS) for t in tensors], axis=1)
+    owner = np.concatenate([np.full(len(t.source_keys), i) for i, t in enumerate(tensors)])
+    local = np.concatenate([np.arange(len(t.source_keys)) for t in tensors])
+    order = np.argsort(-final, axis=1, kind="stable")
+    if top_k is not None:
+        order = order[:, :top_k]
+
+    result = {}
+    for ti, tgt_key in enumerate(target_keys):
+        entries = []
+        for col in order[ti]:
+            tensor = tensors[owner[col]]
+            entries.append({
+                "final_score": float(final[ti, col]),
+                "source_key": tensor.source_keys[local[col]],
+                "status": "partial" if mixed[ti] else tensor.row_status(ti),
+                **tensor.metadata,
+            })
+        result[tgt_key] = entries
+    return result
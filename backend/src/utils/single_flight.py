@@ -0,0 +1,67 @@
+"""
+Request coalescing ("single-flight") for LLM and embedding calls.
+
+When several threads ask for the same thing at the same moment, only the first
+one (the leader) performs the call; the others wait on the leader's future and
+receive the same result or the same exception. Once the call has finished the
+key is released, so later requests go through the regular caches again.
+"""
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable, Tuple
+
+
+def flight_key(provider: str, model: str, payload: Any) -> Tuple[str, str, str]:
+    """Identity of a request: provider, model and the normalized payload."""
+    if isinstance(payload, str):
+        normalized = payload.strip().lower()
+    else:
+        normalized = json.dumps(payload, sort_keys=True, default=str)
+    return provider, model, normalized
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    def do(self, key: Hashable, fn: Callable, *args, timeout: float = None, **kwargs):
+        """
+        Run fn(*args, **kwargs) unless an identical call is already in flight,
+        in which case wait for its result. `timeout` only bounds the wait of the
+        followers (concurrent.futures.TimeoutError); the leader is never interrupted.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.stats["calls"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            return future.result(timeout=timeout)
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+# Shared by every outbound call; keys carry the provider, so one registry is enough.
+inflight = SingleFlight()
@@ -4,6 +4,12 @@ import json
 from groq import Groq
 from collections import OrderedDict
 import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+from src.utils.llm_scheduler import scheduler, priority, BULK, SchedulerBusy
+from src.utils.record_batches import (
+    estimate_tokens, record_entry, output_tokens_per_record, make_batches, parse_batch, send_batch,
+)
 grok_api_key = os.getenv('grok_api_key')
 # Initialize Groq client
 client = Groq(api_key= grok_api_key)
@@ -81,8 +87,40 @@ target_dict = OrderedDict([
 with open("mappings.json", "r", encoding="utf-8") as f:
     mappings = json.load(f)
 
-# Construct the prompt with raw strings for regex
-prompt = f"""
+TRANSFORM_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"  # More reliable for structured JSON output
+SYSTEM_PROMPT = "You are a data transformation bot. Return only valid JSON matching the target dictionary structure, enclosed in curly braces. Do not include any additional text or code blocks."
+# Batched mode: prompt/response budgets per request (estimated tokens), sized so one
+# bulk call fits the Groq tokens/min bucket (prompt + response <= GROQ_CALL_TOKENS)
+GROQ_CALL_TOKENS = scheduler.call_budget("groq", BULK)
+BATCH_OUTPUT_TOKENS = min(6000, GROQ_CALL_TOKENS // 2)
+BATCH_PROMPT_TOKENS = min(6000, GROQ_CALL_TOKENS - BATCH_OUTPUT_TOKENS)
+# Single-record mode: response budget per call
+RECORD_OUTPUT_TOKENS = min(2000, GROQ_CALL_TOKENS // 2)
+
+# Shared instruction block (raw string so the regexes reach the model unchanged)
+INSTRUCTIONS = r"""### Instructions
+1. For each target key in the target dictionary structure, find the corresponding source key in the mappings.
+2. If the mapping is null or the source key is missing, set the target value to null.
+3. Apply the transformation from source_format to target_format as specified in the mappings:
+   - For strings, copy or truncate/pad as needed (e.g., truncate to 3 characters for ShippingAgentCode).
+   - For dates, convert between specified formats (e.g., 'DD/Mon/YYYY hh:mm:ss AM/PM' to 'DDMMYYYYHHmmss').
+   - For integers, convert strings to integers; if conversion fails, return null.
+   - For floats (e.g., weight in metric tons), copy or convert as specified; if invalid, return null.
+   - For numeric strings, pad with leading zeros or adjust length as needed.
+   - If the source value is None, return null.
+4. Validate that the transformed value matches the target_format; if not, return null. Use these validation rules:
+   - Date (DDMMYYYYHHmmss): Matches regex r'^\d{12}$'.
+   - Weight in metric tons (float): Valid float with optional 'M.T.' suffix.
+   - String (alphanumeric, X characters): Exact length X, alphanumeric characters (regex r'^[A-Za-z0-9]{X}$').
+   - String (alphanumeric, X-Y characters): Length between X and Y, alphanumeric (regex r'^[A-Za-z0-9]{X,Y}$').
+   - Integer: Valid integer.
+5. Preserve the exact key order of the target dictionary structure.
+"""
+
+
+def build_prompt(source_dict):
+    # Construct the prompt with raw strings for regex
+    return f"""
 You are a data transformation expert. Your task is to transform a source dictionary into a target dictionary based on the provided mappings. The target dictionary must maintain the exact key order as specified and contain only the keys listed in the target structure. For each target key, apply the transformation rules from the mappings. If a source value is None, a mapping is null, or a transformation fails (e.g., format mismatch), set the target value to null. Ensure the output is valid JSON with the specified key order.
 
 ### Mappings
@@ -100,59 +138,128 @@ You are a data transformation expert. Your task is to transform a source diction
 {json.dumps(dict(target_dict), indent=2)}
 ```
 
-### Instructions
-1. For each target key in the target dictionary structure, find the corresponding source key in the mappings.
-2. If the mapping is null or the source key is missing, set the target value to null.
-3. Apply the transformation from source_format to target_format as specified in the mappings:
-   - For strings, copy or truncate/pad as needed (e.g., truncate to 3 characters for ShippingAgentCode).
-   - For dates, convert between specified formats (e.g., 'DD/Mon/YYYY hh:mm:ss AM/PM' to 'DDMMYYYYHHmmss').
-   - For integers, convert strings to integers; if conversion fails, return null.
-   - For floats (e.g., weight in metric tons), copy or convert as specified; if invalid, return null.
-   - For numeric strings, pad with leading zeros or adjust length as needed.
-   - If the source value is None, return null.
-4. Validate that the transformed value matches the target_format; if not, return null. Use these validation rules:
-   - Date (DDMMYYYYHHmmss): Matches regex r'^\d{{12}}$'.
-   - Weight in metric tons (float): Valid float with optional 'M.T.' suffix.
-   - String (alphanumeric, X characters): Exact length X, alphanumeric characters (regex r'^[A-Za-z0-9]{{X}}$').
-   - String (alphanumeric, X-Y characters): Length between X and Y, alphanumeric (regex r'^[A-Za-z0-9]{{X,Y}}$').
-   - Integer: Valid integer.
-5. Preserve the exact key order of the target dictionary structure.
-6. Return only the transformed target dictionary as valid JSON, enclosed in curly braces {{}}. Do not include any additional text, explanations, or code blocks.
+{INSTRUCTIONS}6. Return only the transformed target dictionary as valid JSON, enclosed in curly braces {{}}. Do not include any additional text, explanations, or code blocks.
 
 ### Output
 Return the transformed target dictionary in JSON format, maintaining the key order.
 """
 
-# Send prompt to Groq API
-response = client.chat.completions.create(
-    model="meta-llama/llama-4-scout-17b-16e-instruct",  # More reliable for structured JSON output
-    messages=[
-        {"role": "system", "content": "You are a data transformation bot. Return only valid JSON matching the target dictionary structure, enclosed in curly braces. Do not include any additional text or code blocks."},
-        {"role": "user", "content": prompt}
-    ],
-    temperature=0.0,
-    max_tokens=2000
-)
 
-# Parse the response
-try:
-    transformed_dict = json.loads(response.choices[0].message.content)
-except json.JSONDecodeError as e:
-    print(f"Error: Groq returned invalid JSON: {e}")
-    transformed_dict = dict(target_dict)  # Fallback to null values
+def build_batch_prompt(records):
+    """Mappings, target structure and instructions are sent once for all records."""
+    return f"""
+You are a data transformation expert. Your task is to transform each source record into a target dictionary based on the provided mappings. Every record is transformed independently. Each target dictionary must maintain the exact key order as specified and contain only the keys listed in the target structure. For each target key, apply the transformation rules from the mappings. If a source value is None, a mapping is null, or a transformation fails (e.g., format mismatch), set the target value to null.
+
+### Mappings
+```json
+{json.dumps(mappings, indent=2)}
+```
+
+### Target Dictionary Structure (with null values)
+```json
+{json.dumps(dict(target_dict), indent=2)}
+```
+
+{INSTRUCTIONS}6. Return only a valid JSON object of the form {{"records": [{{"record_id": <id>, "target": {{...}}}}]}} with exactly one entry per source record, echoing its record_id. Do not include any additional text, explanations, or code blocks.
+
+### Source Records
+```json
+{json.dumps(records)}
+```
+
+### Output
+Return the JSON object with the transformed target dictionary of every record.
+"""
+
+
+def order_target(transformed_dict):
+    # Ensure all target keys are present, even if Groq omitted them,
+    # and convert to OrderedDict to preserve key order
+    return OrderedDict((key, transformed_dict.get(key, None)) for key in target_dict)
+
+
+def transform_record(source_dict):
+    """Transform a single source dictionary with one Groq call."""
+    prompt = build_prompt(source_dict)
+    try:
+        response = scheduler.call(
+            "groq", estimate_tokens(prompt) + RECORD_OUTPUT_TOKENS,
+            client.chat.completions.create,
+            model=TRANSFORM_MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.0,
+            max_tokens=RECORD_OUTPUT_TOKENS
+        )
+    except SchedulerBusy as e:
+        print(f"Error: Groq quota busy, record left untransformed: {e}")
+        return order_target(dict(target_dict))
+
+    # Parse the response
+    try:
+        transformed_dict = json.loads(response.choices[0].message.content)
+    except json.JSONDecodeError as e:
+        print(f"Error: Groq returned invalid JSON: {e}")
+        transformed_dict = dict(target_dict)  # Fallback to null values
+    return order_target(transformed_dict)
+
+
+def transform_records(source_records):
+    """
+    Batched mode: one Groq call per batch of records. Records missing or malformed
+    in a batch response are re-submitted individually with transform_record; a batch
+    still refused by the busy quota after its retries is left untransformed.
+    """
+    results = [None] * len(source_records)
+    base = estimate_tokens(build_batch_prompt([]))
+    for indices in make_batches(source_records, target_dict, base, BATCH_PROMPT_TOKENS, BATCH_OUTPUT_TOKENS):
+        prompt = build_batch_prompt([record_entry(i, source_records[i]) for i in indices])
+
+        def send(indices):
+            return scheduler.call(
+                "groq", estimate_tokens(prompt) + output_tokens_per_record(target_dict) * len(indices),
+                client.chat.completions.create,
+                model=TRANSFORM_MODEL,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.0,
+                max_tokens=BATCH_OUTPUT_TOKENS
+            )
+
+        try:
+            response = send_batch(send, indices)
+            batch = parse_batch(json.loads(response.choices[0].message.content), indices, target_dict)
+        except SchedulerBusy as e:
+            print(f"Error: Groq quota busy, batch of {len(indices)} records left untransformed: {e}")
+            for i in indices:
+                results[i] = order_target(dict(target_dict))
+            continue
+        except Exception as e:
+            print(f"Error: Groq batch of {len(indices)} records failed: {e}")
+            batch = {}
+        for record_id, target in batch.items():
+            results[record_id] = order_target(target)
+
+    for i, transformed in enumerate(results):
+        if transformed is None:
+            print(f"Re-submitting record {i} individually")
+            results[i] = transform_record(source_records[i])
+    return results
 
-# Ensure all target keys are present, even if Groq omitted them
-for key in target_dict:
-    if key not in transformed_dict:
-        transformed_dict[key] = None
 
-# Convert to OrderedDict to preserve key order
-ordered_transformed_dict = OrderedDict((key, transformed_dict.get(key, None)) for key in target_dict)
+if __name__ == '__main__':
+    # Offline run: yield quota to interactive mapping requests
+    with priority(BULK):
+        ordered_transformed_dict = transform_records([source_dict])[0]
 
-# Save transformed dictionary to JSON
-output_path = "transformed_target_llm.json"
-with open(output_path, "w", encoding="utf-8") as f:
-    json.dump(ordered_transformed_dict, f, indent=4)
+    # Save transformed dictionary to JSON
+    output_path = "transformed_target_llm.json"
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(ordered_transformed_dict, f, indent=4)
 
-print(f"Transformed target dictionary saved to {output_path}")
-print(json.dumps(dict(ordered_transformed_dict), indent=4))
+    print(f"Transformed target dictionary saved to {output_path}")
+    print(json.dumps(dict(ordered_transformed_dict), indent=4))
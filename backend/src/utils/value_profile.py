@@ -0,0 +1,165 @@
+"""
+Value-profile matching signal computed from the example values of each field.
+
+Every value is reduced to a small feature vector (character-class mix, length,
+numeric / date parse success, magnitude) plus its character-class shape
+pattern, e.g. 'AAAA9999999' for a container number or 'AAAAA' for a
+UN/LOCODE. Similarities for the whole target x source grid are computed with
+NumPy broadcasting; no LLM calls are involved.
+
+Fields profiled from a data extract (column_profiler.py) also carry column
+statistics (COLUMN_STATS: null rate, distinct counts, numeric range), which are
+compared wherever both sides have them.
+"""
+import math
+import re
+from datetime import datetime
+from typing import Sequence, Tuple
+
+import numpy as np
+
+FEATURES = (
+    "alpha_frac", "digit_frac", "space_frac", "punct_frac", "upper_frac",
+    "length", "is_numeric", "is_date", "has_decimal", "magnitude",
+)
+
+DATE_FORMATS = (
+    "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%d/%m/%Y", "%m/%d/%Y",
+    "%d-%m-%Y", "%d/%m/%Y %H:%M:%S", "%d/%b/%Y %I:%M:%S %p", "%d-%b-%Y", "%d %b %Y",
+    "%Y%m%d", "%d%m%Y%H%M%S", "%Y%m%d%H%M%S",
+)
+_ORDINAL = re.compile(r"(\d+)(st|nd|rd|th)\b", re.IGNORECASE)
+
+# Column statistics of profiled data extracts, every entry scaled to [0, 1]
+# (NaN where unknown, e.g. for a key/value sheet with one example per field)
+COLUMN_STATS = ("null_rate", "uniqueness", "distinct", "min_magnitude", "max_magnitude")
+
+# Blend of the three signals in profile_similarity
+FEATURE_WEIGHT, SHAPE_WEIGHT, COARSE_SHAPE_WEIGHT = 0.5, 0.3, 0.2
+# Share of the column statistics in the score where both fields have them
+STATS_WEIGHT = 0.25
+
+
+def is_missing(value) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, float) and math.isnan(value):
+        return True
+    return str(value).strip() == "" or str(value).strip().lower() in {"nan", "none", "null"}
+
+
+def shape_pattern(value) -> str:
+    """Character-class shape: letters -> 'A', digits -> '9', other characters kept."""
+    shape = re.sub(r"[A-Za-z]", "A", str(value).strip())
+    return re.sub(r"[0-9]", "9", shape)
+
+
+def coarse_shape(shape: str) -> str:
+    """Shape with runs collapsed ('AAAA9999999' -> 'A9'), for variable-length values."""
+    return re.sub(r"(.)\1+", r"\1", shape)
+
+
+def parse_number(value):
+    if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool):
+        return float(value)
+    text = str(value).strip().replace(",", "")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def parses_as_date(value) -> bool:
+    text = _ORDINAL.sub(r"\1", str(value).strip())
+    if not re.search(r"\d", text):
+        return False
+    for fmt in DATE_FORMATS:
+        try:
+            datetime.strptime(text, fmt)
+            return True
+        except ValueError:
+            continue
+    return False
+
+
+def magnitude(number: float) -> float:
+    return min(math.log10(abs(number) + 1) / 12, 1.0)
+
+
+def value_features(value) -> np.ndarray:
+    """Feature vector (see FEATURES), every entry scaled to [0, 1]."""
+    text = str(value).strip()
+    n = max(len(text), 1)
+    number = parse_number(value)
+    is_date = parses_as_date(value)
+    return np.array([
+        sum(c.isalpha() for c in text) / n,
+        sum(c.isdigit() for c in text) / n,
+        sum(c.isspace() for c in text) / n,
+        sum(not c.isalnum() and not c.isspace() for c in text) / n,
+        sum(c.isupper() for c in text) / n,
+        min(math.log1p(len(text)) / math.log1p(64), 1.0),
+        float(number is not None and not is_date),
+        float(is_date),
+        float(number is not None and "." in text),
+        magnitude(number) if number is not None and not is_date else 0.0,
+    ], dtype=np.float32)
+
+
+def profile_values(values: Sequence) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Profile a list of example values. Returns (features (n, d), missing mask (n,),
+    shape codes (n,), coarse shape codes (n,), column stats (n, len(COLUMN_STATS)),
+    the stats all NaN: single values have none).
+    """
+    features = np.zeros((len(values), len(FEATURES)), dtype=np.float32)
+    missing = np.zeros(len(values), dtype=bool)
+    shapes, coarse = [], []
+    for i, value in enumerate(values):
+        if is_missing(value):
+            missing[i] = True
+            shapes.append("")
+            coarse.append("")
+            continue
+        features[i] = value_features(value)
+        shape = shape_pattern(value)
+        shapes.append(shape)
+        coarse.append(coarse_shape(shape))
+    stats = np.full((len(values), len(COLUMN_STATS)), np.nan, dtype=np.float32)
+    return features, missing, np.array(shapes, dtype=object), np.array(coarse, dtype=object), stats
+
+
+def profile_fields(fields) -> Tuple:
+    """
+    profile_values() of a field dict's example values, or the richer profile of
+    fields read from a data extract (column_profiler.ProfiledFields).
+    """
+    if hasattr(fields, "value_profile"):
+        return fields.value_profile()
+    return profile_values(list(fields.values()))
+
+
+def profile_similarity(target_profile, source_profile) -> np.ndarray:
+    """(T, S) similarity in [0, 1] between two profile_values() results."""
+    t_feat, t_missing, t_shape, t_coarse, t_stats = target_profile
+    s_feat, s_missing, s_shape, s_coarse, s_stats = source_profile
+    feature_sim = 1.0 - np.abs(t_feat[:, None, :] - s_feat[None, :, :]).mean(axis=-1)
+    same_shape = t_shape[:, None] == s_shape[None, :]
+    same_coarse = t_coarse[:, None] == s_coarse[None, :]
+    scores = FEATURE_WEIGHT * feature_sim + SHAPE_WEIGHT * same_shape + COARSE_SHAPE_WEIGHT * same_coarse
+    # Column statistics, over the ones known on both sides
+    diff = np.abs(t_stats[:, None, :] - s_stats[None, :, :])
+    known = ~np.isnan(diff)
+    count = known.sum(axis=-1)
+    stats_sim = 1.0 - np.where(known, diff, 0.0).sum(axis=-1) / np.maximum(count, 1)
+    scores = np.where(count > 0, (1 - STATS_WEIGHT) * scores + STATS_WEIGHT * stats_sim, scores)
+    # No signal when either side has no example value
+    scores[t_missing[:, None] | s_missing[None, :]] = 0.0
+    return scores.astype(np.float32)
+
+
+def field_profile_scores(source_fields, target_fields) -> np.ndarray:
+    """(T, S) value-profile similarity of two field dicts (see profile_fields)."""
+    if not source_fields or not target_fields:
+        return np.zeros((len(target_fields), len(source_fields)), dtype=np.float32)
+    return profile_similarity(profile_fields(target_fields), profile_fields(source_fields))
@@ -0,0 +1,147 @@
+"""
+Process-wide bounded work lanes for nested parallelism.
+
+All fan-out goes through one WorkScheduler instead of a fresh ThreadPoolExecutor
+per call, so the number of threads no longer multiplies with the number of
+requests, pairs and fields:
+
+    request   one task per source x target file pair
+    io        tasks that block on outbound LLM calls
+    cpu       local scoring / embedding work
+
+Lanes are ordered request -> io -> cpu. A task may fan out into a later lane;
+work submitted to its own or an earlier lane runs inline in the submitting
+thread, which keeps bounded pools from deadlocking on their own nested work.
+
+configure() sizes the native thread pools (torch intra-op, BLAS via
+threadpoolctl) from the CPU budget left over by the cpu lane, once per process
+before any work is submitted (gunicorn workers call it in post_fork).
+
+Future.cancel() only drops tasks that have not started. Running tasks stop
+cooperatively by checking deadline.expired(), and tasks that only reach a
+worker after their request's deadline (plus DEADLINE_GRACE) are not run at all.
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict
+
+from src.config import CPU_BUDGET, WORK_LANES, EMBED_BATCHING, DEADLINE_GRACE
+from src.utils.request_context import submit_in_context
+from src.utils.deadline import DeadlineExceeded, expired
+
+LANE_ORDER = ("request", "io", "cpu")
+
+# Lane of the task running in the current context (None outside the scheduler)
+current_lane = contextvars.ContextVar("current_lane", default=None)
+
+
+class WorkScheduler:
+    def __init__(self, lanes: Dict[str, int] = WORK_LANES):
+        self.sizes = dict(lanes)
+        self._lock = threading.Lock()
+        self._executors = {}
+        self._pid = None
+        self._configured = None   # (pid, native threads) once configure() has run
+        self.stats = {lane: {"submitted": 0, "inline": 0, "running": 0, "queued": 0} for lane in self.sizes}
+
+    def _executor(self, lane: str) -> ThreadPoolExecutor:
+        with self._lock:
+            # Worker threads do not survive a fork (gunicorn preload): start fresh pools in the child
+            if self._pid != os.getpid():
+                self._executors = {}
+                self._pid = os.getpid()
+            executor = self._executors.get(lane)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=self.sizes[lane], thread_name_prefix=f"work-{lane}")
+                self._executors[lane] = executor
+            return executor
+
+    def _runs_inline(self, lane: str) -> bool:
+        running = current_lane.get()
+        return running is not None and LANE_ORDER.index(lane) <= LANE_ORDER.index(running)
+
+    def _run(self, lane: str, fn: Callable, *args, **kwargs):
+        with self._lock:
+            self.stats[lane]["queued"] -= 1
+            self.stats[lane]["running"] += 1
+        token = current_lane.set(lane)
+        try:
+            if expired(DEADLINE_GRACE):
+                # Queued work nobody will wait for any more
+                raise DeadlineExceeded(f"{getattr(fn, '__name__', 'task')} reached the {lane} lane after the deadline")
+            return fn(*args, **kwargs)
+        finally:
+            current_lane.reset(token)
+            with self._lock:
+                self.stats[lane]["running"] -= 1
+
+    def submit(self, lane: str, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Run fn(*args, **kwargs) on `lane` in a copy of the caller's context
+        (see submit_in_context). Returns a Future; for inline work it is
+        already resolved when submit returns.
+        """
+        if lane not in self.sizes:
+            raise ValueError(f"Unknown work lane: {lane}")
+        if self._runs_inline(lane):
+            future = Future()
+            with self._lock:
+                self.stats[lane]["inline"] += 1
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as err:
+                future.set_exception(err)
+            return future
+
+        executor = self._executor(lane)
+        with self._lock:
+            self.stats[lane]["submitted"] += 1
+            self.stats[lane]["queued"] += 1
+        future = submit_in_context(executor, self._run, lane, fn, *args, **kwargs)
+
+        def _dequeue_cancelled(f):
+            if f.cancelled():
+                with self._lock:
+                    self.stats[lane]["queued"] -= 1
+        future.add_done_callback(_dequeue_cancelled)
+        return future
+
+    def configure(self, cpu_budget: int = CPU_BUDGET) -> int:
+        """
+        Fit the cpu lane and the native thread pools into `cpu_budget` cores and
+        return the number of native threads. With embedding batching all encoding
+        runs on one dispatcher thread, so torch gets the cores the cpu lane leaves
+        free; otherwise every cpu worker encodes and the budget is split between them.
+        Runs once per process: later calls return the first result, and calling it
+        after work has been submitted raises RuntimeError (the pools are sized).
+        """
+        with self._lock:
+            if self._configured is not None and self._configured[0] == os.getpid():
+                return self._configured[1]
+            if self._pid == os.getpid() and self._executors:
+                raise RuntimeError("WorkScheduler.configure() must run before any work is submitted")
+            self.sizes["cpu"] = max(1, min(self.sizes["cpu"], cpu_budget))
+            if EMBED_BATCHING:
+                native_threads = max(1, cpu_budget - self.sizes["cpu"])
+            else:
+                native_threads = max(1, cpu_budget // self.sizes["cpu"])
+            try:
+                import torch
+                torch.set_num_threads(native_threads)
+            except Exception:
+                pass
+            try:
+                from threadpoolctl import threadpool_limits
+                threadpool_limits(limits=native_threads)
+            except Exception:
+                pass
+            self._configured = (os.getpid(), native_threads)
+        return native_threads
+
+
+# Shared by all request handling in this process
+pools = WorkScheduler()
@@ -0,0 +1,61 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import tempfile
+
+# The app reads its data paths at import: point them at a scratch directory
+DATA = tempfile.mkdtemp(prefix="matri-test-")
+os.environ["MATRI_MAPPINGS_FILE"] = os.path.join(DATA, "mappings.json")
+os.environ["MATRI_LEXICON_CACHE"] = os.path.join(DATA, "lexicon.json")
+os.environ["MATRI_CATALOG_DIR"] = os.path.join(DATA, "catalog")
+os.environ.setdefault("grok2", "test")
+os.environ.setdefault("token", "test")
+
+import pytest
+
+import app as server
+
+
+def mapping(mapping_id, timestamp):
+    return {"id": mapping_id, "timestamp": timestamp, "sourceSystem": "SAP",
+            "approvedMappings": [{"sourceKey": "ADP-M-CODACO::DateOfMovement", "targetKey": "T::MoveDate"}]}
+
+
+@pytest.fixture
+def client():
+    with open(os.environ["MATRI_MAPPINGS_FILE"], "w") as f:
+        f.write("[]")
+    return server.app.test_client()
+
+
+def test_full_list_revalidates_until_written(client):
+    first = client.get("/api/mappings")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and etag.startswith('W/"')
+    again = client.get("/api/mappings", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.headers["ETag"] == etag and not again.data
+
+    assert client.post("/api/mappings", json=mapping("m1", 1)).status_code == 201
+    changed = client.get("/api/mappings", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+    assert [m["id"] for m in changed.get_json()] == ["m1"]
+
+
+def test_single_mapping_and_pages(client):
+    client.post("/api/mappings", json=mapping("m1", 1))
+    client.post("/api/mappings", json=mapping("m2", 2))
+    for url in ("/api/mappings/m1", "/api/mappings?limit=1", "/api/mappings?sourceSystem=sap"):
+        response = client.get(url)
+        assert response.status_code == 200
+        assert client.get(url, headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+        assert client.get(url, headers={"If-None-Match": 'W/"other"'}).status_code == 200
+
+    page = client.get("/api/mappings?limit=1")
+    client.put("/api/mappings/m2", json=dict(mapping("m2", 2), sourceSystem="Oracle"))
+    assert client.get("/api/mappings?limit=1", headers={"If-None-Match": page.headers["ETag"]}).status_code == 200
+
+
+def test_not_modified_is_not_compressed(client):
+    response = client.get("/api/mappings", headers={"Accept-Encoding": "gzip"})
+    again = client.get("/api/mappings", headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]})
+    assert again.status_code == 304 and "Content-Encoding" not in again.headers
@@ -0,0 +1,71 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("grok2", "test")
+
+import numpy as np
+import pytest
+
+from src import main
+from src.config import PREVIEW_WEIGHTS
+from src.utils.score_tensor import ScoreTensor
+
+TARGETS = ["ContainerNumber", "PortOfLoading", "VesselName", "GrossWeight"]
+SOURCES = ["cntrNo", "polCode", "vslName", "grossWt", "sealNo", "voyageNo",
+           "lineCode", "isoCode", "moveDate", "terminalId", "bookingRef", "tareWt"]
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    # Scores on a 0.1 grid, so several pairs tie on their final score
+    rng = np.random.default_rng(7)
+    llm = np.round(rng.random((len(TARGETS), len(SOURCES))), 1)
+    monkeypatch.setattr(main, "generate_description_format", lambda keys: ({k: k for k in keys}, {}))
+    monkeypatch.setattr(main, "synonym_coverage_score", lambda t_tokens, s_tokens, groq: 0.0)
+    monkeypatch.setattr(main, "llm_descriptions_similarity",
+                        lambda tgt, src, descriptions, emb: float(llm[TARGETS.index(tgt), SOURCES.index(src)]))
+    return llm
+
+
+def preview_tensor():
+    rng = np.random.default_rng(3)
+    scores = np.zeros((len(TARGETS), len(SOURCES), len(main.SCORE_COMPONENTS)), dtype=np.float32)
+    local = np.round(rng.random((len(TARGETS), len(SOURCES))), 1)
+    for name in main.LOCAL_COMPONENTS:
+        scores[:, :, main.SCORE_COMPONENTS.index(name)] = local
+    # Target 0: sources 1 and 2 are identical, so they tie wherever they rank
+    scores[0, 2] = scores[0, 1]
+    return ScoreTensor(TARGETS, SOURCES, scores, weights=PREVIEW_WEIGHTS, tier="preview")
+
+
+def refine(top_k):
+    tensor, err = main.refine_score_tensor(preview_tensor(), {k: "" for k in SOURCES}, {k: "" for k in TARGETS},
+                                           top_k=top_k)
+    assert err is None
+    return tensor
+
+
+@pytest.mark.parametrize("k", [1, 2, 3, 5])
+def test_cascade_top_k_matches_exhaustive(stub_llm, k):
+    stub_llm[0, 2] = stub_llm[0, 1]
+    exhaustive, cascade = refine(None), refine(k)
+    full, pruned = exhaustive.final_scores(), cascade.final_scores()
+    for ti in range(len(TARGETS)):
+        kth = np.sort(full[ti])[::-1][k - 1]
+        # Same k best scores, and the same sources strictly above the k-th place
+        assert np.array_equal(np.sort(pruned[ti])[::-1][:k], np.sort(full[ti])[::-1][:k])
+        assert set(np.flatnonzero(pruned[ti] > kth)) == set(np.flatnonzero(full[ti] > kth))
+        # Everything tied with the k-th place was evaluated exactly
+        assert cascade.evaluated[ti, full[ti] == kth].all()
+    assert exhaustive.evaluated.all()
+    assert cascade.tier == "full"
+
+
+def test_cascade_prunes_pairs(stub_llm):
+    assert refine(1).evaluated.sum() < len(TARGETS) * len(SOURCES)
+
+
+def test_fixture_has_ties_at_kth_place(stub_llm):
+    stub_llm[0, 2] = stub_llm[0, 1]
+    full = refine(None).final_scores()
+    ranked = np.sort(full, axis=1)[:, ::-1]
+    assert any(ranked[ti, k - 1] == ranked[ti, k] for ti in range(len(TARGETS)) for k in (1, 2, 3, 5))
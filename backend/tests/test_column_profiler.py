@@ -0,0 +1,77 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.column_profiler import HyperLogLog, Reservoir, profile_csv, profile_to_fields
+
+
+def hashes(values):
+    return pd.util.hash_pandas_object(pd.Series(values, dtype=str), index=False).to_numpy()
+
+
+@pytest.mark.parametrize("n", [10, 1000, 50000])
+def test_hyperloglog_estimate_within_error(n):
+    hll = HyperLogLog(12)
+    values = [f"CONT{i:07d}" for i in range(n)]
+    hll.add_hashes(hashes(values))
+    hll.add_hashes(hashes(values[: n // 2]))  # duplicates do not count
+    # Standard error is 1.04 / sqrt(4096) ~ 1.6%; allow four of them
+    assert abs(hll.estimate() - n) <= max(1, 0.065 * n)
+
+
+def test_hyperloglog_merge_is_union():
+    a, b, both = HyperLogLog(12), HyperLogLog(12), HyperLogLog(12)
+    a.add_hashes(hashes(range(0, 6000)))
+    b.add_hashes(hashes(range(4000, 10000)))
+    both.add_hashes(hashes(range(0, 10000)))
+    a.merge(b)
+    assert a.estimate() == both.estimate()
+
+
+def test_hyperloglog_precision_bounds():
+    with pytest.raises(ValueError):
+        HyperLogLog(17)
+
+
+def test_reservoir_keeps_everything_until_full():
+    reservoir = Reservoir(size=5)
+    reservoir.add_many(range(3))
+    assert reservoir.items == [0, 1, 2]
+    reservoir.add_many(range(3, 5))
+    assert reservoir.items == [0, 1, 2, 3, 4]
+
+
+def test_reservoir_sample_is_bounded_and_uniform():
+    counts = np.zeros(100)
+    for seed in range(400):
+        reservoir = Reservoir(size=10, seed=seed)
+        for lo in range(0, 100, 7):  # chunks of uneven size
+            reservoir.add_many(range(lo, min(lo + 7, 100)))
+        assert len(reservoir.items) == 10 and len(set(reservoir.items)) == 10
+        assert reservoir.seen == 100
+        counts[reservoir.items] += 1
+    # Every item is kept with probability 10 / 100, i.e. ~40 times in 400 runs
+    assert counts.min() > 15 and counts.max() < 70
+    assert abs(counts[:50].sum() - counts[50:].sum()) < 0.1 * counts.sum()
+
+
+def test_profile_csv_in_chunks():
+    rows = ["containerNumber,grossWeight,remarks"]
+    rows += [f"CONT{i:07d},{1000 + i},{'' if i % 4 else 'n/a'}" for i in range(2000)]
+    profiles = profile_csv(io.BytesIO("\n".join(rows).encode("utf-8")), chunk_rows=300)
+    container, weight, remarks = profiles["containerNumber"], profiles["grossWeight"], profiles["remarks"]
+    assert container.rows == 2000 and container.null_rate == 0.0
+    assert abs(container.distinct.estimate() - 2000) <= 0.065 * 2000
+    assert len(container.samples.items) <= 20
+    assert (weight.min_number, weight.max_number) == (1000.0, 2999.0)
+    assert remarks.null_rate == 1.0
+
+    fields = profile_to_fields(profiles)
+    assert fields["containerNumber"].startswith("CONT")
+    assert fields["remarks"] is None
+    assert fields.profiles is profiles
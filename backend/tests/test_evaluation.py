@@ -0,0 +1,37 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+
+from src.utils.evaluation import truth_ranks, evaluate_weights
+
+
+def make_problem():
+    # 2 targets x 3 sources x 2 components; component 1 has no signal at all
+    tensor = np.zeros((2, 3, 2), dtype=np.float32)
+    tensor[0, :, 0] = [0.9, 0.2, 0.1]
+    tensor[1, :, 0] = [0.3, 0.8, 0.1]
+    mask = np.array([[True, False, False], [False, True, False]])
+    return tensor, mask
+
+
+def test_all_ties_rank_last():
+    tensor, mask = make_problem()
+    ranks = truth_ranks(tensor, mask, np.array([[0.0, 1.0]], dtype=np.float32))
+    assert ranks.tolist() == [[2, 2]]
+    result = evaluate_weights([(tensor, mask, {})], np.array([[0.0, 1.0]]), k=2)
+    assert result["top1"][0] == 0.0
+    assert result["topk"][0] == 0.0
+
+
+def test_correct_source_ranked_first():
+    tensor, mask = make_problem()
+    result = evaluate_weights([(tensor, mask, {})], np.array([[1.0, 0.0]]), k=1)
+    assert result["top1"][0] == 1.0
+
+
+def test_tie_with_one_wrong_source():
+    tensor, mask = make_problem()
+    tensor[0, 1, 0] = 0.9
+    ranks = truth_ranks(tensor, mask, np.array([[1.0, 0.0]], dtype=np.float32))
+    assert ranks.tolist() == [[1, 0]]
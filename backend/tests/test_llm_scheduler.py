@@ -0,0 +1,41 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+from src.utils.llm_scheduler import LLMScheduler, SchedulerBusy, INTERACTIVE, BULK
+
+
+def make_scheduler(max_wait=1.0):
+    return LLMScheduler(limits={"groq": {"rpm": 30, "tpm": 6000}}, bulk_reserve=0.2, max_wait=max_wait)
+
+
+def test_bulk_call_larger_than_unreserved_share_is_granted_from_full_bucket():
+    scheduler = make_scheduler()
+    scheduler.acquire("groq", 5000, priority=BULK, flow="batch")
+    assert scheduler.stats["groq"]["granted"] == 1
+
+
+def test_bulk_call_keeps_interactive_reserve():
+    scheduler = make_scheduler(max_wait=0.2)
+    scheduler.acquire("groq", 4000, priority=BULK, flow="batch")
+    # 2000 tokens left, 1200 of them reserved for interactive traffic
+    with pytest.raises(SchedulerBusy):
+        scheduler.acquire("groq", 1000, priority=BULK, flow="batch")
+    scheduler.acquire("groq", 1000, priority=INTERACTIVE, flow="user")
+
+
+def test_call_budget_fits_bucket():
+    scheduler = make_scheduler()
+    assert scheduler.call_budget("groq", BULK) == 4800
+    assert scheduler.call_budget("groq", INTERACTIVE) == 6000
+
+
+def test_share_splits_quota_between_processes():
+    scheduler = make_scheduler()
+    scheduler.share(4)
+    assert scheduler.call_budget("groq", INTERACTIVE) == 1500
+    scheduler.acquire("groq", 1500, priority=INTERACTIVE, flow="user")
+    scheduler.max_wait = 0.2
+    with pytest.raises(SchedulerBusy):
+        scheduler.acquire("groq", 100, priority=INTERACTIVE, flow="user")
@@ -0,0 +1,99 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+from src.utils.mapping_index import MappingIndex
+
+
+def make_mapping(i, system="SAP", source_key="ADP-M-CODACO::DateOfMovement"):
+    return {"id": f"m{i}", "timestamp": 1000 + i // 2, "sourceSystem": system,
+            "approvedMappings": [{"sourceKey": source_key, "targetKey": "T::MoveDate"}]}
+
+
+class Library:
+    """mappings.json stand-in: a list plus a version number as its stat fingerprint."""
+
+    def __init__(self, mappings):
+        self.mappings = list(mappings)
+        self.version = 0
+
+    def write(self, mappings):
+        before = self.stat()
+        self.mappings = list(mappings)
+        self.version += 1
+        return before
+
+    def load(self):
+        return list(self.mappings)
+
+    def stat(self):
+        return (self.version, len(self.mappings))
+
+
+def page_through(index, limit, **kwargs):
+    ids, cursor = [], None
+    while True:
+        page = index.query(cursor=cursor, limit=limit, **kwargs)
+        ids.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids, page["total"]
+
+
+def test_pages_cover_every_mapping_newest_first():
+    library = Library(make_mapping(i) for i in range(11))
+    index = MappingIndex(library.load, library.stat)
+    ids, total = page_through(index, limit=3)
+    assert total == 11
+    assert len(ids) == len(set(ids)) == 11
+    # timestamp desc, then id desc within equal timestamps
+    expected = sorted(library.mappings, key=lambda m: (m["timestamp"], m["id"]), reverse=True)
+    assert ids == [m["id"] for m in expected]
+
+
+def test_items_leave_out_approved_mappings():
+    library = Library([make_mapping(0)])
+    item = MappingIndex(library.load, library.stat).query(limit=1)["items"][0]
+    assert "approvedMappings" not in item
+    assert item["mappingCount"] == 1
+
+
+def test_cursor_is_stable_when_newer_mappings_arrive():
+    library = Library(make_mapping(i) for i in range(6))
+    index = MappingIndex(library.load, library.stat)
+    first = index.query(limit=2)
+    newer = dict(make_mapping(99), timestamp=5000)
+    index.upsert(newer, library.write(library.mappings + [newer]))
+    assert page_through(index, limit=2)[0][0] == "m99"
+    second = index.query(cursor=first["next_cursor"], limit=2)
+    assert [item["id"] for item in second["items"]] == ["m3", "m2"]
+
+
+def test_filters_and_key_search():
+    library = Library([make_mapping(0, "SAP"), make_mapping(1, "sap"),
+                       make_mapping(2, "Oracle", "X::GrossWeight")])
+    index = MappingIndex(library.load, library.stat)
+    assert page_through(index, limit=1, filters={"sourceSystem": "SAP"}) == (["m1", "m0"], 2)
+    assert index.query(key="gross weight")["total"] == 1
+    assert index.query(key="dateOfMovement")["total"] == 2
+    assert index.query(key="ADP-M-CODACO::DateOfMovement", filters={"sourceSystem": "oracle"})["total"] == 0
+    assert index.query(since=1001, until=1001)["total"] == 1
+
+
+def test_invalid_cursor():
+    library = Library([make_mapping(0)])
+    with pytest.raises(ValueError):
+        MappingIndex(library.load, library.stat).query(cursor="not-a-cursor")
+
+
+def test_remove_and_rebuild_after_foreign_write():
+    library = Library(make_mapping(i) for i in range(3))
+    index = MappingIndex(library.load, library.stat)
+    index.remove("m1", library.write([m for m in library.mappings if m["id"] != "m1"]))
+    assert index.get("m1") is None
+    assert index.query()["total"] == 2
+    # Written by another process: the index notices the new fingerprint and rebuilds
+    library.write(library.mappings + [make_mapping(7)])
+    assert index.get("m7") is not None
+    assert index.query()["total"] == 3